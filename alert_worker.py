@@ -0,0 +1,125 @@
+# Price alert worker (ALERT_MODE=worker or stream).
+#
+# Run several of these: the alert symbols are split into ALERT_SHARDS shards
+# and every worker evaluates the ones it owns, with its own price fetching
+# and notification sending (see bot/scripts/alert_shards.py). Ownership is
+# rebalanced through Postgres advisory locks when workers start or die.
+# - ALERT_MODE=worker: checks every alert symbol every PRICE_ALERT_INTERVAL
+#   seconds, or with ALERT_CADENCE the due symbols every ALERT_MIN_INTERVAL
+#   seconds (adaptive per-symbol cadence, see bot/scripts/alert_cadence.py)
+# - ALERT_MODE=stream: checks on every trade of the exchange WebSocket
+#   (see bot/scripts/alert_stream.py)
+# Replaying a recorded price file instead of the exchange (one process, no shards):
+#   python alert_worker.py --replay prices.csv [--speed 10]
+# Triggered alerts are deleted with DELETE ... RETURNING before they are sent,
+# so even two workers evaluating the same shard never notify an alert twice.
+
+import argparse
+import asyncio
+import logging
+import signal
+import threading
+
+import ccxt.pro
+from telegram.utils.request import Request
+
+from config.settings import (
+    TELEGRAM_API_TOKEN,
+    ALERT_MODE,
+    ALERT_SHARDS,
+    ALERT_OUTBOUND_RATE,
+    ALERT_CADENCE,
+    ALERT_MIN_INTERVAL,
+    ALERT_MAX_INTERVAL,
+    PRICE_ALERT_INTERVAL,
+    ALERT_NOTIFY,
+    ALERT_RESYNC_INTERVAL,
+    ALERT_STREAM_SYNC_INTERVAL,
+    OUTBOUND_PRIVATE_RATE,
+    OUTBOUND_GROUP_RATE,
+    OUTBOUND_SENDERS,
+)
+from bot.leader import AdvisoryLeader
+from bot.scheduler import JobScheduler
+from bot.scripts.alert_cadence import AlertCadence
+from bot.scripts.alert_changes import AlertListener
+from bot.scripts.alert_engine import AlertEngine
+from bot.scripts.alert_shards import ShardCoordinator
+from bot.scripts.alert_stream import AlertStreamer, ExchangeTradeFeed, ReplayFeed
+from bot.send_scheduler import OutboundScheduler, ScheduledBot
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+def run_stream(engine, bot, replay: str = None, speed: float = None) -> None:
+    async def run():
+        if replay:
+            feed = ReplayFeed(replay, speed=speed)
+        else:
+            feed = ExchangeTradeFeed(ccxt.pro.bybit({"enableRateLimit": True}))
+        streamer = AlertStreamer(engine, feed, bot, sync_interval=ALERT_STREAM_SYNC_INTERVAL)
+        sent = await streamer.run()
+        logger.info(f"Price alert stream ended, {sent} alerts sent")
+
+    asyncio.run(run())
+
+
+def run_checks(engine, bot) -> None:
+    # the job scheduler keeps checks from overlapping and logs their durations
+    jobs = JobScheduler(workers=1)
+    # without the cadence every symbol is due on every check
+    interval = ALERT_MIN_INTERVAL if ALERT_CADENCE else PRICE_ALERT_INTERVAL
+    jobs.add_interval_job(lambda: engine.check(bot), interval, job_id="check_price_alerts")
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    jobs.start()
+    try:
+        stop.wait()
+    finally:
+        jobs.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check price alerts")
+    parser.add_argument("--replay", help="replay prices from this file instead of the exchange")
+    parser.add_argument("--speed", type=float, help="replay speed (default: as fast as possible)")
+    args = parser.parse_args()
+
+    # every worker sends its own notifications, within its share of the bot's global limit
+    scheduler = OutboundScheduler(
+        global_rate=ALERT_OUTBOUND_RATE,
+        private_rate=OUTBOUND_PRIVATE_RATE,
+        group_rate=OUTBOUND_GROUP_RATE,
+        senders=OUTBOUND_SENDERS,
+    )
+    request = Request(con_pool_size=OUTBOUND_SENDERS + 4, connect_timeout=30, read_timeout=60)
+    bot = ScheduledBot(token=TELEGRAM_API_TOKEN, scheduler=scheduler, request=request)
+
+    leader = None if args.replay else AdvisoryLeader()
+    engine = AlertEngine(
+        resync_interval=ALERT_RESYNC_INTERVAL,
+        listener=AlertListener() if ALERT_NOTIFY else None,
+        cadence=AlertCadence(ALERT_MIN_INTERVAL, ALERT_MAX_INTERVAL) if ALERT_CADENCE else None,
+        shards=ShardCoordinator(leader, ALERT_SHARDS) if leader is not None else None,
+    )
+
+    try:
+        if ALERT_MODE == 'stream' or args.replay:
+            run_stream(engine, bot, args.replay, args.speed)
+        else:
+            run_checks(engine, bot)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if leader is not None:
+            # hand the shards over to the other workers right away
+            leader.release_all()
+        # let queued notifications go out
+        scheduler.shutdown()
+
+
+if __name__ == '__main__':
+    main()
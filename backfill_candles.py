@@ -0,0 +1,97 @@
+# Backfill the candle store (see bot/candles.py).
+#
+#   python backfill_candles.py --symbols BTC/USDT ETH/USDT --timeframes 1h 4h 1d --days 365
+#   python backfill_candles.py --exchanges bybit binance --quote USDT --timeframes 4h --days 90
+#
+# Series are filled in parallel: every exchange gets its own pool of
+# --workers threads sharing one client (bot/exchanges.py), so exchanges are
+# fetched side by side. The client's throttle hands its threads request slots
+# rateLimit apart, so more workers overlap the requests' latency but never
+# send faster than the exchange's rate limit. Rate limit and network errors
+# are retried with exponential backoff.
+# Series already stored are only extended (older history and new closes).
+
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import ccxt
+
+from bot.candles import get_candle_store
+from bot.exchanges import get_exchange
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+RETRIES = 5
+
+
+def backfill_series(store, exchange: str, symbol: str, timeframe: str, since: int) -> int:
+    """Backfill one series from ``since``. Returns the number of stored candles."""
+    for attempt in range(RETRIES):
+        try:
+            store.update(exchange, symbol, timeframe, since=since)
+            return len(store.read(exchange, symbol, timeframe))
+        except (ccxt.RateLimitExceeded, ccxt.DDoSProtection, ccxt.NetworkError) as e:
+            delay = 2 ** attempt
+            logger.warning(f"{exchange} {symbol} {timeframe}: {e!r}, retrying in {delay}s")
+            time.sleep(delay)
+    raise RuntimeError(f"Gave up on {exchange} {symbol} {timeframe} after {RETRIES} attempts")
+
+
+def series_of(exchange: str, symbols, quote: str) -> list:
+    """Return the unified symbols to backfill on an exchange."""
+    client = get_exchange(exchange)
+    if symbols:
+        unified = []
+        for symbol in symbols:
+            try:
+                unified.append(client.market(symbol)["symbol"])
+            except ccxt.BadSymbol:
+                logger.warning(f"{exchange} does not list {symbol}")
+        return unified
+    return sorted(market["symbol"] for market in client.markets.values()
+                  if market.get("spot") and market.get("active") is not False and market.get("quote") == quote)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill the candle store")
+    parser.add_argument("--exchanges", nargs="+", default=["bybit"], help="ccxt exchange ids (default: bybit)")
+    parser.add_argument("--symbols", nargs="+", help="symbols to backfill (default: every spot market of --quote)")
+    parser.add_argument("--quote", default="USDT", help="quote asset when no symbols are given (default: USDT)")
+    parser.add_argument("--timeframes", nargs="+", default=["1h", "4h", "1d"], help="timeframes (default: 1h 4h 1d)")
+    parser.add_argument("--days", type=float, default=90, help="days of history (default: 90)")
+    parser.add_argument("--workers", type=int, default=2, help="parallel requests per exchange (default: 2)")
+    args = parser.parse_args()
+
+    store = get_candle_store()
+    since = int((time.time() - args.days * 86400) * 1000)
+    pools = {exchange: ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix=f"backfill-{exchange}")
+             for exchange in args.exchanges}
+    futures = {}
+    for exchange, pool in pools.items():
+        for symbol in series_of(exchange, args.symbols, args.quote):
+            for timeframe in args.timeframes:
+                future = pool.submit(backfill_series, store, exchange, symbol, timeframe, since)
+                futures[future] = (exchange, symbol, timeframe)
+    logger.info(f"Backfilling {len(futures)} series from {args.days:g} days ago")
+
+    failed = 0
+    for done, future in enumerate(as_completed(futures), 1):
+        exchange, symbol, timeframe = futures[future]
+        try:
+            count = future.result()
+            logger.info(f"[{done}/{len(futures)}] {exchange} {symbol} {timeframe}: {count} candles stored")
+        except Exception:
+            failed += 1
+            logger.exception(f"[{done}/{len(futures)}] {exchange} {symbol} {timeframe} failed")
+    for pool in pools.values():
+        pool.shutdown()
+    logger.info(f"Backfill done, {len(futures) - failed} series stored, {failed} failed")
+
+
+if __name__ == '__main__':
+    main()
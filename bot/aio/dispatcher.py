@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncContext:
+    """Per-update context handed to native async handlers."""
+
+    def __init__(self, bot, update_dict: dict, args):
+        self.bot = bot
+        self.update = update_dict
+        self.args = args
+        self.message = update_dict.get("message") or {}
+
+    @property
+    def chat_id(self):
+        return self.message["chat"]["id"]
+
+    @property
+    def user_id(self):
+        return self.message["from"]["id"]
+
+    async def reply_text(self, text, quote=False, **kwargs):
+        reply_to = self.message.get("message_id") if quote else None
+        return await self.bot.send_message(
+            self.chat_id, text, reply_to_message_id=reply_to, **kwargs
+        )
+
+
+class ChatLocks:
+    """Per-chat asyncio locks that are dropped once nobody waits on them."""
+
+    def __init__(self):
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, key):
+        if key is None:
+            yield
+            return
+
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+
+class AsyncDispatcher:
+    """
+    Routes updates to native async command handlers and adapts everything
+    else to the legacy sync Dispatcher through a thread pool executor.
+
+    :param bot: The AsyncBot used by native handlers
+    :param fallback: Sync callable ``(update_dict)`` that processes an update
+                     with the legacy handlers and raises when it failed
+    :param executor: Executor the fallback and other blocking calls run on
+    """
+
+    def __init__(self, bot, fallback, executor):
+        self.bot = bot
+        self.fallback = fallback
+        self.executor = executor
+        self._commands = {}
+
+    def add_command(self, command: str, callback) -> None:
+        self._commands[command] = callback
+
+    @staticmethod
+    def parse_command(update_dict: dict):
+        """Return ``(command, args)`` for command messages, ``(None, None)`` otherwise."""
+        message = update_dict.get("message") or {}
+        text = message.get("text") or ""
+        if not text.startswith("/"):
+            return None, None
+
+        parts = text.split()
+        command = parts[0][1:].split("@")[0].lower()
+        return command, parts[1:]
+
+    async def run_blocking(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def process_update(self, update_dict: dict) -> None:
+        """Process one update. Errors of the handlers are raised to the caller."""
+        command, args = self.parse_command(update_dict)
+        callback = self._commands.get(command)
+        if callback is None:
+            await self.run_blocking(self.fallback, update_dict)
+            return
+
+        await callback(self, AsyncContext(self.bot, update_dict, args))
@@ -0,0 +1,175 @@
+# Native asyncio versions of the I/O heavy commands.
+# They reuse the formatting of the sync handlers and only replace the blocking
+# calls: HTTP goes through the shared httpx client, Telegram through the
+# AsyncBot. Database access, symbol resolution (the market catalog) and chart
+# rendering (the candle store) stay synchronous and run on the dispatcher's
+# executor.
+
+import asyncio
+import logging
+import os
+from decimal import Decimal, InvalidOperation
+
+import httpx
+
+from bot.aio import http
+from bot.database import PriceAlertRequest, Session
+from bot.scripts.alert_changes import notify_added
+from bot.handlers.free.global_top import GlobalTopHandler
+from bot.handlers.free.news import NewsHandler
+from bot.symbols import UnknownSymbol, resolve_symbol
+from bot.utils import PlotChart, record_command_usage
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncGlobalTopHandler:
+    @staticmethod
+    async def global_top(dispatcher, context):
+        await dispatcher.run_blocking(record_command_usage, context.user_id, "global_top")
+
+        metric = "social_volume"
+        if context.args and context.args[0] in GlobalTopHandler.VALID_METRICS:
+            metric = context.args[0]
+        elif context.args:
+            await context.reply_text(f"Invalid metric. Using default metric: {metric}")
+
+        params = {"interval": "1w", "order_by": metric, "limit": 10}
+        try:
+            data = await http.lunarcrush("coins/global/top", params=params)
+            top_coins = data["top"]
+        except (httpx.HTTPError, KeyError) as e:
+            logger.error(f"Error fetching top coins data: {e}")
+            top_coins = None
+
+        await context.reply_text(
+            GlobalTopHandler.format_response_message(top_coins, metric)
+        )
+
+
+class AsyncNewsHandler:
+    @staticmethod
+    async def news(dispatcher, context):
+        await dispatcher.run_blocking(record_command_usage, context.user_id, "news")
+
+        source, keyword, limit = NewsHandler.parse_news_args(context.args)
+        path = f"news/{source}/{limit}" if source else f"news/top/{limit}"
+        try:
+            news_data = await http.rapidapi("crypto-news16.p.rapidapi.com", path)
+            news_list = NewsHandler.format_news(news_data, keyword)
+        except httpx.HTTPError as e:
+            logger.error(f"Error fetching crypto news: {e}")
+            news_list = []
+
+        if not news_list:
+            await context.bot.send_message(context.chat_id, "Failed to fetch crypto news.")
+            return
+
+        for news in news_list:
+            await context.reply_text(
+                news, parse_mode="Markdown", disable_web_page_preview=True
+            )
+
+
+class AsyncMoversHandler:
+    """Async /gainers and /losers: one CoinGecko call, charts rendered concurrently."""
+
+    @staticmethod
+    def render_chart(symbol):
+        chart_file = PlotChart.plot_ohlcv_chart(symbol, "4h")
+        if chart_file is None:
+            return None
+        with open(chart_file, "rb") as f:
+            photo = f.read()
+        os.remove(chart_file)
+        return photo
+
+    @staticmethod
+    async def movers(dispatcher, context, command_name, reverse):
+        await dispatcher.run_blocking(record_command_usage, context.user_id, command_name)
+
+        coins = await http.coingecko("coins/markets", params={"vs_currency": "usd"})
+        movers = sorted(
+            coins, key=lambda x: x["price_change_percentage_24h"], reverse=reverse
+        )[:5]
+
+        # Render all charts at once on the executor, send them in order
+        charts = [
+            asyncio.ensure_future(
+                dispatcher.run_blocking(
+                    AsyncMoversHandler.render_chart, coin["symbol"].upper() + "USDT"
+                )
+            )
+            for coin in movers
+        ]
+
+        for coin, chart in zip(movers, charts):
+            await context.reply_text(
+                f"{coin['name']}: {coin['price_change_percentage_24h']}%"
+            )
+            try:
+                photo = await chart
+            except Exception:
+                logger.exception(f"Error while plotting the chart for {coin['name']}")
+                photo = None
+
+            if photo is None:
+                await context.reply_text("Symbol not listed on available exchanges.")
+                continue
+            await context.bot.send_photo(context.chat_id, photo)
+
+    @staticmethod
+    async def gainers(dispatcher, context):
+        await AsyncMoversHandler.movers(dispatcher, context, "gainers", reverse=True)
+
+    @staticmethod
+    async def losers(dispatcher, context):
+        await AsyncMoversHandler.movers(dispatcher, context, "losers", reverse=False)
+
+
+class AsyncPriceAlertHandler:
+    @staticmethod
+    def save_alert(user_id, symbol, price_level):
+        session = Session()
+        alert = PriceAlertRequest(user_id=user_id, symbol=symbol, price_level=price_level)
+        session.add(alert)
+        session.flush()
+        notify_added(session, alert)
+        session.commit()
+        session.close()
+
+    @staticmethod
+    async def request_price_alert(dispatcher, context):
+        try:
+            symbol, price_level = context.args
+            price_level = Decimal(price_level)
+        except (ValueError, InvalidOperation):
+            await context.reply_text("Invalid input. Please enter a symbol and a price level.")
+            return
+
+        if price_level <= 0:
+            await context.reply_text("Invalid price level. Please enter a positive number.")
+            return
+
+        # The alerts are checked on bybit; the catalog may load on first use, so it runs off the loop
+        try:
+            symbol = await dispatcher.run_blocking(resolve_symbol, symbol, "bybit")
+        except UnknownSymbol as e:
+            await context.reply_text(str(e))
+            return
+
+        await dispatcher.run_blocking(
+            AsyncPriceAlertHandler.save_alert, context.user_id, symbol, price_level
+        )
+        await context.reply_text(
+            f"Your request for a price alert has been successfully set up! You will receive a notification when the price of {symbol} reaches {price_level}."
+        )
+
+
+def register_async_handlers(dispatcher):
+    dispatcher.add_command("global_top", AsyncGlobalTopHandler.global_top)
+    dispatcher.add_command("news", AsyncNewsHandler.news)
+    dispatcher.add_command("gainers", AsyncMoversHandler.gainers)
+    dispatcher.add_command("losers", AsyncMoversHandler.losers)
+    dispatcher.add_command("set_alert", AsyncPriceAlertHandler.request_price_alert)
+    return dispatcher
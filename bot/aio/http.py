@@ -0,0 +1,62 @@
+import logging
+
+import httpx
+
+from config.settings import LUNARCRUSH_API_KEY, X_RAPIDAPI_KEY
+
+logger = logging.getLogger(__name__)
+
+LUNARCRUSH_BASE_URL = "https://lunarcrush.com/api3"
+COINGECKO_BASE_URL = "https://api.coingecko.com/api/v3"
+
+# One keep-alive client shared by every coroutine of the process
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=20,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _client
+
+
+async def get_json(url, headers=None, params=None):
+    """
+    GET a JSON document without blocking the event loop.
+
+    :param url: URL for the API request
+    :param headers: Headers for the API request
+    :param params: Query string parameters
+    :return: The decoded JSON response
+    :raises httpx.HTTPError: On connection errors and non-2xx responses
+    """
+    response = await get_client().get(url, headers=headers, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+async def lunarcrush(path, params=None):
+    headers = {"Authorization": f"Bearer {LUNARCRUSH_API_KEY}"}
+    return await get_json(f"{LUNARCRUSH_BASE_URL}/{path}", headers=headers, params=params)
+
+
+async def rapidapi(host, path, params=None):
+    headers = {
+        "X-RapidAPI-Key": X_RAPIDAPI_KEY,
+        "X-RapidAPI-Host": host,
+    }
+    return await get_json(f"https://{host}/{path}", headers=headers, params=params)
+
+
+async def coingecko(path, params=None):
+    return await get_json(f"{COINGECKO_BASE_URL}/{path}", params=params)
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
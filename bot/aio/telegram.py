@@ -0,0 +1,93 @@
+import asyncio
+import logging
+
+from telegram.error import BadRequest, RetryAfter, TelegramError, Unauthorized
+
+from bot.aio.http import get_client
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBot:
+    """
+    Minimal asyncio client for the Telegram Bot API.
+
+    Only the methods used by the async handlers are implemented. Results are
+    returned as the plain dicts of the Bot API response, errors are raised as
+    the python-telegram-bot exceptions the sync handlers already know about.
+
+    When an OutboundScheduler is given, every call waits for its chat's slot
+    so async and sync sends share the same rate limits.
+    """
+
+    def __init__(self, token: str, base_url: str = "https://api.telegram.org", scheduler=None):
+        self.base_url = f"{base_url}/bot{token}"
+        self.scheduler = scheduler
+
+    async def _post(self, method: str, data=None, files=None):
+        if self.scheduler is None:
+            return await self._post_now(method, data, files)
+
+        # The scheduler calls us back on a sender thread once the chat's slot
+        # is free; the request itself still runs on this event loop.
+        loop = asyncio.get_running_loop()
+
+        def send():
+            return asyncio.run_coroutine_threadsafe(
+                self._post_now(method, data, files), loop
+            ).result()
+
+        chat_id = (data or {}).get("chat_id")
+        return await asyncio.wrap_future(self.scheduler.submit(chat_id, send))
+
+    async def _post_now(self, method: str, data=None, files=None):
+        response = await get_client().post(
+            f"{self.base_url}/{method}", data=data, files=files
+        )
+        result = response.json()
+        if result.get("ok"):
+            return result["result"]
+
+        description = result.get("description", "Unknown error")
+        parameters = result.get("parameters") or {}
+        if "retry_after" in parameters:
+            raise RetryAfter(parameters["retry_after"])
+        if response.status_code in (401, 403):
+            raise Unauthorized(description)
+        if response.status_code == 400:
+            raise BadRequest(description)
+        raise TelegramError(description)
+
+    @staticmethod
+    def _params(**kwargs):
+        return {key: value for key, value in kwargs.items() if value is not None}
+
+    async def send_message(self, chat_id, text, parse_mode=None, disable_web_page_preview=None, reply_to_message_id=None):
+        return await self._post(
+            "sendMessage",
+            data=self._params(
+                chat_id=chat_id,
+                text=text,
+                parse_mode=parse_mode,
+                disable_web_page_preview=disable_web_page_preview,
+                reply_to_message_id=reply_to_message_id,
+            ),
+        )
+
+    async def send_photo(self, chat_id, photo: bytes, caption=None):
+        return await self._post(
+            "sendPhoto",
+            data=self._params(chat_id=chat_id, caption=caption),
+            files={"photo": ("chart.png", photo)},
+        )
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        return await self._post(
+            "editMessageText",
+            data=self._params(chat_id=chat_id, message_id=message_id, text=text),
+        )
+
+    async def delete_message(self, chat_id, message_id):
+        return await self._post(
+            "deleteMessage", data=self._params(chat_id=chat_id, message_id=message_id)
+        )
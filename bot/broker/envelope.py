@@ -0,0 +1,112 @@
+# Wire format of the updates queued between the producer and the consumers.
+#
+# A full Update.to_dict() carries much more than the handlers ever read
+# (reply markups, photos, forwarded-from data, ...). The envelope keeps only
+# the fields the handlers use, serializes them with orjson and compresses
+# large payloads:
+#
+#   b"CS" | version (1 byte) | flags (1 byte) | orjson payload (zlib if flagged)
+#
+# The payload uses Bot API field names, so Update.de_json rebuilds a regular
+# (lightweight) Update from it. Bodies starting with "{" are legacy plain
+# JSON updates and are still accepted.
+
+import zlib
+
+import orjson
+
+MAGIC = b"CS"
+ENVELOPE_VERSION = 1
+FLAG_ZLIB = 0x01
+
+USER_FIELDS = ("id", "is_bot", "first_name", "last_name", "username", "language_code")
+CHAT_FIELDS = ("id", "type", "title", "username")
+ENTITY_FIELDS = ("type", "offset", "length")
+PAYMENT_FIELDS = (
+    "currency",
+    "total_amount",
+    "invoice_payload",
+    "telegram_payment_charge_id",
+    "provider_payment_charge_id",
+)
+PRE_CHECKOUT_FIELDS = ("id", "currency", "total_amount", "invoice_payload")
+
+
+def _pick(data: dict, fields) -> dict:
+    return {key: data[key] for key in fields if data.get(key) is not None}
+
+
+def _compact_message(message: dict) -> dict:
+    compact = _pick(message, ("message_id", "date", "text"))
+    compact["chat"] = _pick(message["chat"], CHAT_FIELDS)
+    if message.get("from"):
+        compact["from"] = _pick(message["from"], USER_FIELDS)
+    if message.get("entities"):
+        compact["entities"] = [_pick(entity, ENTITY_FIELDS) for entity in message["entities"]]
+    if message.get("successful_payment"):
+        compact["successful_payment"] = _pick(message["successful_payment"], PAYMENT_FIELDS)
+    return compact
+
+
+def compact_update(update_dict: dict) -> dict:
+    """Strip an Update dict down to the fields the handlers use."""
+    compact = {"update_id": update_dict["update_id"]}
+
+    for field in ("message", "edited_message"):
+        if update_dict.get(field):
+            compact[field] = _compact_message(update_dict[field])
+
+    callback_query = update_dict.get("callback_query")
+    if callback_query:
+        compact["callback_query"] = _pick(callback_query, ("id", "data", "chat_instance"))
+        compact["callback_query"]["from"] = _pick(callback_query["from"], USER_FIELDS)
+        if callback_query.get("message"):
+            compact["callback_query"]["message"] = _compact_message(callback_query["message"])
+
+    pre_checkout_query = update_dict.get("pre_checkout_query")
+    if pre_checkout_query:
+        compact["pre_checkout_query"] = _pick(pre_checkout_query, PRE_CHECKOUT_FIELDS)
+        compact["pre_checkout_query"]["from"] = _pick(pre_checkout_query["from"], USER_FIELDS)
+
+    return compact
+
+
+def encode(update_dict: dict, compress_threshold: int = 1024) -> bytes:
+    """
+    Serialize an Update dict into an envelope.
+
+    :param update_dict: The Update as returned by Update.to_dict() or the Bot API
+    :param compress_threshold: Payloads at least this large are zlib compressed
+    :return: The envelope bytes
+    """
+    payload = orjson.dumps(compact_update(update_dict))
+    flags = 0
+    if len(payload) >= compress_threshold:
+        payload = zlib.compress(payload)
+        flags |= FLAG_ZLIB
+    return MAGIC + bytes((ENVELOPE_VERSION, flags)) + payload
+
+
+def decode(body: bytes) -> dict:
+    """
+    Decode an envelope (or a legacy JSON update) into an Update dict.
+
+    :raises ValueError: If the body is neither a known envelope nor JSON
+    """
+    if body[:1] == b"{":
+        return orjson.loads(body)
+
+    if body[:2] != MAGIC or len(body) < 4:
+        raise ValueError("Not an update envelope")
+
+    version, flags = body[2], body[3]
+    if version != ENVELOPE_VERSION:
+        raise ValueError(f"Unsupported envelope version {version}")
+
+    payload = body[4:]
+    if flags & FLAG_ZLIB:
+        try:
+            payload = zlib.decompress(payload)
+        except zlib.error as e:
+            raise ValueError(f"Corrupt envelope payload: {e}")
+    return orjson.loads(payload)
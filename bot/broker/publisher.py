@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import os
+import queue
+import random
+import struct
+import threading
+import time
+
+import aio_pika
+from aio_pika.exceptions import AMQPError, ChannelInvalidStateError
+
+logger = logging.getLogger(__name__)
+
+# errors of a broken connection or channel (AMQPConnectionError is an OSError)
+PUBLISH_ERRORS = (AMQPError, ChannelInvalidStateError, OSError, asyncio.TimeoutError)
+
+
+class DiskSpill:
+    """
+    Append-only overflow file of length-prefixed message bodies.
+
+    The producer appends, the publisher thread reads from a moving offset and
+    truncates the file once everything in it has been published.
+    """
+
+    HEADER = struct.Struct(">I")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._offset = 0
+        # keep whatever a previous run could not publish
+        self._size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._size - self._offset
+
+    def append(self, body: bytes) -> None:
+        with self._lock:
+            with open(self.path, "ab") as f:
+                f.write(self.HEADER.pack(len(body)))
+                f.write(body)
+            self._size += self.HEADER.size + len(body)
+
+    def read_batch(self, max_items: int):
+        """Return ``(bodies, end_offset)`` without consuming them."""
+        bodies = []
+        with self._lock:
+            if self._size == self._offset:
+                return bodies, self._offset
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                end = self._offset
+                while len(bodies) < max_items and end < self._size:
+                    (length,) = self.HEADER.unpack(f.read(self.HEADER.size))
+                    bodies.append(f.read(length))
+                    end += self.HEADER.size + length
+        return bodies, end
+
+    def consume(self, end_offset: int) -> None:
+        """Mark everything up to ``end_offset`` as published."""
+        with self._lock:
+            self._offset = end_offset
+            if self._offset >= self._size:
+                open(self.path, "wb").close()
+                self._offset = self._size = 0
+
+
+class BufferedPublisher:
+    """
+    Publishes messages to RabbitMQ from a dedicated thread.
+
+    ``publish`` never blocks the caller: messages go into a bounded in-memory
+    buffer (and, once that is full, into an optional disk spill file). The
+    publisher thread runs its own asyncio loop with an aio-pika connection: it
+    drains the buffer in batches, publishes a whole batch on a channel with
+    publisher confirms and then waits once for the confirms of the batch. It
+    reconnects with exponential backoff when the broker goes away. Messages are
+    only dropped from the buffer once the broker confirmed them.
+
+    :param url: AMQP URL of the broker
+    :param queue_name: Queue declared on connect and used as default routing key
+    :param maxsize: Capacity of the in-memory buffer
+    :param spill_path: File used once the buffer is full, or None to drop
+    :param batch_size: Maximum number of messages published per flush
+    :param max_backoff: Upper bound of the reconnect delay in seconds
+    :param declare: Coroutine function ``(channel)`` declaring the queues published
+                    to on connect, on an aio-pika channel. Defaults to declaring
+                    ``queue_name``
+    :param heartbeat: AMQP heartbeat interval in seconds
+    """
+
+    def __init__(self, url, queue_name="telegram", maxsize=10000, spill_path=None, batch_size=100, max_backoff=30,
+                 declare=None, heartbeat=30):
+        self.url = url
+        self.queue_name = queue_name
+        self.declare = declare
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.heartbeat = heartbeat
+
+        self._buffer = queue.Queue(maxsize=maxsize)
+        self._spill = DiskSpill(spill_path) if spill_path else None
+        self._spilling = self._spill is not None and len(self._spill) > 0
+        self._put_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        self._connection = None
+        self._channel = None
+        # batch taken from the buffer that is not confirmed yet
+        self._pending = []
+        # spill file offset to consume once the pending batch is confirmed
+        self._spill_end = None
+
+        # loop and task of the publisher thread, to cancel it on stop
+        self._loop = asyncio.new_event_loop()
+        self._task = None
+        self._thread = threading.Thread(target=self._run, name="amqp-publisher", daemon=True)
+        self._thread.start()
+
+    def publish(self, body: bytes, routing_key: str = None) -> bool:
+        """Queue a message. Returns False if it had to be dropped."""
+        item = (routing_key or self.queue_name, body)
+        with self._put_lock:
+            # once spilling, keep appending to disk so the order is preserved
+            if not self._spilling:
+                try:
+                    self._buffer.put_nowait(item)
+                    return True
+                except queue.Full:
+                    if self._spill is None:
+                        logger.error("Publish buffer full, dropping message")
+                        return False
+                    logger.warning("Publish buffer full, spilling to disk")
+                    self._spilling = True
+            self._spill.append(self._encode(item))
+            return True
+
+    @staticmethod
+    def _encode(item) -> bytes:
+        routing_key, body = item
+        key = routing_key.encode("utf-8")
+        return bytes([len(key)]) + key + body
+
+    @staticmethod
+    def _decode(record: bytes):
+        length = record[0]
+        return record[1:1 + length].decode("utf-8"), record[1 + length:]
+
+    async def _connect(self) -> None:
+        self._connection = await aio_pika.connect(self.url, heartbeat=self.heartbeat)
+        self._channel = await self._connection.channel(publisher_confirms=True)
+        if self.declare is not None:
+            await self.declare(self._channel)
+        else:
+            await self._channel.declare_queue(self.queue_name)
+
+    async def _close(self) -> None:
+        try:
+            if self._connection is not None and not self._connection.is_closed:
+                await self._connection.close()
+        except PUBLISH_ERRORS:
+            pass  # Ignore errors when closing a broken connection
+        self._connection = self._channel = None
+
+    def _next_batch(self, timeout: float) -> None:
+        """Fill ``self._pending`` from memory first, then from the spill file."""
+        try:
+            self._pending.append(self._buffer.get(timeout=timeout))
+            while len(self._pending) < self.batch_size:
+                self._pending.append(self._buffer.get_nowait())
+        except queue.Empty:
+            pass
+
+        if self._pending or self._spill is None:
+            return
+
+        records, end = self._spill.read_batch(self.batch_size)
+        if records:
+            self._pending = [self._decode(record) for record in records]
+            self._spill_end = end
+        else:
+            with self._put_lock:
+                if len(self._spill) == 0:
+                    self._spilling = False
+
+    async def _flush(self) -> None:
+        exchange = self._channel.default_exchange
+        # every message of the batch is written before the first confirm is awaited
+        results = await asyncio.gather(
+            *(exchange.publish(aio_pika.Message(body), routing_key=routing_key, mandatory=False)
+              for routing_key, body in self._pending),
+            return_exceptions=True,
+        )
+        # nacked (DeliveryError) or failed messages stay pending, in their order
+        self._pending = [item for item, result in zip(self._pending, results) if isinstance(result, BaseException)]
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+
+        if self._spill_end is not None:
+            self._spill.consume(self._spill_end)
+            self._spill_end = None
+
+    async def _wait(self, delay: float) -> None:
+        """Sleep up to ``delay`` seconds, less once stopping."""
+        deadline = time.monotonic() + delay
+        while not self._stopping.is_set() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+    async def _publish_loop(self) -> None:
+        backoff = 1
+        try:
+            while True:
+                if self._stopping.is_set() and not self._pending and self._buffer.empty():
+                    break
+
+                if self._channel is None:
+                    try:
+                        await self._connect()
+                        backoff = 1
+                        logger.info("Connected to RabbitMQ")
+                    except PUBLISH_ERRORS as err:
+                        await self._close()
+                        if self._stopping.is_set():
+                            break
+                        delay = backoff + random.uniform(0, backoff / 2)
+                        logger.error(f"Could not connect to RabbitMQ: {err!r}. Retrying in {delay:.1f}s")
+                        await self._wait(delay)
+                        backoff = min(backoff * 2, self.max_backoff)
+                        continue
+
+                if not self._pending:
+                    # blocks the loop for at most the timeout, heartbeats are sent in between
+                    self._next_batch(timeout=0.5)
+                    # let the connection handle its frames
+                    await asyncio.sleep(0)
+
+                try:
+                    if self._pending:
+                        await self._flush()
+                except PUBLISH_ERRORS as err:
+                    logger.error(f"Could not publish update to RabbitMQ: {err!r}")
+                    await self._close()
+        finally:
+            await self._close()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._task = self._loop.create_task(self._publish_loop())
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    def stop(self, timeout: float = 10) -> None:
+        """Flush what is buffered (spilling the rest if configured) and stop."""
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # the broker is unreachable or slow to confirm: give up on the batch in flight
+            self._loop.call_soon_threadsafe(self._task.cancel)
+            self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error("RabbitMQ publisher thread did not stop, buffered messages are left in memory")
+            return
+
+        if self._spill is not None:
+            # a pending batch read from the spill file is still in that file
+            leftover = list(self._pending) if self._spill_end is None else []
+            self._pending = []
+            while True:
+                try:
+                    leftover.append(self._buffer.get_nowait())
+                except queue.Empty:
+                    break
+            for item in leftover:
+                self._spill.append(self._encode(item))
+            if leftover:
+                logger.warning(f"Spilled {len(leftover)} unpublished messages to disk")
@@ -0,0 +1,195 @@
+# Failure handling for consumed updates.
+#
+# A delivery whose processing failed is always settled (acked) so it never
+# holds prefetch capacity. Depending on the error it is:
+# - retried: transient errors (network, rate limits) are republished through
+#   a delay queue. Every retry level has its own queue whose TTL expires the
+#   message back to the default exchange, which routes it to the shard queue
+#   it came from:
+#
+#     telegram.retry.8s (fanout exchange) -> telegram.retry.8s (queue, TTL 8s)
+#       -> "" (default exchange, original routing key) -> telegram.heavy.3
+#
+# - dead-lettered: permanent errors, and transient ones once the retries are
+#   used up, go to the telegram.dead queue with the failure in the headers.
+# - dropped: the user blocked the bot, there is nobody to answer.
+#
+# A retried update re-enters its shard queue behind the newer updates of its
+# chat. ProcessedUpdates keeps redeliveries of an already handled update from
+# running twice.
+
+import threading
+import time
+
+import ccxt
+import httpx
+import pika
+import requests
+from cachetools import TTLCache
+from telegram.error import BadRequest, NetworkError, RetryAfter, Unauthorized
+
+RETRY_HEADER = "x-retries"
+
+RETRY = "retry"
+DEAD = "dead"
+DROP = "drop"
+
+TRANSIENT_ERRORS = (
+    NetworkError,
+    RetryAfter,
+    requests.ConnectionError,
+    requests.Timeout,
+    httpx.TransportError,
+    ccxt.NetworkError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class RetryPolicy:
+    """
+    Decides and performs what happens to a failed delivery.
+
+    :param base: Prefix of the retry and dead-letter queue names
+    :param delays: Delay of every retry in seconds. Their number bounds the
+                   retries of one update
+    """
+
+    def __init__(self, base: str = "telegram", delays=(2, 8, 32)):
+        self.base = base
+        self.delays = tuple(delays)
+        self.dead_letter_queue = f"{base}.dead"
+
+    def retry_exchange(self, attempt: int) -> str:
+        """Return the exchange (and queue) of a 0-based retry attempt."""
+        return f"{self.base}.retry.{self.delays[attempt]}s"
+
+    def retry_queues(self) -> list:
+        """Return ``(name, arguments)`` of the delay queues, one per retry level."""
+        return [
+            (
+                self.retry_exchange(attempt),
+                {"x-message-ttl": int(delay * 1000), "x-dead-letter-exchange": ""},
+            )
+            for attempt, delay in enumerate(self.delays)
+        ]
+
+    def declare(self, channel) -> None:
+        """Declare the delay queues and the dead-letter queue on a pika channel."""
+        for name, arguments in self.retry_queues():
+            channel.exchange_declare(exchange=name, exchange_type="fanout")
+            channel.queue_declare(queue=name, arguments=arguments)
+            channel.queue_bind(queue=name, exchange=name)
+        # dead letters are kept for inspection, so they survive broker restarts
+        channel.queue_declare(queue=self.dead_letter_queue, durable=True)
+
+    @staticmethod
+    def classify(exc: Exception) -> str:
+        if isinstance(exc, Unauthorized):
+            return DROP
+        # BadRequest subclasses NetworkError but will fail the same way again
+        if isinstance(exc, BadRequest):
+            return DEAD
+        if isinstance(exc, TRANSIENT_ERRORS):
+            return RETRY
+        return DEAD
+
+    def target(self, queue_name: str, headers: dict, exc: Exception):
+        """
+        Return where a failed delivery goes.
+
+        :param queue_name: The shard queue the delivery came from
+        :param headers: The headers of the delivery
+        :param exc: The error raised while processing it
+        :return: ``(exchange, routing_key, headers)``, or None to drop it
+        """
+        action = self.classify(exc)
+        if action == DROP:
+            return None
+
+        headers = dict(headers or {})
+        retries = int(headers.get(RETRY_HEADER, 0))
+        if action == RETRY and retries < len(self.delays):
+            headers[RETRY_HEADER] = retries + 1
+            headers["x-last-error"] = repr(exc)[:500]
+            # the routing key survives dead-lettering and leads back to the shard queue
+            return self.retry_exchange(retries), queue_name, headers
+
+        headers.update({
+            "x-original-queue": queue_name,
+            "x-error-type": type(exc).__name__,
+            "x-error": str(exc)[:500],
+            "x-failed-at": int(time.time()),
+        })
+        return "", self.dead_letter_queue, headers
+
+    def settle(self, channel, method, properties, body: bytes, exc: Exception) -> str:
+        """
+        Republish (or drop) a failed pika delivery and ack it.
+
+        Must run on the connection thread.
+
+        :return: The action taken
+        """
+        target = self.target(method.routing_key, properties.headers if properties else None, exc)
+        if target is None:
+            action = DROP
+        else:
+            exchange, routing_key, headers = target
+            action = DEAD if routing_key == self.dead_letter_queue else RETRY
+            channel.basic_publish(
+                exchange=exchange,
+                routing_key=routing_key,
+                body=body,
+                properties=pika.BasicProperties(headers=headers),
+            )
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        return action
+
+
+class ProcessedUpdates:
+    """
+    Remembers recently processed update ids, so a redelivered update (after a
+    lost ack or a consumer restart) is acked without running its handler again.
+
+    :param maxsize: Maximum number of remembered ids
+    :param ttl: Seconds an id is remembered
+    """
+
+    def __init__(self, maxsize: int = 100000, ttl: int = 3600):
+        self._ids = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def seen(self, update_id) -> bool:
+        with self._lock:
+            return update_id is not None and update_id in self._ids
+
+    def add(self, update_id) -> None:
+        if update_id is None:
+            return
+        with self._lock:
+            self._ids[update_id] = True
+
+
+class HandlerErrors:
+    """
+    Surfaces handler errors swallowed by the PTB Dispatcher.
+
+    ``Dispatcher.process_update`` catches handler exceptions and only passes
+    them to error handlers. ``record`` is registered as the error handler and
+    ``run`` re-raises what it recorded for the update processed on the
+    current thread.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def record(self, update, context) -> None:
+        self._local.error = context.error
+
+    def run(self, fn, *args) -> None:
+        self._local.error = None
+        fn(*args)
+        error, self._local.error = self._local.error, None
+        if error is not None:
+            raise error
@@ -0,0 +1,117 @@
+# Chat-affine queue sharding.
+#
+# The producer routes every update onto one of QUEUE_SHARDS queues
+# ("telegram.0" ... "telegram.N-1") by a consistent hash of its chat id, so all
+# updates of one chat land on the same queue.
+#
+# Shard queues are declared as quorum queues with single-active-consumer:
+# however many consumers subscribe to a shard, the broker delivers it to one
+# of them at a time, which keeps the per-chat ordering ConversationHandler
+# states rely on. Every consumer subscribes to every shard, with a higher
+# consumer priority on the shards it owns (shard % CONSUMER_COUNT ==
+# CONSUMER_INDEX). Quorum queues pick the single active consumer by priority
+# (classic queues ignore x-priority there and keep the first subscriber).
+# When a consumer leaves, its shards fail over to the remaining consumers;
+# when it comes back, the broker hands them back once the in-flight
+# deliveries of the standby consumer are acked.
+# Quorum queues do not support a global (per-channel) prefetch, so the
+# prefetch budget of a channel is split over the shards its consumer owns
+# (see consumer_prefetch).
+
+import hashlib
+import os
+
+from bot.broker.worker_pool import ConsumerWorkerPool
+
+SHARD_QUEUE_ARGUMENTS = {"x-queue-type": "quorum", "x-single-active-consumer": True}
+OWNER_PRIORITY = 10
+STANDBY_PRIORITY = 0
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping & Veach).
+
+    Growing from n to n + 1 buckets only moves 1 / (n + 1) of the keys.
+
+    :param key: 64-bit unsigned integer key
+    :param buckets: Number of buckets
+    :return: The bucket in ``range(buckets)``
+    """
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def shard_for(chat_id, shards: int) -> int:
+    """Return the shard of a chat. Updates without a chat go to shard 0."""
+    if chat_id is None or shards <= 1:
+        return 0
+    # Python's hash() is salted per process, so use a stable digest instead
+    digest = hashlib.blake2b(str(chat_id).encode("utf-8"), digest_size=8).digest()
+    return jump_hash(int.from_bytes(digest, "big"), shards)
+
+
+def shard_queue(base: str, shard: int) -> str:
+    return f"{base}.{shard}"
+
+
+def shard_queues(base: str, shards: int) -> list:
+    return [shard_queue(base, shard) for shard in range(shards)]
+
+
+def route(update_dict: dict, base: str, shards: int) -> str:
+    """Return the shard queue an Update dict is published to."""
+    return shard_queue(base, shard_for(ConsumerWorkerPool.chat_key(update_dict), shards))
+
+
+def consumer_index(configured=None) -> int:
+    """
+    Return the 0-based index of this consumer.
+
+    :param configured: CONSUMER_INDEX, if set. Otherwise the index is taken
+                       from the Heroku dyno name (bot.1 -> 0)
+    """
+    if configured not in (None, ""):
+        return int(configured)
+    suffix = os.getenv("DYNO", "").rsplit(".", 1)[-1]
+    return int(suffix) - 1 if suffix.isdigit() else 0
+
+
+def consumer_priority(shard: int, index: int, count: int) -> int:
+    """Return the consumer priority this consumer subscribes to a shard with."""
+    if count <= 1 or shard % count == index % count:
+        return OWNER_PRIORITY
+    return STANDBY_PRIORITY
+
+
+def consumer_prefetch(prefetch: int, shards: int, count: int) -> int:
+    """
+    Return the per-consumer prefetch of one shard queue.
+
+    :param prefetch: Unacked deliveries a channel should hold across its shard queues
+    :param shards: Number of shard queues the channel consumes from
+    :param count: Number of consumers sharing the shards
+    """
+    owned = -(-shards // max(count, 1))
+    return max(1, -(-prefetch // max(owned, 1)))
+
+
+def declare_shard_queues(channel, base: str, shards: int) -> list:
+    """Declare the shard queues on a pika channel and return their names."""
+    names = shard_queues(base, shards)
+    for name in names:
+        # quorum queues are always durable
+        channel.queue_declare(queue=name, durable=True, arguments=SHARD_QUEUE_ARGUMENTS)
+    return names
+
+
+async def declare_shard_queues_async(channel, base: str, shards: int) -> list:
+    """Declare the shard queues on an aio-pika channel and return their names."""
+    names = shard_queues(base, shards)
+    for name in names:
+        await channel.declare_queue(name, durable=True, arguments=SHARD_QUEUE_ARGUMENTS)
+    return names
@@ -0,0 +1,132 @@
+# Broker topology: updates are classified into lanes, and every lane is
+# sharded by chat (see bot/broker/sharding.py):
+#
+#   telegram.<lane>.<shard>    e.g. telegram.heavy.3
+#
+# Lanes get separate consumer capacity, so a burst of expensive reports
+# (/positions makes dozens of sequential API calls, /gainers renders charts)
+# never delays /help or /start. Updates of one chat keep their order within a
+# lane, which is where the multi-step flows live (the /contact conversation
+# is interactive, the subscription flow is all payments).
+#
+# Before the lanes, every update went to a single "telegram" queue. The
+# producer moves whatever is left there onto the lane shards when it connects
+# and then deletes it (see drain_legacy_queue).
+
+import logging
+
+import aio_pika
+
+from bot.broker import envelope, sharding
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+HEAVY = "heavy"
+PAYMENTS = "payments"
+LANES = (INTERACTIVE, HEAVY, PAYMENTS)
+
+# Commands that wait on many API calls or render charts
+HEAVY_COMMANDS = frozenset({
+    "chart",
+    "cotd",
+    "gainers",
+    "losers",
+    "positions",
+    "sentiment",
+    "signal",
+    "stats",
+    "wdom",
+    "whatsup",
+})
+
+# Update types the bot handles (passed to Telegram as allowed_updates)
+UPDATE_TYPES = ("message", "edited_message", "callback_query", "pre_checkout_query")
+
+# Callback queries of the subscription flow (plan selection and invoices)
+PAYMENT_CALLBACK_PREFIX = "subscribe"
+
+
+def command_name(text: str):
+    """Return the command of a message text ("/chart@bot BTC" -> "chart"), or None."""
+    if not text or not text.startswith("/"):
+        return None
+    return text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+
+
+def lane_for(update_dict: dict):
+    """
+    Classify an Update dict by update type and command cost.
+
+    :return: The lane name, or None for update types the bot does not handle
+    """
+    if update_dict.get("pre_checkout_query"):
+        return PAYMENTS
+
+    callback_query = update_dict.get("callback_query")
+    if callback_query:
+        if (callback_query.get("data") or "").startswith(PAYMENT_CALLBACK_PREFIX):
+            return PAYMENTS
+        return INTERACTIVE
+
+    message = update_dict.get("message") or update_dict.get("edited_message")
+    if not message:
+        return None
+    if message.get("successful_payment"):
+        return PAYMENTS
+    if command_name(message.get("text")) in HEAVY_COMMANDS:
+        return HEAVY
+    return INTERACTIVE
+
+
+def lane_base(lane: str, base: str = "telegram") -> str:
+    return f"{base}.{lane}"
+
+
+def route(update_dict: dict, shards: int, base: str = "telegram"):
+    """Return the queue an Update dict is published to, or None to skip it."""
+    lane = lane_for(update_dict)
+    if lane is None:
+        return None
+    return sharding.route(update_dict, lane_base(lane, base), shards)
+
+
+def declare(channel, shards: int, lanes=LANES, base: str = "telegram") -> dict:
+    """Declare the lane shard queues on a pika channel. Returns ``{lane: [queue names]}``."""
+    return {lane: sharding.declare_shard_queues(channel, lane_base(lane, base), shards) for lane in lanes}
+
+
+async def declare_async(channel, shards: int, lanes=LANES, base: str = "telegram") -> dict:
+    """Declare the lane shard queues on an aio-pika channel. Returns ``{lane: [queue names]}``."""
+    return {lane: await sharding.declare_shard_queues_async(channel, lane_base(lane, base), shards) for lane in lanes}
+
+
+async def drain_legacy_queue(channel, shards: int, base: str = "telegram") -> int:
+    """
+    Move the updates left in the unsharded queue onto the lane shards and delete it.
+
+    :param channel: An aio-pika channel with publisher confirms
+    :return: The number of updates moved
+    """
+    # declared as the unsharded producer did, so it is only created (empty) if it is gone
+    legacy = await channel.declare_queue(base)
+    moved = 0
+    while True:
+        message = await legacy.get(no_ack=False, fail=False)
+        if message is None:
+            break
+        try:
+            routing_key = route(envelope.decode(message.body), shards, base)
+        except ValueError:
+            # the consumers dead-letter what they cannot decode
+            routing_key = sharding.shard_queue(lane_base(INTERACTIVE, base), 0)
+        if routing_key is not None:
+            await channel.default_exchange.publish(aio_pika.Message(message.body), routing_key=routing_key,
+                                                   mandatory=False)
+        # acked once its copy is confirmed
+        await message.ack()
+        moved += 1
+    await legacy.delete(if_unused=False, if_empty=True)
+    if moved:
+        logger.info(f"Moved {moved} updates from the {base} queue to the lane shards")
+    return moved
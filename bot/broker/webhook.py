@@ -0,0 +1,83 @@
+# Webhook ingestion for the producer.
+#
+# Telegram POSTs every update to an embedded aiohttp server instead of the
+# producer long polling getUpdates. The handler checks the secret token,
+# decodes the body with orjson (no telegram.Update is built), hands it to a
+# non-blocking enqueue callable and answers right away. Any number of
+# producers can run behind a load balancer.
+
+import hmac
+import logging
+
+import httpx
+import orjson
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def create_app(enqueue, secret_token: str, path: str = "/telegram") -> web.Application:
+    """
+    Build the webhook application.
+
+    :param enqueue: Callable ``(update_dict) -> bool`` that queues an update
+                    without blocking. False makes Telegram deliver it again later
+    :param secret_token: The secret token passed to setWebhook
+    :param path: The path Telegram posts updates to
+    """
+
+    async def receive(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret_token):
+            return web.Response(status=401)
+
+        try:
+            update_dict = orjson.loads(await request.read())
+        except orjson.JSONDecodeError:
+            return web.Response(status=400)
+        if not isinstance(update_dict, dict) or "update_id" not in update_dict:
+            return web.Response(status=400)
+
+        if not enqueue(update_dict):
+            return web.Response(status=503)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    app.router.add_get("/health", health)
+    return app
+
+
+async def set_webhook(
+    token: str,
+    url: str,
+    secret_token: str,
+    base_url: str = "https://api.telegram.org",
+    allowed_updates=None,
+    max_connections: int = 40,
+) -> None:
+    """
+    Register the webhook with the Bot API.
+
+    :param token: The bot token
+    :param url: The public HTTPS URL Telegram posts updates to
+    :param secret_token: Sent back by Telegram in the X-Telegram-Bot-Api-Secret-Token header
+    :param base_url: The Bot API server (a local Bot API server or fake in tests)
+    :param allowed_updates: Update types to receive, or None for Telegram's default
+    :param max_connections: Maximum simultaneous connections Telegram opens
+    :raises RuntimeError: If the Bot API refused the webhook
+    """
+    payload = {"url": url, "secret_token": secret_token, "max_connections": max_connections}
+    if allowed_updates is not None:
+        payload["allowed_updates"] = list(allowed_updates)
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        response = await client.post(f"{base_url}/bot{token}/setWebhook", json=payload)
+    result = response.json()
+    if not result.get("ok"):
+        raise RuntimeError(f"setWebhook failed: {result.get('description')}")
+    logger.info(f"Webhook set to {url}")
@@ -0,0 +1,132 @@
+import functools
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ChatOrderedExecutor:
+    """
+    Thread pool that runs tasks concurrently across chats but strictly in
+    submission order within a chat.
+
+    Conversations (e.g. /contact -> message -> /confirm) depend on updates of
+    one chat being handled one after the other, so tasks sharing a key are
+    chained instead of being handed to the pool independently.
+    """
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="handler"
+        )
+        self._lock = threading.Lock()
+        # key -> tasks waiting behind the one currently running for that key
+        self._pending = {}
+
+    def submit(self, key, fn) -> None:
+        if key is None:
+            self._executor.submit(self._run_one, fn)
+            return
+
+        with self._lock:
+            waiting = self._pending.get(key)
+            if waiting is not None:
+                waiting.append(fn)
+                return
+            self._pending[key] = deque()
+
+        self._executor.submit(self._run_chain, key, fn)
+
+    @staticmethod
+    def _run_one(fn) -> None:
+        try:
+            fn()
+        except Exception:
+            logger.exception("Unhandled error in handler worker")
+
+    def _run_chain(self, key, fn) -> None:
+        while True:
+            self._run_one(fn)
+            with self._lock:
+                waiting = self._pending[key]
+                if not waiting:
+                    del self._pending[key]
+                    return
+                fn = waiting.popleft()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+class ConsumerWorkerPool:
+    """
+    Runs update processing off the pika connection thread.
+
+    pika's BlockingConnection is not thread-safe, so workers never touch the
+    channel directly: acks (and failure handling) are marshalled back to the
+    connection thread with ``add_callback_threadsafe``. The number of unacked
+    deliveries (and thus the amount of work buffered in the pool) is bounded by
+    ``basic_qos``.
+
+    :param connection: The pika BlockingConnection that owns the channel
+    :param channel: The channel the deliveries are consumed from
+    :param process: Callable ``(update_dict)`` that handles one update and
+                    raises when it failed
+    :param workers: Number of handler threads
+    :param prefetch: Maximum number of unacked deliveries held by each consumer
+                     of the channel (quorum queues only support a per-consumer prefetch)
+    :param on_failure: Callable ``(channel, method, properties, body, exc)``
+                       run on the connection thread for failed deliveries.
+                       Defaults to rejecting them without requeueing
+    """
+
+    def __init__(self, connection, channel, process, workers: int, prefetch: int, on_failure=None):
+        self.connection = connection
+        self.channel = channel
+        self.process = process
+        self.on_failure = on_failure or self._reject
+        self.executor = ChatOrderedExecutor(max_workers=workers)
+        # applies to every consumer of the channel (one per shard queue)
+        self.channel.basic_qos(prefetch_count=prefetch)
+
+    @staticmethod
+    def chat_key(update_dict: dict):
+        """Return the chat id used to keep updates of one chat in order."""
+        for field in ("message", "edited_message", "channel_post"):
+            message = update_dict.get(field)
+            if message and message.get("chat"):
+                return message["chat"].get("id")
+
+        for field in ("callback_query", "pre_checkout_query", "shipping_query", "inline_query"):
+            query = update_dict.get(field)
+            if query and query.get("from"):
+                return query["from"].get("id")
+
+        return None
+
+    @staticmethod
+    def _reject(channel, method, properties, body, exc) -> None:
+        channel.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+
+    def on_message(self, ch, method, properties, body: bytes, update_dict: dict) -> None:
+        """Hand one decoded delivery to the pool. Called on the connection thread."""
+        key = self.chat_key(update_dict)
+        task = functools.partial(self._handle, method, properties, body, update_dict)
+        self.executor.submit(key, task)
+
+    def _handle(self, method, properties, body: bytes, update_dict: dict) -> None:
+        try:
+            self.process(update_dict)
+        except Exception as exc:
+            logger.warning(f"Could not process update {update_dict.get('update_id')}: {exc!r}")
+            self._threadsafe(self.on_failure, self.channel, method, properties, body, exc)
+            return
+        self._threadsafe(self.channel.basic_ack, delivery_tag=method.delivery_tag)
+
+    def _threadsafe(self, fn, *args, **kwargs) -> None:
+        self.connection.add_callback_threadsafe(functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,164 @@
+# Cache expiry aligned to candle closes.
+#
+# Market data only changes in a meaningful way when a candle closes, so a
+# flat TTL is either too long (a 1m series 4 hours stale) or too short (a 1d
+# series refetched every 4 hours). Cached market data instead expires at the
+# next close of its timeframe, CANDLE_CLOSE_DELAY seconds late so the
+# exchange has published the closed candle:
+#
+#   fetched 10:17 (1h)  -> fresh until 11:00:05
+#   fetched 10:17 (1d)  -> fresh until 00:00:05 UTC
+#
+# With stale-while-revalidate (CACHE_STALE_WINDOW seconds), an entry that
+# just expired is still returned while one background refresh replaces it,
+# so the requests right after a close do not all wait on the API.
+# Data keyed by something that is not a candle timeframe (a typo in a command
+# argument) is kept CACHE_DEFAULT_MAX_AGE seconds instead.
+
+import functools
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import ccxt
+from cachetools import LRUCache
+from cachetools.keys import hashkey
+
+from config.settings import CACHE_DEFAULT_MAX_AGE, CANDLE_CLOSE_DELAY
+
+logger = logging.getLogger(__name__)
+
+# weekly candles open on Monday, the epoch was a Thursday
+WEEK_OFFSET = 4 * 86400
+
+TIMEFRAME_PATTERN = re.compile(r"[1-9][0-9]*[smhdwMy]")
+
+
+def is_timeframe(timeframe) -> bool:
+    """Return whether ``timeframe`` is a candle timeframe like "15m", "4h" or "1M"."""
+    return isinstance(timeframe, str) and TIMEFRAME_PATTERN.fullmatch(timeframe) is not None
+
+
+def next_close(timeframe: str, now: float = None) -> float:
+    """
+    Return the close time (epoch seconds) of the candle of ``timeframe`` open at ``now``.
+
+    :raises ValueError: If ``timeframe`` is not a candle timeframe
+    """
+    if not is_timeframe(timeframe):
+        raise ValueError(f"Invalid timeframe {timeframe!r}")
+    now = time.time() if now is None else now
+    if timeframe.endswith("M"):
+        months = int(timeframe[:-1])
+        opened = datetime.fromtimestamp(now, timezone.utc)
+        index = (opened.year * 12 + opened.month - 1) // months * months + months
+        return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc).timestamp()
+    seconds = ccxt.Exchange.parse_timeframe(timeframe)
+    offset = WEEK_OFFSET if timeframe.endswith("w") else 0
+    return now - (now - offset) % seconds + seconds
+
+
+def expires_at(timeframe: str, fetched_at: float, delay: float = CANDLE_CLOSE_DELAY) -> float:
+    """Return when data of ``timeframe`` fetched at ``fetched_at`` expires."""
+    if not is_timeframe(timeframe):
+        return fetched_at + CACHE_DEFAULT_MAX_AGE
+    # fetched right after a close but before the delay: the closed candle may still be missing
+    return next_close(timeframe, fetched_at - delay) + delay
+
+
+class AlignedCache:
+    """
+    LRU cache whose entries expire at the next candle close of their timeframe.
+
+    :param maxsize: Size bound of the cache, in getsizeof units (entries by default)
+    :param getsizeof: Returns the size of a value
+    :param stale: Seconds an expired entry is still returned while one background
+                  refresh runs, 0 to always refresh before returning
+    :param delay: Seconds after a close the new candle is expected to be published
+    """
+
+    def __init__(self, maxsize: int = 1024, getsizeof=None, stale: float = 0.0, delay: float = CANDLE_CLOSE_DELAY):
+        self._cache = LRUCache(maxsize, getsizeof=(lambda entry: getsizeof(entry[0])) if getsizeof else None)
+        self.stale = stale
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _store(self, key, timeframe: str, value, fetched_at: float) -> None:
+        with self._lock:
+            try:
+                self._cache[key] = (value, expires_at(timeframe, fetched_at, self.delay))
+            except ValueError:
+                # larger than the whole cache
+                pass
+
+    def _refresh(self, key, timeframe: str, loader) -> None:
+        try:
+            fetched_at = time.time()
+            self._store(key, timeframe, loader(), fetched_at)
+        except Exception:
+            logger.exception(f"Could not refresh the cached {key}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key, timeframe: str, loader) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, timeframe, loader), daemon=True).start()
+
+    def get(self, key, timeframe: str, loader) -> tuple:
+        """
+        Return ``(value, cached)``, loading the value when it is missing or expired.
+
+        :param timeframe: Timeframe whose candle closes expire the value
+        :param loader: Returns a fresh value
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None:
+            value, expires = entry
+            if now < expires:
+                self.hits += 1
+                return value, True
+            if now < expires + self.stale:
+                self.stale_hits += 1
+                self._refresh_in_background(key, timeframe, loader)
+                return value, True
+
+        self.misses += 1
+        value = loader()
+        self._store(key, timeframe, value, now)
+        return value, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses,
+                    "entries": len(self._cache), "size": self._cache.currsize}
+
+
+def aligned_cached(cache: AlignedCache, timeframe):
+    """
+    Cache the results of a function in an AlignedCache.
+
+    :param timeframe: The timeframe of the results, or a function of the call
+                      arguments returning it
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            frame = timeframe(*args, **kwargs) if callable(timeframe) else timeframe
+            value, _ = cache.get(hashkey(*args, **kwargs), frame, lambda: func(*args, **kwargs))
+            return value
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,215 @@
+# Persistent OHLCV candle store.
+#
+# Charts, /stats, /signal and /cotd used to download the full default candle
+# history on every call. The closed candles of every (exchange, symbol,
+# timeframe) are instead kept on disk under CANDLE_STORE_PATH:
+#
+#   <exchange>/<timeframe>/<symbol>.candles
+#
+# one fixed size record per candle (CANDLE_DTYPE, 48 bytes), oldest first.
+# Reads are memory-mapped numpy views, so a read costs no parsing and the
+# columns (series["close"], ...) are zero-copy. A request only fetches the
+# candles after the last stored close (ccxt `since`): usually the one candle
+# still open, plus the ones that closed since the previous request. History
+# before the first stored candle is fetched and merged in once, when a
+# request (or backfill_candles.py) asks for it.
+#
+# Closed candles never change, so the files are append-only, except for the
+# merge of older history (rewritten to a temporary file and renamed). Writes
+# of a series hold a thread lock and an flock on its .lock file, so the
+# consumer processes of a host share one store.
+# Monthly (and yearly) candles have no fixed length and are fetched directly.
+
+import fcntl
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from bot.exchanges import get_exchange
+from config.settings import CANDLE_DEFAULT_LIMIT, CANDLE_PAGE_SIZE, CANDLE_STORE_PATH
+
+logger = logging.getLogger(__name__)
+
+CANDLE_DTYPE = np.dtype([
+    ("time", "<i8"),  # open time in ms
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+
+# timeframes whose candles do not all have the same length
+UNSTORED_TIMEFRAMES = ("M", "y")
+
+
+def to_array(rows) -> np.ndarray:
+    """Convert ccxt ``[timestamp, open, high, low, close, volume]`` rows to a CANDLE_DTYPE array."""
+    return np.array([tuple(row[:6]) for row in rows], dtype=CANDLE_DTYPE)
+
+
+def to_rows(candles: np.ndarray) -> list:
+    """Convert a CANDLE_DTYPE array back to ccxt rows."""
+    return [list(row) for row in candles.tolist()]
+
+
+class CandleStore:
+    """
+    On-disk store of closed candles.
+
+    :param root: Directory of the store
+    :param exchange_factory: Returns the ccxt client of an exchange name
+    :param page_size: Most candles asked for per fetch_ohlcv call
+    """
+
+    def __init__(self, root: str = CANDLE_STORE_PATH, exchange_factory=get_exchange, page_size: int = CANDLE_PAGE_SIZE):
+        self.root = root
+        self.exchange_factory = exchange_factory
+        self.page_size = page_size
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # path -> earliest open time asked from the exchange, so missing history is only asked for once
+        self._earliest = {}
+
+    def path(self, exchange: str, symbol: str, timeframe: str) -> str:
+        name = re.sub(r"[^A-Za-z0-9]+", "_", symbol).strip("_")
+        return os.path.join(self.root, exchange, timeframe, f"{name}.candles")
+
+    @contextmanager
+    def _locked(self, path: str):
+        with self._locks_lock:
+            lock = self._locks.setdefault(path, threading.Lock())
+        with lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read(path: str) -> np.ndarray:
+        try:
+            # a record cut short by a crash is ignored (and dropped by the next append)
+            count = os.path.getsize(path) // CANDLE_DTYPE.itemsize
+        except FileNotFoundError:
+            count = 0
+        if not count:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        return np.memmap(path, dtype=CANDLE_DTYPE, mode="r", shape=(count,))
+
+    def read(self, exchange: str, symbol: str, timeframe: str) -> np.ndarray:
+        """Return the stored candles of a series as a read-only memory-mapped array."""
+        return self._read(self.path(exchange, symbol, timeframe))
+
+    @staticmethod
+    def _append(path: str, candles: np.ndarray) -> None:
+        with open(path, "ab") as f:
+            size = f.tell()
+            if size % CANDLE_DTYPE.itemsize:
+                f.truncate(size - size % CANDLE_DTYPE.itemsize)
+                f.seek(0, os.SEEK_END)
+            f.write(candles.tobytes())
+
+    @staticmethod
+    def _replace(path: str, candles: np.ndarray) -> None:
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(candles.tobytes())
+        os.replace(temporary, path)
+
+    def _fetch(self, client, symbol: str, timeframe: str, since: int, until: int) -> list:
+        """Fetch the candles opened from ``since`` up to ``until`` (exclusive) page by page."""
+        step = client.parse_timeframe(timeframe) * 1000
+        rows = []
+        while since < until:
+            page = client.fetch_ohlcv(symbol, timeframe, since=since, limit=self.page_size)
+            page = [row for row in page if row[0] >= since and row[0] < until]
+            if not page:
+                break
+            rows.extend(page)
+            since = page[-1][0] + step
+        return rows
+
+    def update(self, exchange: str, symbol: str, timeframe: str, since: int = None, now: int = None) -> list:
+        """
+        Store the candles closed since the last stored one, and the history from ``since``.
+
+        :param since: Open time (ms) the stored history should start at
+        :param now: Current time in ms
+        :return: The rows of the candle still open
+        """
+        client = self.exchange_factory(exchange)
+        step = client.parse_timeframe(timeframe) * 1000
+        now = client.milliseconds() if now is None else now
+        current = now - now % step
+        path = self.path(exchange, symbol, timeframe)
+
+        with self._locked(path):
+            stored = self._read(path)
+            if since is not None and (not len(stored) or since < stored["time"][0]) \
+                    and since < self._earliest.get(path, current):
+                until = int(stored["time"][0]) if len(stored) else current
+                older = to_array(self._fetch(client, symbol, timeframe, since, until))
+                self._earliest[path] = since
+                if len(older):
+                    self._replace(path, np.concatenate([older, np.asarray(stored)]))
+                    logger.info(f"Stored {len(older)} older {timeframe} candles of {exchange} {symbol}")
+                stored = self._read(path)
+
+            start = int(stored["time"][-1]) + step if len(stored) else current
+            # one request: the candles closed since the last stored one and the one still open
+            rows = client.fetch_ohlcv(symbol, timeframe, since=start, limit=self.page_size) if start <= current else []
+            rows = [row for row in rows if row[0] >= start]
+            if rows and rows[-1][0] < current:
+                # far behind, or the exchange caps its pages below page_size: page through the rest
+                rows += self._fetch(client, symbol, timeframe, rows[-1][0] + step, current + step)
+            closed = [row for row in rows if row[0] < current]
+            if closed:
+                self._append(path, to_array(closed))
+        return [row for row in rows if row[0] >= current]
+
+    def candles(self, exchange: str, symbol: str, timeframe: str, since: int = None, limit: int = None) -> list:
+        """
+        Return candles like ``fetch_ohlcv``, from the store where possible.
+
+        :param exchange: The ccxt exchange id
+        :param symbol: Market id or unified symbol
+        :param since: Open time (ms) of the first candle
+        :param limit: Most candles to return (the last ones), CANDLE_DEFAULT_LIMIT without since
+        :return: ``[timestamp, open, high, low, close, volume]`` rows, the last one still open
+        """
+        client = self.exchange_factory(exchange)
+        # one file per market, however the symbol was typed
+        symbol = client.market(symbol)["symbol"]
+        if timeframe.endswith(UNSTORED_TIMEFRAMES):
+            return client.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+
+        step = client.parse_timeframe(timeframe) * 1000
+        now = client.milliseconds()
+        if since is None:
+            limit = limit or CANDLE_DEFAULT_LIMIT
+            since = now - now % step - (limit - 1) * step
+
+        open_rows = self.update(exchange, symbol, timeframe, since=since, now=now)
+        stored = self.read(exchange, symbol, timeframe)
+        rows = to_rows(stored[stored["time"] >= since]) + open_rows
+        return rows[-limit:] if limit else rows
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_candle_store() -> CandleStore:
+    """Return the process-wide CandleStore."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CandleStore()
+        return _store
@@ -83,6 +83,21 @@ class PriceAlertRequest(Base):
     symbol = Column(String, nullable=False, index=True)
     price_level = Column(Numeric(20, 2), nullable=False)
 
+
+# Indicator Alert Request table class definition (see bot/scripts/indicator_alerts.py)
+class IndicatorAlertRequest(Base):
+    __tablename__ = "indicator_alert_requests"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(
+        Integer, ForeignKey("users.telegram_id"), nullable=False, index=True
+    )
+    symbol = Column(String, nullable=False, index=True)
+    kind = Column(String, nullable=False)  # move, rsi or sma
+    timeframe = Column(String, nullable=False)  # candle timeframe, e.g. 1h
+    period = Column(Integer, nullable=False)  # candles of the move, RSI or SMA
+    threshold = Column(Numeric(20, 4), nullable=False)  # move percent or RSI level (0 for sma)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
+
     
 
 class PatternData(Base):
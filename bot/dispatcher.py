@@ -0,0 +1,104 @@
+# Handler registration shared by the consumer entry points.
+# Every command, callback query and payment handler of the bot is added here,
+# so the sync and async consumers expose exactly the same commands.
+
+from telegram.ext import CommandHandler, CallbackQueryHandler
+
+# Import all the command handlers
+# Start and help handlers
+from bot.handlers.start import StartHandler
+from bot.handlers.subscribe import SubscribeHandler
+from bot.handlers.help import HelpHandler
+from bot.handlers.free.use_token import UseTokenHandler
+from bot.handlers.free.join_waitlist import JoinWaitlistHandler
+from bot.handlers.free.contact import ContactHandler
+
+# Free handlers
+from bot.handlers.free.cotd import CotdHandler
+from bot.handlers.free.global_top import GlobalTopHandler
+from bot.handlers.free.whatsup import WhatsupHandler
+from bot.handlers.free.gainers import GainersHandler
+from bot.handlers.free.losers import LosersHandler
+from bot.handlers.free.news import NewsHandler
+from bot.handlers.free.request_alert import IndicatorAlertHandler, PriceAlertHandler
+from bot.handlers.referral import UseReferralHandler
+
+# Premium handlers
+from bot.handlers.premium.wdom import WdomHandler
+from bot.handlers.premium.sentiment import SentimentHandler
+from bot.handlers.premium.positions import PositionsHandler
+from bot.handlers.premium.plot_chart import ChartHandler
+from bot.handlers.premium.stats import StatsHandler
+from bot.handlers.premium.signal import SignalHandler
+
+
+def register_handlers(dp):
+    # Add all command handlers to the Dispatcher
+    # Add all the free handlers to the dispatcher
+    dp.add_handler(CommandHandler("start", StartHandler.start))
+    # dp.add_handler(CommandHandler("use_referral", UseReferralHandler.use_referral))
+    dp.add_handler(CommandHandler("help", HelpHandler.help))
+    dp.add_handler(CommandHandler("cotd", CotdHandler.coin_of_the_day))
+    dp.add_handler(
+            CommandHandler("global_top", GlobalTopHandler.global_top, pass_args=True)
+    )
+    dp.add_handler(CommandHandler("use_token", UseTokenHandler.use_token))
+    dp.add_handler(CommandHandler("gainers", GainersHandler.gainers))
+    dp.add_handler(CommandHandler("losers", LosersHandler.losers))
+    dp.add_handler(CommandHandler("news", NewsHandler.news_handler))
+    dp.add_handler(
+        CommandHandler(
+            "set_alert", PriceAlertHandler.request_price_alert, pass_args=True
+        )
+    )
+    dp.add_handler(CommandHandler("list_alerts", PriceAlertHandler.list_alerts))
+    dp.add_handler(
+            CommandHandler("remove_alert", PriceAlertHandler.remove_alert, pass_args=True)
+    )
+    dp.add_handler(
+        CommandHandler(
+            "set_indicator_alert", IndicatorAlertHandler.request_indicator_alert, pass_args=True
+        )
+    )
+    dp.add_handler(
+            CommandHandler("remove_indicator_alert", IndicatorAlertHandler.remove_indicator_alert, pass_args=True)
+    )
+
+    # Add all the paid handlers to the dispatcher
+    dp.add_handler(CommandHandler("whatsup", WhatsupHandler.whatsup))
+    # dp.add_handler(CommandHandler("wdom", WdomHandler.wdom_handler))
+    dp.add_handler(CommandHandler("sentiment", SentimentHandler.sentiment))
+    dp.add_handler(CommandHandler("positions", PositionsHandler.trader_positions))
+    dp.add_handler(CommandHandler("chart", ChartHandler.plot_chart, pass_args=True))
+    dp.add_handler(StatsHandler.command_handler())
+    dp.add_handler(SignalHandler.command_handler())
+
+    # Subscribe Handlers
+    subscribe_handler = SubscribeHandler.subscribe_handler
+    payment_handler = SubscribeHandler.payment_handler
+
+    monthly_handler = CallbackQueryHandler(
+            SubscribeHandler.send_invoice_monthly,
+        pattern="^subscribe_monthly_subscription$",
+    )
+
+    three_monthly_handler = CallbackQueryHandler(
+            SubscribeHandler.send_invoice_3_monthly,
+        pattern="^subscribe_3_monthly_subscription$",
+    )
+
+    yearly_handler = CallbackQueryHandler(
+        SubscribeHandler.send_invoice_yearly, pattern="^subscribe_yearly_subscription$"
+    )
+
+    # waitlist_handler = JoinWaitlistHandler.join_waitlist_handler
+    dp.add_handler(CommandHandler("join_waitlist", JoinWaitlistHandler.join_waitlist))
+    dp.add_handler(ContactHandler.conversation_handler())
+
+    dp.add_handler(subscribe_handler)
+    dp.add_handler(payment_handler)
+    dp.add_handler(monthly_handler)
+    dp.add_handler(three_monthly_handler)
+    dp.add_handler(yearly_handler)
+
+    return dp
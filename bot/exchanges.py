@@ -0,0 +1,117 @@
+# Process-wide ccxt exchange clients, shared by the sync and async consumers.
+#
+# Building a client per call repeats the market loading (several large API
+# calls) and the TLS handshakes of every request. Every handler and job of
+# the process instead shares one client per exchange:
+# - markets are loaded when a client is first used and reloaded in the
+#   background every EXCHANGE_MARKETS_TTL seconds
+# - the client's HTTP session keeps a connection pool sized for the handler
+#   threads, so requests reuse kept-alive connections
+# - one client per exchange means one rate limiter per exchange, shared by
+#   all threads. ccxt's own throttle reads and updates the time of the last
+#   request without a lock, so threads calling together all compute the same
+#   delay and send at once; it is replaced by a SharedThrottle that hands out
+#   request slots under a lock, rateLimit * cost apart
+
+import logging
+import threading
+import time
+
+import ccxt
+from requests.adapters import HTTPAdapter
+
+from config.settings import EXCHANGE_MARKETS_TTL, EXCHANGE_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+_exchanges = {}
+_lock = threading.Lock()
+
+
+class _Entry:
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.loaded_at = None
+        self.lock = threading.Lock()  # held while markets load
+        self.refreshing = False
+
+
+class SharedThrottle:
+    """
+    Rate limiter of a client shared by threads: every request waits for its own slot.
+
+    :param exchange: The ccxt client, whose rateLimit (ms) spaces the requests
+    """
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self._lock = threading.Lock()
+        self._next = 0.0  # time.monotonic() of the next free slot
+
+    def __call__(self, cost=None):
+        spacing = self.exchange.rateLimit * (1 if cost is None else cost) / 1000
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + spacing
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _create(name: str):
+    exchange = getattr(ccxt, name)({"enableRateLimit": True})
+    # fetch2 calls exchange.throttle(cost) before every request
+    exchange.throttle = SharedThrottle(exchange)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=EXCHANGE_POOL_SIZE)
+    exchange.session.mount("https://", adapter)
+    exchange.session.mount("http://", adapter)
+    return exchange
+
+
+def _load_markets(name: str, entry: _Entry, reload: bool) -> None:
+    with entry.lock:
+        try:
+            if reload or entry.loaded_at is None:
+                start = time.monotonic()
+                entry.exchange.load_markets(reload)
+                entry.loaded_at = time.monotonic()
+                logger.info(f"Loaded {len(entry.exchange.markets)} {name} markets in {entry.loaded_at - start:.1f}s")
+        except ccxt.BaseError as e:
+            # the client loads them again on its next call
+            logger.warning(f"Could not load the {name} markets: {e!r}")
+        finally:
+            entry.refreshing = False
+
+
+def _refresh_in_background(name: str, entry: _Entry) -> None:
+    with _lock:
+        if entry.refreshing:
+            return
+        entry.refreshing = True
+    threading.Thread(target=_load_markets, args=(name, entry, True), name=f"{name}-markets", daemon=True).start()
+
+
+def get_exchange(name: str = "bybit"):
+    """
+    Return the shared client of an exchange, with its markets loaded.
+
+    :param name: The ccxt exchange id
+    """
+    with _lock:
+        entry = _exchanges.get(name)
+        if entry is None:
+            entry = _exchanges[name] = _Entry(_create(name))
+
+    if entry.loaded_at is None:
+        _load_markets(name, entry, reload=False)
+    elif time.monotonic() - entry.loaded_at >= EXCHANGE_MARKETS_TTL:
+        # callers keep using the current markets until the new ones are in
+        _refresh_in_background(name, entry)
+    return entry.exchange
+
+
+def close_all() -> None:
+    with _lock:
+        for entry in _exchanges.values():
+            entry.exchange.session.close()
+        _exchanges.clear()
@@ -11,6 +11,7 @@ from telegram.ext import (
 )
 
 from config.settings import TELEGRAM_IDS
+from bot.utils import queue_reply, queue_message
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +19,8 @@ logger = logging.getLogger(__name__)
 class ContactHandler:
     @staticmethod
     def contact(update: Update, context: CallbackContext):
-        update.message.reply_text(
+        queue_reply(
+            update.message,
             "Please enter your message. You can cancel this conversation at any time by typing /cancel."
         )
         return "get_message"
@@ -48,19 +50,21 @@ class ContactHandler:
     @staticmethod
     def message(update: Update, context: CallbackContext):
         if len(update.message.text) > 4096:
-            update.message.reply_text(
+            queue_reply(
+                update.message,
                 "Your message is too long. Please limit it to 4096 characters."
             )
             return "get_message"
         context.user_data["message"] = update.message.text
-        update.message.reply_text(
+        queue_reply(
+            update.message,
             "Please confirm your message by typing /confirm or change it by typing /cancel."
         )
         return "confirm_message"
 
     @staticmethod
     def cancel(update: Update, context: CallbackContext):
-        update.message.reply_text("Conversation cancelled.")
+        queue_reply(update.message, "Conversation cancelled.")
         return ConversationHandler.END
 
     @staticmethod
@@ -76,12 +80,12 @@ class ContactHandler:
             int(telegram_id.strip()) for telegram_id in TELEGRAM_IDS.split(",")
         ]
         for telegram_id in telegram_ids:
-            context.bot.send_message(chat_id=telegram_id, text=text)
-        update.message.reply_text("Your message has been sent.")
+            queue_message(context.bot, telegram_id, text)
+        queue_reply(update.message, "Your message has been sent.")
         return ConversationHandler.END
 
     @staticmethod
     def error(update: Update, context: CallbackContext):
         logger.warning(f"Update {update} caused error {context.error}")
-        update.message.reply_text("An error occurred.")
+        queue_reply(update.message, "An error occurred.")
         return ConversationHandler.END
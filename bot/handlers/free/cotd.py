@@ -11,13 +11,17 @@ from datetime import datetime, timedelta
 
 from telegram import Update
 from telegram.ext import CallbackContext
-from bot.utils import restricted
+from bot.utils import restricted, queue_reply
 from config.settings import LUNARCRUSH_API_KEY
 from bot.utils import log_command_usage
+from bot.candles import get_candle_store
 
-from cachetools import TTLCache
+from bot.candle_expiry import AlignedCache
+from config.settings import CACHE_STALE_WINDOW
 
-cotd_cache = TTLCache(maxsize=1, ttl=3600)
+# The Coin of the Day response, until the next hourly close
+COTD_TIMEFRAME = "1h"
+cotd_cache = AlignedCache(maxsize=1, stale=CACHE_STALE_WINDOW)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -28,15 +32,16 @@ class CotdHandler:
     @staticmethod
     def fetch_ohlcv_data(symbol):
         """Fetch OHLCV data from Binance and return as a DataFrame"""
+        # Display only the last 4 weeks
+        two_weeks_ago = datetime.now() - timedelta(weeks=4)
         try:
-            exchange = ccxt.bybit()
-            ohlcv = exchange.fetch_ohlcv(symbol.upper() + "/USDT", "4h")
+            ohlcv = get_candle_store().candles(
+                "bybit", symbol.upper() + "/USDT", "4h", since=int(two_weeks_ago.timestamp() * 1000)
+            )
         except Exception as e:
             logger.exception("Error fetching OHLCV data")
             raise e
 
-        # Filter data to display only the last 4 weeks
-        two_weeks_ago = datetime.now() - timedelta(weeks=4)
         ohlcv = [
             entry
             for entry in ohlcv
@@ -133,23 +138,27 @@ class CotdHandler:
         fig.write_image(f"charts/{symbol}_chart.png", scale=1.5, width=1000, height=600)
 
     @staticmethod
-    @log_command_usage("cotd")
-    def coin_of_the_day(update: Update, context: CallbackContext):
-        # Fetch Coin of the Day data from LunarCrush API
+    def fetch_coin_of_the_day():
+        """Fetch Coin of the Day data from LunarCrush API"""
         url = "https://lunarcrush.com/api3/coinoftheday"
         headers = {"Authorization": f"Bearer {LUNARCRUSH_API_KEY}"}
+        response = requests.get(url, headers=headers)
+        response.raise_for_status()
+        return response.json()
 
+    @staticmethod
+    @log_command_usage("cotd")
+    def coin_of_the_day(update: Update, context: CallbackContext):
         loading_message = update.message.reply_text("Fetching Coin of the Day...", quote=True)
 
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
+            data, _ = cotd_cache.get("cotd", COTD_TIMEFRAME, CotdHandler.fetch_coin_of_the_day)
         except requests.exceptions.RequestException as e:
             logger.exception(
                 "Connection error while fetching Coin of the Day from LunarCrush API"
             )
-            update.message.reply_text(
+            queue_reply(
+                update.message,
                 "Error connecting to LunarCrush API. Please try again later."
             )
             return
@@ -172,7 +181,8 @@ class CotdHandler:
                 CotdHandler.plot_ohlcv_chart(df, coin_symbol)
             except Exception as e:
                 logger.exception("Error while plotting the OHLCV chart")
-                update.message.reply_text(
+                queue_reply(
+                    update.message,
                     f"Coin of the Day: {coin_name} ({coin_symbol}).\n\n"
                     "Can't generate the chart. Symbol not listed on available exchanges."
                 )
@@ -183,7 +193,8 @@ class CotdHandler:
             try:
                 with open(image_path, "rb") as f:
                     context.bot.send_photo(chat_id=update.effective_chat.id, photo=f)
-                update.message.reply_text(
+                queue_reply(
+                    update.message,
                     f"Coin of the Day: {coin_name} ({coin_symbol})"
                 )
 
@@ -193,7 +204,8 @@ class CotdHandler:
                 logger.exception(
                     "Error while sending the chart and the Coin of the Day message"
                 )
-                update.message.reply_text(
+                queue_reply(
+                    update.message,
                     "Error while sending the chart and the Coin of the Day message. Please try again later."
                 )
                 return
@@ -206,6 +218,7 @@ class CotdHandler:
 
         else:
             logger.error("Error in LunarCrush API response: Required data not found")
-            update.message.reply_text(
+            queue_reply(
+                update.message,
                 "Error fetching Coin of the Day data. Please try again later."
             )
@@ -1,6 +1,7 @@
 from telegram import Update
 from telegram.ext import CallbackContext
 from bot.database import Session, User, WaitingList
+from bot.utils import queue_reply
 
 
 class JoinWaitlistHandler:
@@ -15,14 +16,16 @@ class JoinWaitlistHandler:
         )
 
         if user_in_waiting_list:
-            update.message.reply_text(
+            queue_reply(
+                update.message,
                 "You're already on the waiting list for the premium tier!"
             )
         else:
             # Add the user to the waiting list
             session.add(WaitingList(telegram_id=user_id, username=username))
             session.commit()
-            update.message.reply_text(
+            queue_reply(
+                update.message,
                 "You've been added to the waiting list for the premium tier! You'll receive a free one-month trial once it becomes available."
             )
 
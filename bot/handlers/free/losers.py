@@ -3,7 +3,7 @@ from telegram import Update
 from telegram.ext import CallbackContext
 import os
 
-from bot.utils import PlotChart, log_command_usage
+from bot.utils import PlotChart, log_command_usage, queue_reply
 
 cg = CoinGeckoAPI()
 
@@ -16,7 +16,8 @@ class LosersHandler:
             coins, key=lambda x: x["price_change_percentage_24h"], reverse=False
         )
         for coin in losers[:5]:
-            update.message.reply_text(
+            queue_reply(
+                update.message,
                 f"{coin['name']}: {coin['price_change_percentage_24h']}%"
             )
             loading_message = update.message.reply_text(
@@ -32,7 +33,8 @@ class LosersHandler:
                     chat_id=update.effective_chat.id,
                     message_id=loading_message.message_id,
                 )
-                update.message.reply_text(
+                queue_reply(
+                    update.message,
                     f"Symbol not listed on available exchanges."
                 )
                 continue
@@ -2,7 +2,7 @@ import requests
 from telegram import Update, ParseMode
 from telegram.ext import CallbackContext
 from config.settings import X_RAPIDAPI_KEY
-from bot.utils import log_command_usage
+from bot.utils import log_command_usage, queue_reply, queue_message
 import logging
 
 logger = logging.getLogger(__name__)
@@ -47,7 +47,17 @@ class NewsHandler:
             logger.error(f"Something went wrong: {err}")
             return []
 
-        news_data = response.json()
+        return NewsHandler.format_news(response.json(), keyword)
+
+    @staticmethod
+    def format_news(news_data, keyword=None):
+        """
+        Format the raw news items returned by the Crypto News API.
+
+        :param news_data: The decoded JSON response of the API
+        :param keyword: The keyword to filter by, or None to keep all news
+        :return: A list of formatted news strings
+        """
         news_list = []
         for news_item in news_data:
             title = news_item['title']
@@ -65,6 +75,22 @@ class NewsHandler:
         return news_list
 
 
+    @staticmethod
+    def parse_news_args(args):
+        """
+        Parse the arguments of the /news command.
+
+        :param args: The command arguments
+        :return: A (source, keyword, limit) tuple
+        """
+        source, keyword, limit = None, None, 5
+        if args:
+            source = args[0] if args[0] in ['CoinDesk', 'CoinTelegraph', 'CoinJournal', 'CryptoNinjas', 'YahooFinance', 'all'] else None
+            keyword = args[1] if len(args) > 1 else None
+            if args[-1].isdigit():
+                limit = int(args[-1])
+        return source, keyword, limit
+
     @log_command_usage("news")
     def news_handler(update: Update, context: CallbackContext):
         """
@@ -74,22 +100,17 @@ class NewsHandler:
         :param context: Context for the callback
         """
         logger.info(f"Received /news command with args: {context.args}")
-        source, keyword, limit = None, None, 5
-        if context.args:
-            source = context.args[0] if context.args[0] in ['CoinDesk', 'CoinTelegraph', 'CoinJournal', 'CryptoNinjas', 'YahooFinance', 'all'] else None
-            keyword = context.args[1] if len(context.args) > 1 else None
-            if context.args[-1].isdigit():
-                limit = int(context.args[-1])
+        source, keyword, limit = NewsHandler.parse_news_args(context.args)
 
         news_list = NewsHandler.fetch_crypto_news(source, keyword, limit)
 
         if not news_list:
             logger.error("Failed to fetch crypto news. news_list is empty.")
-            context.bot.send_message(chat_id=update.effective_chat.id, text="Failed to fetch crypto news.")
+            queue_message(context.bot, update.effective_chat.id, "Failed to fetch crypto news.")
             return
 
         logger.info(f"Sending {len(news_list)} news items to the user.")
         for news in news_list:
-            update.message.reply_text(news, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+            queue_reply(update.message, news, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
         
         logger.info("Finished sending news to the user.")
@@ -3,14 +3,15 @@ from decimal import Decimal
 from telegram import Update, ParseMode
 from telegram.ext import CallbackContext
 from config.settings import X_RAPIDAPI_KEY, MY_POSTGRESQL_URL
-from bot.utils import log_command_usage
+from bot.utils import log_command_usage, resolve_symbol_arg, queue_reply
 import logging
-import ccxt
 
 logger = logging.getLogger(__name__)
 
 # setup database
-from bot.database import PriceAlertRequest, Session
+from bot.database import IndicatorAlertRequest, PriceAlertRequest, Session
+from bot.scripts.indicator_alerts import describe, parse_alert
+from bot.scripts.alert_changes import notify_added, notify_indicator_added, notify_indicator_removed, notify_removed
 
 class PriceAlertHandler:
     @staticmethod
@@ -20,27 +21,26 @@ class PriceAlertHandler:
             symbol, price_level = context.args
             price_level = Decimal(price_level)
             if price_level <= 0:
-                update.message.reply_text("Invalid price level. Please enter a positive number.")
+                queue_reply(update.message, "Invalid price level. Please enter a positive number.")
                 return
-
-            # Try to fetch the current price for the symbol
-            exchange = ccxt.bybit()
-            ticker = exchange.fetch_ticker(symbol)
-            current_price = ticker['last']
-        except (ValueError, IndexError):
-            update.message.reply_text("Invalid input. Please enter a symbol and a price level.")
+        except (ValueError, IndexError, ArithmeticError):
+            queue_reply(update.message, "Invalid input. Please enter a symbol and a price level.")
             return
-        except ccxt.BaseError as e:
-            logger.error(f"Failed to fetch the current price for {symbol}: {e}")
-            update.message.reply_text(f"Invalid symbol. {symbol} is not listed on the exchange or not currently tradable.")
+
+        # The alerts are checked on bybit
+        symbol = resolve_symbol_arg(update, symbol, exchange="bybit")
+        if symbol is None:
             return
 
         session = Session()
         price_alert_requests = PriceAlertRequest(user_id=user_id, symbol=symbol, price_level=price_level)
         session.add(price_alert_requests)
+        session.flush()
+        # the alert engine follows the table through these notifications
+        notify_added(session, price_alert_requests)
         session.commit()
 
-        update.message.reply_text(f"Your request for a price alert has been successfully set up! You will receive a notification when the price of {symbol} reaches {price_level}.")
+        queue_reply(update.message, f"Your request for a price alert has been successfully set up! You will receive a notification when the price of {symbol} reaches {price_level}.")
 
     @staticmethod
     def list_alerts(update: Update, context: CallbackContext):
@@ -49,13 +49,19 @@ class PriceAlertHandler:
         session = Session()
         price_alert_requests = session.query(PriceAlertRequest).filter_by(user_id=user_id).all()
 
-        if not price_alert_requests:
-            update.message.reply_text("You have no price alerts set up.")
+        indicator_alert_requests = session.query(IndicatorAlertRequest).filter_by(user_id=user_id).all()
+
+        if not price_alert_requests and not indicator_alert_requests:
+            queue_reply(update.message, "You have no price alerts set up.")
         else:
             message = "Here are your current price alerts:\n\n"
             for alert in price_alert_requests:
                 message += f"ID: {alert.id}, Symbol: {alert.symbol}, Price Level: {alert.price_level}\n"
-            update.message.reply_text(message)
+            if indicator_alert_requests:
+                message += "\nIndicator alerts (remove with /remove_indicator_alert <ID>):\n\n"
+                for alert in indicator_alert_requests:
+                    message += f"ID: {alert.id}, {IndicatorAlertHandler.describe_request(alert)}\n"
+            queue_reply(update.message, message)
 
     @staticmethod
     def remove_alert(update: Update, context: CallbackContext):
@@ -66,8 +72,70 @@ class PriceAlertHandler:
         price_alert_request = session.query(PriceAlertRequest).filter_by(user_id=user_id, id=alert_id).first()
 
         if not price_alert_request:
-            update.message.reply_text(f"No price alert found with ID {alert_id}.")
+            queue_reply(update.message, f"No price alert found with ID {alert_id}.")
         else:
             session.delete(price_alert_request)
+            notify_removed(session, [alert_id])
             session.commit()
-            update.message.reply_text(f"Successfully removed price alert with ID {alert_id}.")
\ No newline at end of file
+            queue_reply(update.message, f"Successfully removed price alert with ID {alert_id}.")
+
+
+class IndicatorAlertHandler:
+    @staticmethod
+    def describe_request(alert) -> str:
+        return describe(alert).replace("moved", "moves").replace("crossed", "crosses")
+
+    @staticmethod
+    def request_indicator_alert(update: Update, context: CallbackContext):
+        user_id = update.message.from_user.id
+        try:
+            symbol, kind, timeframe, period, threshold = parse_alert(context.args or [])
+        except ValueError as e:
+            queue_reply(
+                update.message,
+                f"{e}\nExamples: /set_indicator_alert BTCUSDT move 5, "
+                "/set_indicator_alert BTCUSDT rsi 30 1h, /set_indicator_alert BTCUSDT sma 50 4h"
+            )
+            return
+
+        # Make sure bybit lists the symbol before storing the alert
+        symbol = resolve_symbol_arg(update, symbol, exchange="bybit")
+        if symbol is None:
+            return
+
+        session = Session()
+        alert = IndicatorAlertRequest(
+            user_id=user_id, symbol=symbol, kind=kind, timeframe=timeframe, period=period, threshold=threshold
+        )
+        session.add(alert)
+        session.flush()
+        # the indicator alert engine follows the table through the change feed
+        notify_indicator_added(session, alert)
+        session.commit()
+
+        queue_reply(
+            update.message,
+            f"Your indicator alert has been set up! You will be notified when {IndicatorAlertHandler.describe_request(alert)}."
+        )
+        session.close()
+
+    @staticmethod
+    def remove_indicator_alert(update: Update, context: CallbackContext):
+        user_id = update.message.from_user.id
+        try:
+            alert_id = int(context.args[0])
+        except (ValueError, IndexError, TypeError):
+            queue_reply(update.message, "Please enter the ID of the alert. Example: /remove_indicator_alert 1")
+            return
+
+        session = Session()
+        deleted = session.query(IndicatorAlertRequest).filter_by(user_id=user_id, id=alert_id).delete()
+        if deleted:
+            notify_indicator_removed(session, [alert_id])
+        session.commit()
+        session.close()
+
+        if not deleted:
+            queue_reply(update.message, f"No indicator alert found with ID {alert_id}.")
+        else:
+            queue_reply(update.message, f"Successfully removed indicator alert with ID {alert_id}.")
@@ -3,7 +3,7 @@ from telegram.ext import CallbackContext
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine, DateTime
 from bot.database import OneTimeToken, User, Base
-from bot.utils import restricted
+from bot.utils import restricted, queue_reply
 from datetime import datetime, timedelta
 
 # Import the database URL from the settings
@@ -28,7 +28,7 @@ class UseTokenHandler:
         args = context.args
 
         if len(args) != 1:
-            update.message.reply_text("Usage: /use_token <your_token>")
+            queue_reply(update.message, "Usage: /use_token <your_token>")
             logger.info("Usage message sent")
             return
 
@@ -67,13 +67,13 @@ class UseTokenHandler:
                 session.commit()
 
                 logger.debug("Token used status updated: existing_token.used = %s", existing_token.used)
-                update.message.reply_text("Access granted! Your token has been successfully used.")
+                queue_reply(update.message, "Access granted! Your token has been successfully used.")
                 logger.debug("Access granted message sent.")
             else:
-                update.message.reply_text("User not found. Please try again.")
+                queue_reply(update.message, "User not found. Please try again.")
                 logger.debug("User not found message sent.")
         else:
-            update.message.reply_text("Invalid or expired token. Please try again.")
+            queue_reply(update.message, "Invalid or expired token. Please try again.")
             logger.debug("Invalid or expired token message sent.")
         session.close()
 
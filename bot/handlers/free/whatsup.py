@@ -6,7 +6,7 @@ import datetime
 from datetime import datetime
 import cachetools
 
-from bot.utils import log_command_usage
+from bot.utils import log_command_usage, queue_reply
 from config.settings import LUNARCRUSH_API_KEY
 
 # Configure logging
@@ -70,17 +70,17 @@ class WhatsupHandler:
                 logger.debug("Formatted message: %s", message)
 
                 # Send the message to the user
-                update.message.reply_text(message)
+                queue_reply(update.message, message)
             else:
                 # Notify the user if there's an error fetching data from LunarCrush API
-                update.message.reply_text("Error fetching data from LunarCrush API. Please try again later.")
+                queue_reply(update.message, "Error fetching data from LunarCrush API. Please try again later.")
                 logger.error("Error fetching data from LunarCrush API. Response data: %s", response_data)
         except requests.exceptions.HTTPError as http_err:
             logger.error(f'HTTP error occurred: {http_err}')
-            update.message.reply_text("An HTTP error occurred while processing the /whatsup command. Please try again later.")
+            queue_reply(update.message, "An HTTP error occurred while processing the /whatsup command. Please try again later.")
         except requests.exceptions.RequestException as req_err:
             logger.error(f'Request error occurred: {req_err}')
-            update.message.reply_text("A network error occurred while processing the /whatsup command. Please check your connection and try again.")
+            queue_reply(update.message, "A network error occurred while processing the /whatsup command. Please check your connection and try again.")
         except Exception as e:
             logger.exception("An error occurred while processing the /whatsup command: %s", e)
-            update.message.reply_text("An unexpected error occurred while processing the /whatsup command. Please try again later.")
+            queue_reply(update.message, "An unexpected error occurred while processing the /whatsup command. Please try again later.")
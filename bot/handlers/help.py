@@ -1,7 +1,7 @@
 from telegram import Update
 from telegram.ext import CallbackContext
 
-from bot.utils import log_command_usage
+from bot.utils import log_command_usage, queue_reply
 
 
 class HelpHandler:
@@ -27,10 +27,12 @@ class HelpHandler:
             "set_alert": "/set_alert <Symbol> <Price_level> - Set a price alert. You will be notified when the price of the specified symbol reaches the specified level. Example: /set_alert BTCUSDT 50000",
             "list_alerts": "/list_alerts - List all your active price alerts.",
             "remove_alert": "/remove_alert <ID> - Remove a specific price alert by its ID. Example: /remove_alert 1",
+            "set_indicator_alert": "/set_indicator_alert <Symbol> <move|rsi|sma> <Value> [Timeframe] - Set an indicator alert: a 24h move of at least Value percent, RSI(14) crossing the Value level (default 1h), or the price crossing its SMA of Value candles (default 4h). Examples: /set_indicator_alert BTCUSDT move 5, /set_indicator_alert BTCUSDT rsi 30 1h, /set_indicator_alert BTCUSDT sma 50 4h",
+            "remove_indicator_alert": "/remove_indicator_alert <ID> - Remove a specific indicator alert by its ID. Example: /remove_indicator_alert 1",
         }
 
         if command and command in command_help_text:
-            update.message.reply_text(command_help_text[command])
+            queue_reply(update.message, command_help_text[command])
         else:
             help_text = (
                 "🤖 Crypto Sentinel Bot 🤖\n\n"
@@ -45,7 +47,8 @@ class HelpHandler:
                 "📰 /news - Latest crypto news\n"
                 "💹 /set_alert <Symbol> <Price_level> - Set a price alert\n"
                 "🔔 /list_alerts - List all your active price alerts\n"
-                "🚫 /remove_alert <ID> - Remove a specific price alert\n\n"
+                "🚫 /remove_alert <ID> - Remove a specific price alert\n"
+                "📐 /set_indicator_alert <Symbol> <move|rsi|sma> <Value> - Set an indicator alert\n\n"
                 "🔐 Premium Commands:\n"
                 "📊 /sentiment - Coin sentiments\n"
                 "💹 /positions - Big Positions from Binance\n"
@@ -62,4 +65,4 @@ class HelpHandler:
                 "and then follow the instructions provided.\n\n"
             )
 
-            update.message.reply_text(help_text)
+            queue_reply(update.message, help_text)
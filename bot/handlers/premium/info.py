@@ -3,7 +3,8 @@ import requests
 import os
 from telegram import Update
 from telegram.ext import CallbackContext
-from bot.utils import log_command_usage, restricted, PlotChart, command_usage_example
+from bot.utils import log_command_usage, restricted, PlotChart, command_usage_example, resolve_symbol_arg, queue_reply
+from bot.symbols import get_resolver
 from config.settings import LUNARCRUSH_API_KEY
 
 # Set up logging
@@ -11,37 +12,14 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class InfoHandler:
-    SYMBOL_MAPPING = {
-        "BTC": 1,
-        "ETH": 2,
-        "XRP": 3,
-        "LTC": 4,
-        "BCH": 5,
-        "BNB": 6,
-        "USDT": 7,
-        "EOS": 8,
-        "BSV": 9,
-        "XLM": 10,
-        "ADA": 11,
-        "TRX": 12,
-        "XMR": 13,
-        "LEO": 14,
-        "DASH": 15,
-        "NEO": 16,
-        "IOTA": 17,
-        "LINK": 18,
-        "ATOM": 19,
-        "XTZ": 20,
-    }
-
     @staticmethod
     def get_coin_info(symbol):
-        # Check if symbol exists in mapping
-        if symbol in InfoHandler.SYMBOL_MAPPING:
-            coin_id = InfoHandler.SYMBOL_MAPPING[symbol]
-        else:
-            logger.error("Symbol mapping not found")
+        # Look the coin up in the LunarCrush coin list of the symbol catalog
+        coin = get_resolver().catalog().coin(symbol)
+        if coin is None:
+            logger.error(f"No LunarCrush coin found for {symbol}")
             return None
+        coin_id = coin["id"]
 
         # Prepare API request
         url = f"https://lunarcrush.com/api3/coins/{coin_id}"
@@ -69,11 +47,13 @@ class InfoHandler:
     @command_usage_example("/info BTCUSDT 1d - Defaults to 4h if no time frame is provided")
     def get_coin_info_command(update: Update, context: CallbackContext):
         # Get the user's input
-        input_arg = context.args[0]  # Assuming the symbol is passed as a command argument
+        pair = resolve_symbol_arg(update, context.args[0])
+        if pair is None:
+            return
 
-        # Split the input_arg into cryptocurrency symbol and currency symbol
-        symbol = input_arg[:-4]  # Get the cryptocurrency symbol (e.g., "BTC" from "BTCUSDT")
-        currency = input_arg[-4:]  # Get the currency symbol (e.g., "USDT" from "BTCUSDT")
+        # Split the pair into cryptocurrency symbol and currency symbol (e.g., "BTC" and "USDT")
+        listing = get_resolver().catalog().listing(pair)
+        symbol, currency = (listing.base, listing.quote) if listing else (pair[:-4], pair[-4:])
 
         # Set default time frame
         time_frame = '4h'
@@ -85,7 +65,7 @@ class InfoHandler:
         # Fetch coin info
         coin_data = InfoHandler.get_coin_info(symbol)
         if coin_data is None:
-            update.message.reply_text("Error fetching coin info. Please try again later.")
+            queue_reply(update.message, "Error fetching coin info. Please try again later.")
             return
 
         # Extract relevant information
@@ -109,7 +89,7 @@ class InfoHandler:
         )
 
         # Plot chart with specified time frame
-        chart_file = PlotChart.plot_ohlcv_chart(symbol, time_frame)
+        chart_file = PlotChart.plot_ohlcv_chart(pair, time_frame)
 
         # Send chart and info as a reply
         update.message.reply_photo(open(chart_file, 'rb'), caption=message)
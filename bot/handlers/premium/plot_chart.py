@@ -8,10 +8,11 @@ import os
 from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import CallbackContext
-from bot.utils import log_command_usage, restricted, command_usage_example
+from bot.utils import log_command_usage, restricted, command_usage_example, resolve_symbol_arg, queue_reply
 from config.settings import LUNARCRUSH_API_KEY
 from bot.utils import restricted
 from bot.utils import PlotChart
+from bot.candle_expiry import is_timeframe
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -27,10 +28,15 @@ class ChartHandler:
     )
     def plot_chart(update: Update, context: CallbackContext):
         # Get the user's input
-        symbol = context.args[0]  # symbol is passed as a command argument
+        symbol = resolve_symbol_arg(update, context.args[0])  # symbol is passed as a command argument
+        if symbol is None:
+            return
         time_frame = (
             context.args[1] if len(context.args) > 1 else "4h"
         )  # Set default to 4h if not provided
+        if not is_timeframe(time_frame):
+            queue_reply(update.message, "Invalid timeframe. Please use a timeframe like 15m, 1h, 4h or 1d.")
+            return
 
         # Send a Loading message and tag it so we can delete it later
         loading_message = update.message.reply_text(
@@ -41,7 +47,8 @@ class ChartHandler:
             chart_file = PlotChart.plot_ohlcv_chart(symbol, time_frame)
         except Exception as e:
             logger.exception("Error while plotting the OHLCV chart")
-            update.message.reply_text(
+            queue_reply(
+                update.message,
                 "Error while plotting the OHLCV chart. Please try again later."
             )
             return
@@ -52,7 +59,8 @@ class ChartHandler:
                 context.bot.send_photo(chat_id=update.effective_chat.id, photo=f)
         except Exception as e:
             logger.exception("Error while sending the chart")
-            update.message.reply_text(
+            queue_reply(
+                update.message,
                 "Error while sending the chart. Please try again later."
             )
             return
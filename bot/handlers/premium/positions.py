@@ -9,7 +9,6 @@
 
 import requests
 import functools
-import time
 from datetime import datetime
 
 from telegram import Update, ParseMode
@@ -19,9 +18,10 @@ from telegram import ParseMode
 from config.settings import X_RAPIDAPI_KEY
 from config.settings import TELEGRAM_API_TOKEN
 from config.settings import LUNARCRUSH_API_KEY
-from bot.utils import restricted
+from bot.utils import restricted, queue_reply
 from bot.database import Session, SummaryData
 from bot.utils import log_command_usage
+from bot.candle_expiry import AlignedCache
 
 import logging
 
@@ -29,30 +29,25 @@ logger = logging.getLogger(__name__)
 
 
 class PositionsHandler:
-    # Define Cache decorator to cache function results for a given number of seconds to avoid hitting rate limit of the API and to speed up the bot
-    def cache(seconds):
+    # Define Cache decorator to cache function results until the next close of a timeframe to avoid hitting rate limit of the API and to speed up the bot
+    # (no stale results: the summaries are only stored from fresh results)
+    def cache(timeframe):
         def decorator_cache(func):
+            entries = AlignedCache(maxsize=256)
+
             @functools.wraps(func)
             def wrapper_cache(*args, **kwargs):
-                if not hasattr(wrapper_cache, "cache"):
-                    wrapper_cache.cache = {}
                 key = (args, tuple(kwargs.items()))
-                if (
-                    key not in wrapper_cache.cache
-                    or time.time() - wrapper_cache.cache[key][1] > seconds
-                ):
-                    result = func(*args, **kwargs)
-                    wrapper_cache.cache[key] = (result, time.time())
-                    return result, False
-                return wrapper_cache.cache[key][0], True
+                return entries.get(key, timeframe, lambda: func(*args, **kwargs))
 
+            wrapper_cache.cache = entries
             return wrapper_cache
 
         return decorator_cache
 
     # Fetch All time top traders Futures Position data
-    # Cache for 2 hours
-    @cache(2 * 60 * 60)
+    # Cache until the next 2 hour close
+    @cache("2h")
     def fetch_trader_positions(encrypted_uid):
         url = (
             "https://binance-futures-leaderboard1.p.rapidapi.com/v2/getTraderPositions"
@@ -281,10 +276,11 @@ class PositionsHandler:
                         output += f"{i+1}️⃣ {row[0]}\n   💹 Entry: {float(row[1]):.5f}\n   🎯 Mark: {float(row[2]):.5f}\n   💰 PnL: ${pnl:.2f} ({float(row[4]):.2f}%)\n   🧮 Amount: ${amount:.2f}\n   ⚖️ Leverage: {row[6]}\n\n"
 
                     PositionsHandler.position_output_dict[encrypted_uid] = output
-                update.message.reply_text(output, parse_mode=ParseMode.HTML)
+                queue_reply(update.message, output, parse_mode=ParseMode.HTML)
             else:
                 if encrypted_uid in PositionsHandler.position_output_dict:
-                    update.message.reply_text(
+                    queue_reply(
+                        update.message,
                         PositionsHandler.position_output_dict[encrypted_uid],
                         parse_mode=ParseMode.HTML,
                     )
@@ -339,7 +335,7 @@ class PositionsHandler:
         summary += f" Total Longs: {total_long_percent:.2f}%\n"
         summary += f" Total Shorts: {total_short_percent:.2f}%\n"
 
-        update.message.reply_text(summary, parse_mode=ParseMode.HTML)
+        queue_reply(update.message, summary, parse_mode=ParseMode.HTML)
 
         # Delete the loading message from the chat
         context.bot.delete_message(
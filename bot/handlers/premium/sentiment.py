@@ -4,7 +4,7 @@ from telegram import Update
 from telegram.ext import CallbackContext
 
 from config.settings import LUNARCRUSH_API_KEY
-from bot.utils import restricted
+from bot.utils import restricted, queue_reply
 from bot.utils import log_command_usage
 
 # Configure logging
@@ -66,7 +66,7 @@ class SentimentHandler:
             response_message = "An error occurred while fetching the top coins data."
 
         # Send the response message
-        update.message.reply_text(response_message)
+        queue_reply(update.message, response_message)
 
         
         context.bot.delete_message(
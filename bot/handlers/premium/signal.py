@@ -3,7 +3,7 @@ import requests
 import os
 from telegram import Update
 from telegram.ext import CallbackContext, CommandHandler
-from bot.utils import log_command_usage, restricted, command_usage_example
+from bot.utils import log_command_usage, restricted, command_usage_example, resolve_symbol_arg, queue_reply
 from config.settings import X_RAPIDAPI_KEY
 from bot.utils import PlotChart
 from bot.handlers.premium.stats import StatsHandler
@@ -21,10 +21,12 @@ class SignalHandler:
     def signal_handler(update: Update, context: CallbackContext):
         logger.info("General Signal command received")
         if len(context.args) < 2:
-            update.message.reply_text("Please provide both symbol and timeframe.")
+            queue_reply(update.message, "Please provide both symbol and timeframe.")
             return
 
-        symbol = context.args[0]
+        symbol = resolve_symbol_arg(update, context.args[0])
+        if symbol is None:
+            return
         timeframe = context.args[1]
 
         # Send a Loading message and tag it so we can delete it later
@@ -116,20 +118,23 @@ class SignalHandler:
             general_signal = "Neutral"
 
         # Send general signal message
-        update.message.reply_text(f"General Signal for {symbol}: {general_signal}")
+        queue_reply(update.message, f"General Signal for {symbol}: {general_signal}")
         # add reasoning for the signal here (explain the composite score and why it is bullish/bearish/neutral)
-        update.message.reply_text(
+        queue_reply(
+            update.message,
             "The general signal is based on the following indicators:"
         )
         # add the individual signals here and include the status of each indicator
-        update.message.reply_text(
+        queue_reply(
+            update.message,
             f"RSI: {rsi_status} (Current RSI: {latest_rsi})\n"
             f"OBV: {obv_status} (Current OBV: {latest_obv})\n"
             f"MFI: {mfi_status} (Current MFI: {latest_mfi})\n"
             f"{macd_status} (Current MACD hist: {latest_macd['histogram']})"
         )
         # Explain the composite score
-        update.message.reply_text(
+        queue_reply(
+            update.message,
             f"The composite score is {composite_score}.\n"
             "A positive composite score indicates a bullish signal.\n"
             "A negative composite score indicates a bearish signal.\n"
@@ -140,7 +145,8 @@ class SignalHandler:
         if (composite_score > 0 and obv_status == "falling") or (
             composite_score < 0 and obv_status == "rising"
         ):
-            update.message.reply_text(
+            queue_reply(
+                update.message,
                 "Warning: The OBV indicator does not confirm the general signal. This could indicate a less reliable signal."
             )
         # If there's a divergence between price and RSI, send a warning message
@@ -1,3 +1,4 @@
+import json
 import logging
 import requests
 import os
@@ -12,9 +13,11 @@ import ccxt
 from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import CallbackContext, CommandHandler
-from bot.utils import restricted, log_command_usage, PlotChart, command_usage_example
-from config.settings import X_RAPIDAPI_KEY
-from cachetools import cached, TTLCache
+from bot.utils import restricted, log_command_usage, PlotChart, command_usage_example, resolve_symbol_arg, queue_reply
+from config.settings import X_RAPIDAPI_KEY, CACHE_STALE_WINDOW, STATS_CACHE_MAX_BYTES
+from bot.candles import get_candle_store, to_array
+from bot.shared_candles import get_shared_candles
+from bot.candle_expiry import AlignedCache, aligned_cached, is_timeframe
 
 
 # Configure logging
@@ -23,29 +26,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize cache with a TTL of 4 hours
-cache = TTLCache(maxsize=100, ttl=14400)
+# Cache the technical study API responses until the next candle close of their timeframe, within
+# STATS_CACHE_MAX_BYTES of JSON (the candles are cached in shared memory, see SymbolOHLCVFetcher)
+cache = AlignedCache(maxsize=STATS_CACHE_MAX_BYTES, getsizeof=lambda data: len(json.dumps(data)), stale=CACHE_STALE_WINDOW)
 
 
-# Fetch ohlcv data using ccxt for the given symbol and timeframe. (cache the result for 4 hours for a given symbol and timeframe)
+# Fetch ohlcv data using ccxt for the given symbol and timeframe. The candles are shared by the
+# consumer processes of the host and refreshed by one of them after every candle close.
 class SymbolOHLCVFetcher:
     @staticmethod
-    @cached(cache)
     def fetch_ohlcv_data(symbol: str, timeframe: str):
-        exchange = ccxt.bybit()
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe)
+        candles = get_shared_candles().get_or_refresh(
+            "bybit", symbol, timeframe,
+            lambda: to_array(get_candle_store().candles("bybit", symbol, timeframe)),
+            stale=CACHE_STALE_WINDOW,
+        )
         df = pd.DataFrame(
-            ohlcv,
-            columns=["timestamp", "open", "high", "low", "close", "volume"],
+            {column: candles[column] for column in ["open", "high", "low", "close", "volume"]},
+            index=pd.to_datetime(candles["time"], unit="ms"),
         )
-        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-        df.set_index("timestamp", inplace=True)
+        df.index.name = "timestamp"
         return df
 
 
 class StatsHandler:
     @staticmethod
-    @cached(cache)
+    @aligned_cached(cache, timeframe=lambda symbol, endpoint, timeframe: timeframe)
     def fetch_data(symbol: str, endpoint: str, timeframe: str):
         url = f"https://cryptocurrencies-technical-study.p.rapidapi.com/crypto/{endpoint}/{symbol}/{timeframe}"
         headers = {
@@ -69,7 +75,7 @@ class StatsHandler:
 
     @staticmethod
     def send_patterns_message(update: Update, patterns_message: str):
-        update.message.reply_text(patterns_message)
+        queue_reply(update.message, patterns_message)
         logger.info("Patterns message sent")
 
     @staticmethod
@@ -181,11 +187,16 @@ class StatsHandler:
     def stats(update: Update, context: CallbackContext):
         logger.info("Stats command received")
         if len(context.args) < 2:
-            update.message.reply_text("Please provide both symbol and timeframe.")
+            queue_reply(update.message, "Please provide both symbol and timeframe.")
             return
 
-        symbol = context.args[0]
+        symbol = resolve_symbol_arg(update, context.args[0])
+        if symbol is None:
+            return
         timeframe = context.args[1]
+        if not is_timeframe(timeframe):
+            queue_reply(update.message, "Invalid timeframe. Please use a timeframe like 15m, 1h, 4h or 1d.")
+            return
 
         # Send a Loading message and tag it so we can delete it later
         loading_message = update.message.reply_text(
@@ -215,10 +226,11 @@ class StatsHandler:
                 rsi_status = "RSI oversold"
             else:
                 rsi_status = "RSI is in normal range"
-            update.message.reply_text(f"Latest RSI: {latest_rsi}. {rsi_status}")
+            queue_reply(update.message, f"Latest RSI: {latest_rsi}. {rsi_status}")
         else:
             logger.error("RSI data not found in API response")
-            update.message.reply_text(
+            queue_reply(
+                update.message,
                 "Unable to check RSI overbought/oversold status due to missing data"
             )
 
@@ -228,7 +240,7 @@ class StatsHandler:
         rsi_divergence = StatsHandler.check_rsi_divergence(
             symbol, timeframe, ohlcv_data
         )
-        update.message.reply_text(f"RSI Divergence: {rsi_divergence}")
+        queue_reply(update.message, f"RSI Divergence: {rsi_divergence}")
 
         # Fetch OBV data
         obv_data = StatsHandler.fetch_obv_data(symbol, "obv", timeframe)
@@ -242,13 +254,13 @@ class StatsHandler:
                 obv_status = "OBV is falling"
             else:
                 obv_status = "OBV is flat"
-            update.message.reply_text(f"Latest OBV: {latest_obv}. {obv_status}")
+            queue_reply(update.message, f"Latest OBV: {latest_obv}. {obv_status}")
 
         # OBV divergence
         obv_divergence = StatsHandler.check_obv_divergence(
             symbol, timeframe, ohlcv_data
         )
-        update.message.reply_text(f"OBV Divergence: {obv_divergence}")
+        queue_reply(update.message, f"OBV Divergence: {obv_divergence}")
 
         # Fetch MFI data
         mfi_data = StatsHandler.fetch_mfi_data(symbol, "mfi", timeframe)
@@ -261,7 +273,7 @@ class StatsHandler:
                 mfi_status = "MFI oversold"
             else:
                 mfi_status = "MFI is in normal range"
-            update.message.reply_text(f"Latest MFI: {latest_mfi}. {mfi_status}")
+            queue_reply(update.message, f"Latest MFI: {latest_mfi}. {mfi_status}")
 
         # Fetch MACD data
         macd_data = StatsHandler.fetch_macd_data(symbol, "macd", timeframe)
@@ -292,7 +304,7 @@ class StatsHandler:
             macd_status = "MACD histogram is flat"
 
         # send MACD status to user
-        update.message.reply_text(f"{macd_status}")
+        queue_reply(update.message, f"{macd_status}")
 
         # Update the loading message to indicate that the chart is being generated
         loading_message.edit_text("Generating chart...")
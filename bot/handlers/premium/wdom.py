@@ -3,7 +3,7 @@ from telegram import Update
 from telegram.ext import CallbackContext
 
 from config.settings import LUNARCRUSH_API_KEY
-from bot.utils import restricted
+from bot.utils import restricted, queue_message
 from bot.utils import log_command_usage
 import logging
 
@@ -68,7 +68,7 @@ class WdomHandler:
             for idx, coin in enumerate(dom):
                 message += f"{idx + 1}. Weekly {coin['name']} Dominance {coin['percent_change_7d']:.2f}%\n"
 
-            context.bot.send_message(chat_id=update.effective_chat.id, text=message)
+            queue_message(context.bot, update.effective_chat.id, message)
         except Exception as e:
             logger.error(f"Error handling /weekly_dom_change command: {e}")
-            context.bot.send_message(chat_id=update.effective_chat.id, text="Failed to fetch weekly dominance change.")
+            queue_message(context.bot, update.effective_chat.id, "Failed to fetch weekly dominance change.")
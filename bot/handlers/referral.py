@@ -4,6 +4,7 @@ from telegram.ext import CallbackContext
 from bot.database import Session, User, ReferralCodes, Referrals
 from sqlalchemy.exc import NoResultFound
 import logging
+from bot.utils import queue_reply
 
 # setup logger
 logging.basicConfig(
@@ -32,7 +33,7 @@ class UseReferralHandler:
 
         if not referral_code:
             logging.info("No referral code provided.")
-            update.message.reply_text("Please provide a referral code.")
+            queue_reply(update.message, "Please provide a referral code.")
             return
 
         logging.info(f"Referral code provided: {referral_code}")
@@ -53,12 +54,12 @@ class UseReferralHandler:
             user = session.query(User).filter_by(telegram_id=user_id).first()
             if not user:
                 logging.info(f"User not found in the database: id={user_id}, username={username}")
-                update.message.reply_text("User does not exist.")
+                queue_reply(update.message, "User does not exist.")
                 return
 
             if user.has_access:
                 logging.info(f"User already has access: id={user_id}, username={username}")
-                update.message.reply_text("You already have access to premium features and can't use a referral code.")
+                queue_reply(update.message, "You already have access to premium features and can't use a referral code.")
                 return
 
             logging.info(f"User found in the database: id={user.id}, telegram_id={user.telegram_id}, username={user.username}")
@@ -67,7 +68,7 @@ class UseReferralHandler:
             referrer = session.query(User).filter_by(id=referral.user_id).first()
             if not referrer:
                 logging.info(f"Referrer not found in the database: id={referral.user_id}")
-                update.message.reply_text("Referrer does not exist.")
+                queue_reply(update.message, "Referrer does not exist.")
                 return
 
             logging.info(f"Referrer found in the database: id={referrer.id}, telegram_id={referrer.telegram_id}, username={referrer.username}")
@@ -75,7 +76,7 @@ class UseReferralHandler:
             # Check if the user has already used a referral code
             if user.used_referral_code == USED_REFERRAL_CODE_YES:
                 logging.info(f"User has already used a referral code: id={user.id}, username={user.username}")
-                update.message.reply_text("You have already used a referral code.")
+                queue_reply(update.message, "You have already used a referral code.")
                 return
 
             logging.info(f"User has not used a referral code: id={user.id}, username={user.username}")
@@ -106,11 +107,11 @@ class UseReferralHandler:
 
             logging.info("Committed changes to the database.")
 
-            update.message.reply_text("Referral code accepted! You now have a free week of premium service.")
+            queue_reply(update.message, "Referral code accepted! You now have a free week of premium service.")
 
         except Exception as e:
             logging.error(f"An error occurred: {e}")
-            update.message.reply_text("Invalid referral code. Please try again.")
+            queue_reply(update.message, "Invalid referral code. Please try again.")
 
         finally:
             session.close()
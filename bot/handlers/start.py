@@ -2,6 +2,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
 
 from users.management import get_or_create_user, update_user_access, check_user_access
+from bot.utils import queue_reply
 
 
 class StartHandler:
@@ -30,7 +31,7 @@ class StartHandler:
                 "Type /help to explore the list of commands."
             )
 
-            update.message.reply_text(welcome_message)
+            queue_reply(update.message, welcome_message)
 
         # If the bot is not in open beta phase, show the subscribe button if the user is not subscribed
         elif not has_access:
@@ -47,7 +48,7 @@ class StartHandler:
             )
             keyboard = InlineKeyboardMarkup.from_button(subscribe_button)
 
-            update.message.reply_text(welcome_message, reply_markup=keyboard)
+            queue_reply(update.message, welcome_message, reply_markup=keyboard)
 
         # If the user is subscribed, send a welcome message with available commands
         else:
@@ -57,4 +58,4 @@ class StartHandler:
                 "Type /help to see the list of commands."
             )
 
-            update.message.reply_text(welcome_message)
+            queue_reply(update.message, welcome_message)
@@ -4,6 +4,7 @@ from users.management import get_or_create_user, update_user_access, revoke_user
 from config.settings import STRIPE_PROVIDER_TOKEN
 from datetime import datetime, timedelta
 import logging
+from bot.utils import queue_message, queue_reply
 
 # payment handler
 
@@ -53,7 +54,8 @@ class SubscribeHandler:
 
         # Display subscription options
         keyboard = InlineKeyboardMarkup.from_column(buttons)
-        update.effective_message.reply_text(
+        queue_reply(
+            update.effective_message,
             "Please choose a subscription plan:", reply_markup=keyboard
         )
 
@@ -83,8 +85,8 @@ class SubscribeHandler:
         logging.info(f"User {username} (ID: {user_id}) subscribed")
 
         # Confirm the payment
-        context.bot.send_message(
-            user_id, "Thank you for subscribing! You now have access to all features."
+        queue_message(
+            context.bot, user_id, "Thank you for subscribing! You now have access to all features."
         )
 
     def revoke_access(context: CallbackContext):
@@ -1,5 +1,6 @@
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, ConversationHandler, CallbackContext
+from bot.utils import queue_reply
 
 # Define global states
 CHOOSING, STOP_LOSS, TAKE_PROFIT, RISK_REWARD, POSITION_SIZE = range(5)
@@ -14,35 +15,40 @@ class RiskTool:
     @staticmethod
     def start(update: Update, context: CallbackContext) -> int:
         reply_keyboard = [['Stop Loss', 'Take Profit'], ['Risk/Reward', 'Position Size']]
-        update.message.reply_text(
+        queue_reply(
+            update.message,
             'What do you want to calculate?',
             reply_markup=ReplyKeyboardMarkup(reply_keyboard, one_time_keyboard=True),
         )
         return CHOOSING
 
     def stop_loss(self, update: Update, context: CallbackContext) -> int:
-        update.message.reply_text(
+        queue_reply(
+            update.message,
             'What is your entry price?',
             reply_markup=ReplyKeyboardRemove(),
         )
         return STOP_LOSS
 
     def take_profit(self, update: Update, context: CallbackContext) -> int:
-        update.message.reply_text(
+        queue_reply(
+            update.message,
             'What is your entry price?',
             reply_markup=ReplyKeyboardRemove(),
         )
         return TAKE_PROFIT
 
     def risk_reward(self, update: Update, context: CallbackContext) -> int:
-        update.message.reply_text(
+        queue_reply(
+            update.message,
             'What is your entry price?',
             reply_markup=ReplyKeyboardRemove(),
         )
         return RISK_REWARD
 
     def position_size(self, update: Update, context: CallbackContext) -> int:
-        update.message.reply_text(
+        queue_reply(
+            update.message,
             'What is your account size?',
             reply_markup=ReplyKeyboardRemove(),
         )
@@ -52,34 +58,35 @@ class RiskTool:
         self.entry_price = float(update.message.text)
         # Perform calculations for stop loss
         # ...
-        update.message.reply_text(f"Your stop loss price is: {self.stop_loss_price}")
+        queue_reply(update.message, f"Your stop loss price is: {self.stop_loss_price}")
         return ConversationHandler.END
 
     def calculate_take_profit(self, update: Update, context: CallbackContext) -> int:
         self.entry_price = float(update.message.text)
         # Perform calculations for take profit
         # ...
-        update.message.reply_text(f"Your take profit price is: {self.take_profit_price}")
+        queue_reply(update.message, f"Your take profit price is: {self.take_profit_price}")
         return ConversationHandler.END
 
     def calculate_risk_reward(self, update: Update, context: CallbackContext) -> int:
         self.entry_price = float(update.message.text)
         # Perform calculations for risk/reward
         # ...
-        update.message.reply_text("Your risk/reward ratio is: ...")
+        queue_reply(update.message, "Your risk/reward ratio is: ...")
         return ConversationHandler.END
 
     def calculate_position_size(self, update: Update, context: CallbackContext) -> int:
         self.account_size = float(update.message.text)
         # Perform calculations for position size
         # ...
-        update.message.reply_text("Your position size is: ...")
+        queue_reply(update.message, "Your position size is: ...")
         return ConversationHandler.END
 
     @staticmethod
     def done(update: Update, context: CallbackContext) -> int:
         user = update.message.from_user
-        update.message.reply_text(
+        queue_reply(
+            update.message,
             f"Thank you for using the risk tool, {user.first_name}!"
             " I hope we can talk again some day.",
             reply_markup=ReplyKeyboardRemove(),
@@ -0,0 +1,143 @@
+# Leader election for the recurring jobs of the consumer.
+#
+# Every job has a Postgres session-level advisory lock. The instance holding
+# it is the leader for that job; the others skip their runs. The locks live
+# on one dedicated connection, so they are released by Postgres as soon as
+# the leader process dies or its connection drops. Standby instances try to
+# take the locks every few seconds and the leader checks its connection on
+# the same cadence, so a dead leader is replaced within seconds.
+
+import hashlib
+import logging
+import threading
+
+import psycopg2
+
+from config.settings import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+def _connect():
+    # keepalives make a silently dropped connection fail within ~25s
+    return get_connection(keepalives=1, keepalives_idle=10, keepalives_interval=5, keepalives_count=3)
+
+
+class AdvisoryLeader:
+    """
+    Per-job leadership backed by Postgres advisory locks.
+
+    :param connect: Callable returning a new psycopg2 connection
+    :param namespace: Prefix hashed into the lock keys, so other apps sharing
+                      the database do not collide
+    """
+
+    def __init__(self, connect=_connect, namespace: str = "cryptosentinel"):
+        self.connect = connect
+        self.namespace = namespace
+        self._names = set()
+        self._held = set()
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def lock_key(self, name: str) -> int:
+        """Return the signed 64-bit advisory lock key of a job."""
+        digest = hashlib.blake2b(f"{self.namespace}:{name}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big", signed=True)
+
+    def register(self, name: str) -> None:
+        with self._lock:
+            self._names.add(name)
+
+    def is_leader(self, name: str) -> bool:
+        """Return True if this instance leads the job, trying to become leader if not."""
+        with self._lock:
+            if name in self._held:
+                return True
+            try:
+                self._try_acquire(name)
+            except psycopg2.Error as e:
+                self._lost(e)
+            return name in self._held
+
+    def elect(self) -> None:
+        """Check the connection of the locks held and try to take the others."""
+        with self._lock:
+            try:
+                if self._held:
+                    with self._connection.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                for name in self._names - self._held:
+                    self._try_acquire(name)
+            except psycopg2.Error as e:
+                self._lost(e)
+
+    def _try_acquire(self, name: str) -> None:
+        if self._connection is None or self._connection.closed:
+            self._connection = self.connect()
+            self._connection.autocommit = True
+        with self._connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_key(name),))
+            if cursor.fetchone()[0]:
+                self._held.add(name)
+                logger.info(f"Became leader for job {name}")
+
+    def _lost(self, error) -> None:
+        if self._held:
+            logger.error(f"Lost leadership of {sorted(self._held)}: {error}")
+        else:
+            logger.warning(f"Could not run leader election: {error}")
+        self._held.clear()
+        self._close()
+
+    def _close(self) -> None:
+        try:
+            if self._connection is not None and not self._connection.closed:
+                self._connection.close()
+        except psycopg2.Error:
+            pass  # Ignore errors when closing a broken connection
+        self._connection = None
+
+    def release(self, name: str) -> None:
+        """Give up one lock, so another instance can take it."""
+        with self._lock:
+            if name not in self._held:
+                return
+            self._held.discard(name)
+            try:
+                with self._connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (self.lock_key(name),))
+                logger.info(f"Released {name}")
+            except psycopg2.Error as e:
+                self._lost(e)
+
+    def holders(self, names) -> set:
+        """Return the names whose lock is held by any instance (this one included)."""
+        keys = {self.lock_key(name): name for name in names}
+        with self._lock:
+            try:
+                if self._connection is None or self._connection.closed:
+                    self._connection = self.connect()
+                    self._connection.autocommit = True
+                with self._connection.cursor() as cursor:
+                    # a bigint advisory key is split into classid (high) and objid (low 32 bits)
+                    cursor.execute(
+                        "SELECT (classid::bigint << 32) | objid::bigint FROM pg_locks"
+                        " WHERE locktype = 'advisory' AND objsubid = 1 AND granted"
+                        " AND database = (SELECT oid FROM pg_database WHERE datname = current_database())"
+                    )
+                    rows = cursor.fetchall()
+            except psycopg2.Error as e:
+                self._lost(e)
+                return set(self._held) & set(keys.values())
+        return {keys[key] for (key,) in rows if key in keys}
+
+    def held(self) -> set:
+        with self._lock:
+            return set(self._held)
+
+    def release_all(self) -> None:
+        """Give up every lock (closing the session releases them)."""
+        with self._lock:
+            self._held.clear()
+            self._close()
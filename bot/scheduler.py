@@ -0,0 +1,176 @@
+# Recurring background jobs of the consumer (subscription expiry, price alerts).
+#
+# One APScheduler BackgroundScheduler runs every job on its own thread pool,
+# off the message-processing threads. A job never overlaps with itself
+# (max_instances=1): a tick that finds the previous run still busy is skipped
+# and counted, runs missed while the process was busy are coalesced into one.
+# Every job records its run durations, errors, skipped and missed runs.
+# With a leader (see bot/leader.py) only the instance leading a job runs it,
+# so several consumer processes can share the jobs.
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+import pytz
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+)
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.schedulers.background import BackgroundScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class JobStats:
+    """Run metrics of one job."""
+
+    def __init__(self):
+        self.runs = 0
+        self.errors = 0
+        self.skipped = 0  # ticks dropped because the previous run was still busy
+        self.missed = 0  # ticks that could not start within the grace time
+        self.standby = 0  # ticks left to the instance leading the job
+        self.last_duration = None
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+
+    def record_run(self, duration: float) -> None:
+        self.runs += 1
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        self.total_duration += duration
+
+    def as_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "missed": self.missed,
+            "standby": self.standby,
+            "last_duration": self.last_duration,
+            "max_duration": self.max_duration,
+            "avg_duration": self.total_duration / self.runs if self.runs else None,
+        }
+
+
+class JobScheduler:
+    """
+    Runs recurring jobs on a background thread pool.
+
+    :param workers: Number of job threads (jobs of different kinds run concurrently)
+    :param stats_interval: Seconds between job metric log lines, or None to disable
+    :param leader: Optional AdvisoryLeader. Jobs then only run on the instance
+                   leading them
+    :param election_interval: Seconds between leader elections (how fast a
+                              standby takes over from a dead leader)
+    """
+
+    def __init__(self, workers: int = 4, stats_interval: float = 900, leader=None, election_interval: float = 5):
+        self._scheduler = BackgroundScheduler(
+            executors={"default": ThreadPoolExecutor(max_workers=workers)},
+            job_defaults={"max_instances": 1, "coalesce": True},
+            timezone=pytz.utc,
+        )
+        self._scheduler.add_listener(
+            self._on_event, EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES
+        )
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.leader = leader
+        if leader is not None:
+            self._scheduler.add_job(
+                leader.elect, "interval", seconds=election_interval, id="leader-election"
+            )
+        if stats_interval:
+            self._scheduler.add_job(
+                self.log_stats, "interval", seconds=stats_interval, id="job-stats"
+            )
+
+    def add_interval_job(self, fn, seconds: float, job_id: str = None, jitter: float = None,
+                         run_now: bool = True, misfire_grace_time: float = None) -> None:
+        """
+        Run ``fn`` every ``seconds``.
+
+        :param fn: The job, called without arguments
+        :param seconds: Interval between two runs
+        :param job_id: Name used in logs and metrics (defaults to the function name)
+        :param jitter: Random delay of up to this many seconds added to every run,
+                       so jobs of several processes do not fire together
+        :param run_now: Run once right away instead of after the first interval
+        :param misfire_grace_time: Seconds a run may start late before it counts
+                                   as missed (defaults to the interval)
+        """
+        job_id = job_id or fn.__name__
+        with self._lock:
+            self._stats[job_id] = JobStats()
+        if self.leader is not None:
+            self.leader.register(job_id)
+        self._scheduler.add_job(
+            self._timed,
+            "interval",
+            args=(job_id, fn),
+            seconds=seconds,
+            jitter=jitter,
+            id=job_id,
+            misfire_grace_time=misfire_grace_time or max(int(seconds), 1),
+            next_run_time=datetime.now(pytz.utc) if run_now else None,
+        )
+
+    def _timed(self, job_id: str, fn) -> None:
+        if self.leader is not None and not self.leader.is_leader(job_id):
+            with self._lock:
+                self._stats[job_id].standby += 1
+            return
+
+        start = time.monotonic()
+        try:
+            fn()
+        finally:
+            duration = time.monotonic() - start
+            with self._lock:
+                self._stats[job_id].record_run(duration)
+            logger.debug(f"Job {job_id} took {duration:.2f}s")
+
+    def _on_event(self, event) -> None:
+        with self._lock:
+            stats = self._stats.get(event.job_id)
+            if stats is None:
+                return
+            if event.code == EVENT_JOB_ERROR:
+                stats.errors += 1
+            elif event.code == EVENT_JOB_MISSED:
+                stats.missed += 1
+            elif event.code == EVENT_JOB_MAX_INSTANCES:
+                stats.skipped += 1
+
+        if event.code == EVENT_JOB_ERROR:
+            logger.error(f"Job {event.job_id} failed: {event.exception!r}")
+        elif event.code == EVENT_JOB_MISSED:
+            logger.warning(f"Job {event.job_id} missed its run at {event.scheduled_run_time}")
+        else:
+            logger.warning(f"Job {event.job_id} is still running, skipping this run")
+
+    def stats(self) -> dict:
+        """Return the metrics of every job, keyed by job id."""
+        with self._lock:
+            return {job_id: stats.as_dict() for job_id, stats in self._stats.items()}
+
+    def log_stats(self) -> None:
+        for job_id, stats in self.stats().items():
+            logger.info(f"Job {job_id}: {stats}")
+
+    def start(self) -> None:
+        self._scheduler.start()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop scheduling new runs and (optionally) wait for running jobs."""
+        if self._scheduler.running:
+            self._scheduler.shutdown(wait=wait)
+        if self.leader is not None:
+            # hand the jobs over to another instance right away
+            self.leader.release_all()
+        self.log_stats()
@@ -0,0 +1,103 @@
+# Adaptive check cadence of the price alert symbols.
+#
+# A symbol is checked again after the time its price needs, at its recent
+# volatility, to cover the distance to its nearest alert. With the 1m ATR as
+# the typical move per minute and a random walk, covering d takes about
+# (d / ATR)^2 minutes; a safety factor keeps the estimate on the early side:
+#
+#   interval = clamp((distance / (safety * ATR))^2 minutes, min_interval, max_interval)
+#
+# A BTC alert 0.1% away at 0.1% ATR is checked every few seconds, one 40% away
+# every max_interval. Crossings between two checks still trigger (candle
+# high/low, see alert_engine.py), so a longer interval only delays the alert.
+# Symbols without a volatility estimate or a placed alert are checked every
+# min_interval.
+
+# True range period of the ATR, in 1m candles
+ATR_PERIOD = 14
+
+
+def average_true_range(candles, period: int = ATR_PERIOD):
+    """
+    Return the ATR of ``[timestamp, open, high, low, close, volume]`` candles relative
+    to the last close, or None with fewer than ``period + 1`` candles.
+    """
+    if len(candles) < period + 1:
+        return None
+    candles = candles[-(period + 1):]
+    total = 0.0
+    for previous, candle in zip(candles, candles[1:]):
+        high, low, close = candle[2], candle[3], previous[4]
+        total += max(high - low, abs(high - close), abs(low - close))
+    last_close = candles[-1][4]
+    return total / period / last_close if last_close else None
+
+
+class AlertCadence:
+    """
+    Per-symbol next check times.
+
+    :param min_interval: Shortest interval between two checks of a symbol, in seconds
+    :param max_interval: Longest interval, in seconds
+    :param safety: How many ATRs the price may move before the next check
+    :param volatility_ttl: Seconds a volatility estimate is used before it is refreshed
+    """
+
+    def __init__(self, min_interval: float = 5, max_interval: float = 300, safety: float = 3.0,
+                 volatility_ttl: float = 900):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.safety = safety
+        self.volatility_ttl = volatility_ttl
+        self._next = {}
+        # symbol -> (ATR relative to the price, time it was measured)
+        self._volatility = {}
+
+    def due(self, symbols, now: float) -> list:
+        """Return the symbols to check at ``now`` (seconds)."""
+        return [symbol for symbol in symbols if self._next.get(symbol, 0) <= now]
+
+    def next_check(self, symbol: str):
+        return self._next.get(symbol)
+
+    def reset(self, symbol: str) -> None:
+        """Check a symbol on the next run (it got a new alert)."""
+        self._next.pop(symbol, None)
+
+    def needs_volatility(self, symbol: str, now: float) -> bool:
+        measured = self._volatility.get(symbol)
+        return measured is None or now - measured[1] >= self.volatility_ttl
+
+    def set_volatility(self, symbol: str, atr, now: float) -> None:
+        if atr is not None:
+            self._volatility[symbol] = (atr, now)
+
+    def interval(self, symbol: str, distance) -> float:
+        """
+        Return the seconds until the next check of a symbol.
+
+        :param distance: Distance of the price to the nearest alert trigger,
+                         relative to the price, or None when unknown
+        """
+        measured = self._volatility.get(symbol)
+        if distance is None or measured is None:
+            return self.min_interval
+        atr = measured[0]
+        if distance <= 0:
+            return self.min_interval
+        if atr <= 0:
+            return self.max_interval
+        minutes = (distance / (self.safety * atr)) ** 2
+        return min(self.max_interval, max(self.min_interval, minutes * 60))
+
+    def schedule(self, symbol: str, now: float, distance) -> float:
+        """Set the next check of a symbol checked at ``now``. Returns the interval."""
+        interval = self.interval(symbol, distance)
+        self._next[symbol] = now + interval
+        return interval
+
+    def forget(self, symbols) -> None:
+        """Drop the state of symbols without alerts."""
+        for symbol in symbols:
+            self._next.pop(symbol, None)
+            self._volatility.pop(symbol, None)
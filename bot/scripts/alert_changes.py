@@ -0,0 +1,172 @@
+# Change feed of the price_alert_requests table.
+#
+# Every write of an alert (the /set_alert and /remove_alert handlers, and the
+# alert engine deleting triggered alerts) sends a NOTIFY on the price_alerts channel
+# in the same transaction, so it is delivered exactly when the write commits.
+# AlertListener keeps a LISTEN connection open and hands the received changes
+# to the alert engine, which then never has to query the table between its
+# periodic checksum reconciliations (see alert_engine.py).
+# The indicator_alert_requests table has the same feed on the indicator_alerts
+# channel, followed by the indicator alert engine (see indicator_alerts.py).
+#
+# Payloads:
+#   {"op": "add", "id": 7, "user_id": 42, "symbol": "BTCUSDT", "price_level": "31000"}
+#   {"op": "add", "id": 9, "user_id": 42, "symbol": "BTCUSDT", "kind": "rsi", "timeframe": "1h",
+#    "period": 14, "threshold": "30.0000", "timestamp": "2024-03-13T10:17:00"}
+#   {"op": "remove", "ids": [7, 8]}
+
+import json
+import logging
+import select
+from decimal import ROUND_HALF_UP, Decimal
+
+import psycopg2
+from sqlalchemy import text
+
+from bot.database import IndicatorAlertRequest, PriceAlertRequest
+from config.settings import get_connection
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "price_alerts"
+INDICATOR_CHANNEL = "indicator_alerts"
+
+ADD = "add"
+REMOVE = "remove"
+
+# smallest step of the price_level column (Numeric(20, 2))
+LEVEL_QUANTUM = Decimal(1).scaleb(-PriceAlertRequest.__table__.c.price_level.type.scale)
+# smallest step of the threshold column (Numeric(20, 4))
+THRESHOLD_QUANTUM = Decimal(1).scaleb(-IndicatorAlertRequest.__table__.c.threshold.type.scale)
+
+
+def _connect():
+    # keepalives make a silently dropped connection fail within ~25s
+    return get_connection(keepalives=1, keepalives_idle=10, keepalives_interval=5, keepalives_count=3)
+
+
+def _notify(session, payload: dict, channel: str = CHANNEL) -> None:
+    # only Postgres has LISTEN/NOTIFY, elsewhere the engine falls back to polling
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": channel, "payload": json.dumps(payload)})
+
+
+def stored_level(price_level) -> Decimal:
+    """Return a price level as the price_level column stores it (rounded half away from zero, like Postgres)."""
+    return Decimal(str(price_level)).quantize(LEVEL_QUANTUM, rounding=ROUND_HALF_UP)
+
+
+def notify_added(session, alert) -> None:
+    """Announce a new alert. Call before the commit (the alert needs its id, flush first)."""
+    _notify(session, {
+        "op": ADD,
+        "id": alert.id,
+        "user_id": alert.user_id,
+        "symbol": alert.symbol,
+        # the level the table has, the engine reconciles with its checksum
+        "price_level": str(stored_level(alert.price_level)),
+    })
+
+
+def notify_removed(session, alert_ids, channel: str = CHANNEL) -> None:
+    """Announce removed alerts. Call before the commit."""
+    alert_ids = list(alert_ids)
+    # NOTIFY payloads are limited to 8000 bytes
+    for i in range(0, len(alert_ids), 500):
+        _notify(session, {"op": REMOVE, "ids": alert_ids[i:i + 500]}, channel)
+
+
+def notify_indicator_added(session, alert) -> None:
+    """Announce a new indicator alert. Call before the commit (flush first, for its id and timestamp)."""
+    _notify(session, {
+        "op": ADD,
+        "id": alert.id,
+        "user_id": alert.user_id,
+        "symbol": alert.symbol,
+        "kind": alert.kind,
+        "timeframe": alert.timeframe,
+        "period": alert.period,
+        "threshold": str(Decimal(str(alert.threshold)).quantize(THRESHOLD_QUANTUM, rounding=ROUND_HALF_UP)),
+        "timestamp": alert.timestamp.isoformat(),
+    }, INDICATOR_CHANNEL)
+
+
+def notify_indicator_removed(session, alert_ids) -> None:
+    """Announce removed indicator alerts. Call before the commit."""
+    notify_removed(session, alert_ids, INDICATOR_CHANNEL)
+
+
+class AlertListener:
+    """
+    Receives the alert changes on a dedicated LISTEN connection.
+
+    :param connect: Callable returning a new psycopg2 connection
+    :param channel: The NOTIFY channel
+    """
+
+    def __init__(self, connect=_connect, channel: str = CHANNEL):
+        self.connect = connect
+        self.channel = channel
+        self._connection = None
+
+    @property
+    def listening(self) -> bool:
+        return self._connection is not None and not self._connection.closed
+
+    def listen(self) -> bool:
+        """Open the LISTEN connection unless it is open. Returns whether it is."""
+        if self.listening:
+            return True
+        try:
+            connection = self.connect()
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+        except psycopg2.Error as e:
+            logger.warning(f"Could not listen for alert changes on {self.channel}: {e!r}")
+            return False
+        self._connection = connection
+        logger.info(f"Listening for alert changes on {self.channel}")
+        return True
+
+    def poll(self, timeout: float = 0):
+        """
+        Return the changes received since the previous poll.
+
+        :param timeout: Seconds to wait for a first notification
+        :return: A list of change dicts, or None when changes may have been
+                 missed (not listening before, connection lost) and the
+                 table must be reloaded
+        """
+        if not self.listening:
+            self.listen()
+            return None
+
+        try:
+            if timeout and not self._connection.notifies:
+                select.select([self._connection], [], [], timeout)
+            self._connection.poll()
+        except (psycopg2.Error, OSError) as e:
+            logger.warning(f"Alert listener connection on {self.channel} lost: {e!r}")
+            self.close()
+            self.listen()
+            return None
+
+        changes = []
+        for notify in self._connection.notifies:
+            try:
+                changes.append(json.loads(notify.payload))
+            except ValueError:
+                logger.warning(f"Ignoring malformed alert change on {self.channel}: {notify.payload!r}")
+        self._connection.notifies.clear()
+        return changes
+
+    def close(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except psycopg2.Error:
+                pass
+            self._connection = None
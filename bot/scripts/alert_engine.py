@@ -0,0 +1,418 @@
+# Price alert engine.
+#
+# Keeps every pending PriceAlertRequest in an AlertIndex (see alert_index.py)
+# and checks them against one batched ticker fetch per cycle:
+# - with an AlertListener the table is loaded once and then follows the
+#   LISTEN/NOTIFY change feed (see alert_changes.py); every resync_interval
+#   seconds a checksum query reconciles the index and reloads it on mismatch
+# - without one, new rows (id above the highest indexed id) are loaded every
+#   cycle, a full resync every resync_interval seconds drops removed alerts
+# - prices of all indexed symbols come from fetch_tickers on a long-lived
+#   exchange client
+# - the high and low of the 1m candles since the previous check are fed
+#   too, so a level crossed and left between two checks still triggers and
+#   the check interval can be long. Alerts placed at the previous check only
+#   see the candles that opened after it (the one open at the check may have
+#   traded past their level before they were placed)
+# - with an AlertCadence every symbol has its own interval, from the distance
+#   to its nearest alert and its volatility (see alert_cadence.py): the check
+#   runs often but only fetches the symbols that are due
+# - triggered alerts are deleted in one DELETE ... RETURNING statement and
+#   only the rows that were still there are notified, so an alert removed
+#   since the last resync is never sent. The notifications are all queued on
+#   the outbound scheduler at once; the rows of the ones that could not be
+#   sent are put back and trigger again
+
+import logging
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+import ccxt
+from sqlalchemy import delete, func
+
+from bot.database import PriceAlertRequest, Session
+from bot.exchanges import get_exchange
+from bot.scripts.alert_cadence import ATR_PERIOD, average_true_range
+from bot.scripts.alert_changes import notify_removed
+from bot.scripts.alert_index import PRICE_SCALE, AlertIndex
+from bot.send_scheduler import UNDELIVERABLE, send_all
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_markets(exchange, symbols) -> dict:
+    """
+    Resolve stored alert symbols to ccxt markets.
+
+    :param exchange: The ccxt exchange client
+    :param symbols: Symbols as stored in the alerts (market ids like BTCUSDT or unified symbols)
+    :return: A dict of symbol -> market. Unknown symbols are left out
+    """
+    exchange.load_markets()
+    markets = {}
+    for symbol in symbols:
+        try:
+            markets[symbol] = exchange.market(symbol)
+        except ccxt.BadSymbol:
+            logger.warning(f"Skipping alerts for unknown symbol {symbol}")
+    return markets
+
+
+def fetch_prices(exchange, symbols) -> dict:
+    """
+    Fetch the last price of many symbols with one fetch_tickers call per market type.
+
+    :param exchange: The ccxt exchange client
+    :param symbols: Symbols as stored in the alerts (market ids like BTCUSDT or unified symbols)
+    :return: A dict of symbol -> last price (Decimal). Unknown symbols are left out
+    """
+    # group the unified symbols by market type (bybit only returns tickers of one type per call)
+    unified_by_type = {}
+    for symbol, market in resolve_markets(exchange, symbols).items():
+        unified_by_type.setdefault(market["type"], {})[market["symbol"]] = symbol
+
+    prices = {}
+    for unified in unified_by_type.values():
+        tickers = exchange.fetch_tickers(list(unified))
+        for unified_symbol, symbol in unified.items():
+            ticker = tickers.get(unified_symbol)
+            if ticker and ticker.get("last") is not None:
+                prices[symbol] = Decimal(str(ticker["last"]))
+    return prices
+
+
+def fetch_candles(exchange, since: dict) -> dict:
+    """
+    Fetch the 1m candles of every symbol from its own start time.
+
+    :param exchange: The ccxt exchange client
+    :param since: symbol -> start time in ms. The candle open at that time is included
+    :return: A dict of symbol -> ``[timestamp, open, high, low, close, volume]`` rows.
+             Symbols whose candles could not be fetched are left out
+    """
+    now = exchange.milliseconds()
+    candles = {}
+    for symbol, market in resolve_markets(exchange, since).items():
+        start = since[symbol] - since[symbol] % 60000
+        limit = min(1000, int((now - start) // 60000) + 2)
+        try:
+            rows = exchange.fetch_ohlcv(market["symbol"], "1m", since=start, limit=limit)
+        except ccxt.BaseError as e:
+            # the last price still catches the crossings that hold until now
+            logger.warning(f"Could not fetch the candles of {symbol}: {e!r}")
+            continue
+        candles[symbol] = [row for row in rows if row[0] >= start]
+    return candles
+
+
+def candle_range(candles, since: int):
+    """
+    Return the ``(high, low)`` traded since a time (ms) as Decimals, or None without candles.
+
+    The candle open at ``since`` is included, so the range may reach up to a
+    minute before it. ``candle_range(candles, next_minute(since))`` is surely after it.
+    """
+    since -= since % 60000
+    candles = [candle for candle in candles if candle[0] >= since]
+    if not candles:
+        return None
+    return (
+        Decimal(str(max(candle[2] for candle in candles))),
+        Decimal(str(min(candle[3] for candle in candles))),
+    )
+
+
+def next_minute(since: int) -> int:
+    """Return the open time (ms) of the first 1m candle that opens after ``since``."""
+    return since - since % 60000 + 60000
+
+
+class AlertRow(namedtuple("AlertRow", "id user_id symbol price_level")):
+    """An alert row received as a change notification."""
+
+
+class AlertChanges:
+    """
+    What one load found, applied to the index by ``AlertEngine.apply``.
+
+    :param rows: Alert rows to index
+    :param removed: Ids of removed alerts
+    :param full: ``rows`` is the whole table, every other alert is dropped
+    :param checksum: The table checksum to reconcile the index with, or None
+    """
+
+    __slots__ = ("rows", "removed", "full", "checksum")
+
+    def __init__(self, rows=(), removed=(), full: bool = False, checksum=None):
+        self.rows = rows
+        self.removed = removed
+        self.full = full
+        self.checksum = checksum
+
+
+class AlertEngine:
+    """
+    Checks the pending price alerts.
+
+    :param exchange: The ccxt exchange client prices are fetched from
+    :param tolerance: Relative distance to the level that counts as reached
+    :param resync_interval: Seconds between reconciliations with the alert table
+                            (a checksum with a listener, a full reload without)
+    :param session_factory: Creates database sessions
+    :param listener: Optional AlertListener (see alert_changes.py). The table is
+                     then loaded once and kept up to date from notifications
+    :param cadence: Optional AlertCadence (see alert_cadence.py). Every check then
+                    only fetches the symbols that are due
+    :param shards: Optional ShardCoordinator (see alert_shards.py). Only the alerts
+                   of the symbols in the owned shards are indexed, ownership is
+                   rebalanced on every load
+    """
+
+    def __init__(self, exchange=None, tolerance=Decimal("0.005"), resync_interval: float = 600,
+                 session_factory=Session, listener=None, cadence=None, shards=None):
+        self.exchange = exchange or get_exchange("bybit")
+        self.index = AlertIndex(tolerance)
+        self.resync_interval = resync_interval
+        self.session_factory = session_factory
+        self.listener = listener
+        self._max_id = 0
+        self._last_resync = None
+        # set when the index no longer matches the table checksum
+        self._reload = False
+        self.cadence = cadence
+        self.shards = shards
+        # symbol -> exchange time (ms) of its previous check
+        self._checked = {}
+
+    def owns(self, symbol: str) -> bool:
+        return self.shards is None or self.shards.owns(symbol)
+
+    def table_checksum(self, session) -> tuple:
+        """Return ``(count, sum of ids, sum of levels)`` of the alerts this engine owns."""
+        count, id_sum, level_sum = 0, 0, Decimal(0)
+        for symbol, symbol_count, symbol_ids, symbol_levels in session.query(
+            PriceAlertRequest.symbol,
+            func.count(PriceAlertRequest.id),
+            func.sum(PriceAlertRequest.id),
+            func.sum(PriceAlertRequest.price_level),
+        ).group_by(PriceAlertRequest.symbol):
+            if self.owns(symbol):
+                count += int(symbol_count)
+                id_sum += int(symbol_ids)
+                level_sum += Decimal(str(symbol_levels))
+        return count, id_sum, level_sum
+
+    def load(self, session) -> AlertChanges:
+        """Read what changed in the alert table since the previous load."""
+        if self.shards is not None and self.shards.rebalance():
+            # alerts of the new shards are only in the table
+            self._reload = True
+
+        now = time.monotonic()
+        due = self._last_resync is None or now - self._last_resync >= self.resync_interval or self._reload
+
+        if self.listener is not None:
+            if self._last_resync is not None and not self._reload:
+                # the checksum is taken first: changes committed after it are in the notifications
+                checksum = self.table_checksum(session) if due else None
+                received = self.listener.poll()
+                if received is not None:
+                    if due:
+                        self._last_resync = now
+                    return self.changes(received, checksum)
+                logger.warning("Price alert changes may have been missed, reloading the alerts")
+            # listen before the load, so no change falls in between
+            self.listener.listen()
+            due = True
+
+        query = session.query(
+            PriceAlertRequest.id,
+            PriceAlertRequest.user_id,
+            PriceAlertRequest.symbol,
+            PriceAlertRequest.price_level,
+        )
+        if due:
+            self._last_resync = now
+            self._reload = False
+            return AlertChanges(rows=query.all(), full=True)
+        return AlertChanges(rows=query.filter(PriceAlertRequest.id > self._max_id).all())
+
+    @staticmethod
+    def changes(received: list, checksum=None) -> AlertChanges:
+        """Turn received change notifications into AlertChanges."""
+        rows, removed = [], []
+        for change in received:
+            if change.get("op") == "add":
+                rows.append(AlertRow(change["id"], change["user_id"], change["symbol"], Decimal(change["price_level"])))
+            elif change.get("op") == "remove":
+                removed.extend(change["ids"])
+        return AlertChanges(rows=rows, removed=removed, checksum=checksum)
+
+    def apply(self, changes: AlertChanges) -> None:
+        """Apply loaded changes to the index."""
+        ids = set()
+        for row in changes.rows:
+            self._max_id = max(self._max_id, row.id)
+            if not self.owns(row.symbol):
+                continue
+            ids.add(row.id)
+            record = self.index.get(row.id)
+            # an indexed alert whose row differs (e.g. a level announced unrounded) is replaced
+            if record is None or record.symbol != row.symbol or record.price_level != Decimal(str(row.price_level)):
+                self.index.add(row.id, row.user_id, row.symbol, row.price_level)
+                if self.cadence is not None:
+                    # the new alert may be close to the price
+                    self.cadence.reset(row.symbol)
+
+        if changes.full:
+            for alert_id in self.index.alert_ids() - ids:
+                self.index.remove(alert_id)
+        for alert_id in changes.removed:
+            self.index.remove(alert_id)
+
+        if changes.checksum is not None and changes.checksum != self.index.checksum():
+            logger.warning(f"Price alert index {self.index.checksum()} does not match the table {changes.checksum}, reloading")
+            self._reload = True
+
+    def sync(self, session) -> None:
+        """Bring the index up to date with the alert table."""
+        self.apply(self.load(session))
+
+    def evaluate(self, prices: dict, ranges: dict = None, recent: dict = None) -> list:
+        """
+        Feed prices to the index and return the triggered alert records.
+
+        :param prices: symbol -> last price
+        :param ranges: symbol -> (high, low) traded since the previous check
+        :param recent: symbol -> (high, low) of the candles that opened after the previous
+                       check (None where there are none), the range of the alerts placed at it
+        """
+        triggered = []
+        for symbol, price in prices.items():
+            if ranges and symbol in ranges:
+                high, low = ranges[symbol]
+                recent_range = None
+                if recent is not None:
+                    # without candles after the previous check, alerts placed at it only see the price
+                    recent_range = recent.get(symbol) or (price, price)
+                triggered.extend(self.index.on_range(symbol, high, low, price, recent_range))
+            else:
+                triggered.extend(self.index.on_price(symbol, price))
+        return triggered
+
+    def deliver(self, session, bot, triggered: list) -> int:
+        """
+        Delete the triggered rows and notify the ones that still existed.
+
+        The notifications go out side by side. The rows of the ones that failed
+        (other than for chats that are gone) are put back, so they trigger again.
+        Returns the number of alerts sent.
+        """
+        if not triggered:
+            return 0
+
+        # claim the rows: another worker deleting them too gets none back
+        deleted = set(
+            session.execute(
+                delete(PriceAlertRequest)
+                .where(PriceAlertRequest.id.in_([record.alert_id for record in triggered]))
+                .returning(PriceAlertRequest.id)
+            ).scalars()
+        )
+        session.commit()
+        claimed = [record for record in triggered if record.alert_id in deleted]
+        if not claimed:
+            return 0
+
+        errors = send_all(bot, [(record.user_id, self.notification(record)) for record in claimed])
+        failed = []
+        for record, error in zip(claimed, errors):
+            if error is None:
+                continue
+            logger.warning(f"Could not send price alert {record.alert_id} to {record.user_id}: {error!r}")
+            if not isinstance(error, UNDELIVERABLE):
+                failed.append(record)
+
+        if failed:
+            # their removal was never announced: the other workers still index them
+            session.add_all([
+                PriceAlertRequest(id=record.alert_id, user_id=record.user_id, symbol=record.symbol,
+                                  price_level=record.price_level)
+                for record in failed
+            ])
+            self.index.restore(failed)
+        removed = deleted - {record.alert_id for record in failed}
+        if removed:
+            notify_removed(session, sorted(removed))
+        session.commit()
+        return errors.count(None)
+
+    def notification(self, record) -> str:
+        price = self.index.last_price(record.symbol)
+        return f"🔔 Price Alert! 🔔\n\nThe price of {record.symbol} has reached your set level of {record.price_level}. The current price is now: {self.format_price(price)}."
+
+    @staticmethod
+    def format_price(scaled: int) -> str:
+        return format((Decimal(scaled) / PRICE_SCALE).normalize(), "f")
+
+    def check(self, bot) -> int:
+        """Run one alert cycle. Returns the number of alerts sent."""
+        session = self.session_factory()
+        try:
+            self.sync(session)
+            symbols = self.index.symbols()
+            if not symbols:
+                return 0
+
+            now_ms = self.exchange.milliseconds()
+            now = now_ms / 1000
+            for symbol in set(self._checked) - set(symbols):
+                del self._checked[symbol]
+                if self.cadence is not None:
+                    self.cadence.forget([symbol])
+            due = self.cadence.due(symbols, now) if self.cadence is not None else symbols
+            if not due:
+                return 0
+
+            # candles are needed where a price was seen before, to cross from,
+            # and for the volatility estimates of the cadence
+            since, refresh = {}, set()
+            for symbol in due:
+                checked = self._checked.get(symbol) if self.index.last_price(symbol) is not None else None
+                if self.cadence is not None and self.cadence.needs_volatility(symbol, now):
+                    refresh.add(symbol)
+                    since[symbol] = min(checked or now_ms, now_ms - (ATR_PERIOD + 1) * 60000)
+                elif checked is not None:
+                    since[symbol] = checked
+
+            ranges, recent = {}, {}
+            for symbol, candles in (fetch_candles(self.exchange, since) if since else {}).items():
+                if symbol in refresh:
+                    self.cadence.set_volatility(symbol, average_true_range(candles), now)
+                checked = self._checked.get(symbol)
+                if checked is not None and self.index.last_price(symbol) is not None:
+                    range_ = candle_range(candles, checked)
+                    if range_ is not None:
+                        ranges[symbol] = range_
+                        recent[symbol] = candle_range(candles, next_minute(checked))
+
+            prices = fetch_prices(self.exchange, due)
+            for symbol in due:
+                self._checked[symbol] = now_ms
+
+            triggered = self.evaluate(prices, ranges, recent)
+            try:
+                sent = self.deliver(session, bot, triggered)
+            except Exception:
+                # they trigger again on the next check
+                self.index.restore(triggered)
+                raise
+            if self.cadence is not None:
+                for symbol in due:
+                    self.cadence.schedule(symbol, now, self.index.nearest_distance(symbol))
+            if sent:
+                logger.info(f"Triggered {sent} of {len(self.index) + sent} price alerts on {len(due)} of {len(symbols)} symbols")
+            return sent
+        finally:
+            session.close()
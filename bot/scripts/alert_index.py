@@ -0,0 +1,311 @@
+# In-memory index of the price alert levels of every symbol.
+#
+# Each symbol keeps two sides, depending on where the level was relative to
+# the price when the alert was indexed:
+# - above: triggers once the price rises to the level (minus the tolerance)
+# - below: triggers once the price falls to the level (plus the tolerance)
+# Both sides are sorted integer arrays ordered so that the triggered alerts
+# are always a suffix: a tick costs one bisect plus the triggered alerts,
+# O(log n + k), instead of a pass over every alert.
+#
+# Since the sides are relative to the last price, an alert triggers on any
+# crossing between two prices, however far the second one is past the level.
+# on_range extends that to the high and low traded in between.
+# A new alert waits until the next price to be placed: the last price may be
+# stale by then, and the crossing or range fed with the next price may be from
+# before the alert was set. It is placed against that price and only triggers
+# if it is already within the tolerance, like on the first price of a symbol.
+# On the range after that, it only sees the ``recent`` part of the range (the
+# candles that opened after it was placed).
+#
+# Prices are scaled to integers (PRICE_SCALE) so the arrays hold machine
+# integers and comparisons are exact.
+
+from array import array
+from bisect import bisect_left, bisect_right
+from decimal import ROUND_FLOOR, Decimal
+
+PRICE_SCALE = 10 ** 8
+# tolerances are applied in parts per million, in integer arithmetic
+PPM = 10 ** 6
+
+
+def to_scaled(price, rounding=ROUND_FLOOR) -> int:
+    """Convert a price (float, str or Decimal) to an integer in 1e-8 units."""
+    return int((Decimal(str(price)) * PRICE_SCALE).to_integral_value(rounding))
+
+
+class AlertRecord:
+    """One indexed alert."""
+
+    __slots__ = ("alert_id", "user_id", "symbol", "price_level", "scaled_level", "side", "key")
+
+    def __init__(self, alert_id: int, user_id: int, symbol: str, price_level: Decimal):
+        self.alert_id = alert_id
+        self.user_id = user_id
+        self.symbol = symbol
+        self.price_level = price_level
+        self.scaled_level = to_scaled(price_level)
+        self.side = None
+        self.key = None
+
+    def __repr__(self):
+        return f"AlertRecord({self.alert_id}, {self.symbol}, {self.price_level})"
+
+
+class SortedSide:
+    """
+    Parallel arrays of ascending keys and alert ids.
+
+    Keys are chosen so that the triggered alerts of a tick are the suffix
+    starting at ``bisect_left(keys, bound)``.
+    """
+
+    __slots__ = ("keys", "ids")
+
+    def __init__(self):
+        self.keys = array("q")
+        self.ids = array("q")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def insert(self, key: int, alert_id: int) -> None:
+        # equal keys are ordered by alert id, so (key, id) pairs are unique
+        i = bisect_left(self.keys, key)
+        hi = bisect_right(self.keys, key, i)
+        i += bisect_left(self.ids[i:hi], alert_id) if hi > i else 0
+        self.keys.insert(i, key)
+        self.ids.insert(i, alert_id)
+
+    def insert_many(self, pairs) -> None:
+        """Insert ``(key, alert_id)`` pairs, merging big batches in one sort."""
+        if len(pairs) < 64:
+            for key, alert_id in pairs:
+                self.insert(key, alert_id)
+            return
+        merged = sorted(list(zip(self.keys, self.ids)) + list(pairs))
+        self.keys = array("q", [key for key, _ in merged])
+        self.ids = array("q", [alert_id for _, alert_id in merged])
+
+    def remove(self, key: int, alert_id: int) -> bool:
+        lo = bisect_left(self.keys, key)
+        hi = bisect_right(self.keys, key, lo)
+        for i in range(lo, hi):
+            if self.ids[i] == alert_id:
+                del self.keys[i]
+                del self.ids[i]
+                return True
+        return False
+
+    def pop_from(self, bound: int) -> array:
+        """Remove and return the ids of every key >= bound."""
+        i = bisect_left(self.keys, bound)
+        ids = self.ids[i:]
+        del self.keys[i:]
+        del self.ids[i:]
+        return ids
+
+
+class SymbolAlerts:
+    """Above and below sides of one symbol."""
+
+    __slots__ = ("above", "below", "pending", "placed", "last_price")
+
+    def __init__(self):
+        # above keys are the negated trigger price: a higher price triggers a longer suffix
+        self.above = SortedSide()
+        # below keys are the trigger price: a lower price triggers a longer suffix
+        self.below = SortedSide()
+        # alerts indexed since the previous price of the symbol
+        self.pending = []
+        # alerts placed on the last price
+        self.placed = ()
+        self.last_price = None
+
+    def __len__(self):
+        return len(self.above) + len(self.below) + len(self.pending)
+
+
+class AlertIndex:
+    """
+    Per-symbol price alert index.
+
+    An alert triggers when the price comes within ``tolerance`` (relative) of
+    its level, from whichever side the price started.
+
+    :param tolerance: Relative distance to the level that counts as reached
+    """
+
+    def __init__(self, tolerance: Decimal = Decimal("0.005")):
+        self.tolerance = Decimal(tolerance)
+        self._tolerance_ppm = int(self.tolerance * PPM)
+        self._symbols = {}
+        self._records = {}
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, alert_id) -> bool:
+        return alert_id in self._records
+
+    def get(self, alert_id: int):
+        """Return the record of an indexed alert, or None."""
+        return self._records.get(alert_id)
+
+    def alert_ids(self) -> set:
+        return set(self._records)
+
+    def symbols(self) -> list:
+        """Symbols with at least one indexed alert."""
+        return [symbol for symbol, alerts in self._symbols.items() if len(alerts)]
+
+    def checksum(self) -> tuple:
+        """Return ``(count, sum of ids, sum of levels)`` of the indexed alerts."""
+        return (
+            len(self._records),
+            sum(self._records),
+            sum((record.price_level for record in self._records.values()), Decimal(0)),
+        )
+
+    def last_price(self, symbol: str):
+        alerts = self._symbols.get(symbol)
+        return alerts.last_price if alerts is not None else None
+
+    def nearest_distance(self, symbol: str):
+        """
+        Return the distance of the last price to the nearest alert trigger,
+        relative to the price, or None without a price or placed alerts.
+        """
+        alerts = self._symbols.get(symbol)
+        if alerts is None or not alerts.last_price or alerts.pending:
+            return None
+        price = alerts.last_price
+        distances = []
+        if len(alerts.above):
+            distances.append(-alerts.above.keys[-1] - price)
+        if len(alerts.below):
+            distances.append(price - alerts.below.keys[-1])
+        return min(distances) / price if distances else None
+
+    def add(self, alert_id: int, user_id: int, symbol: str, price_level) -> AlertRecord:
+        """Index an alert (replacing an indexed alert with the same id)."""
+        if alert_id in self._records:
+            self.remove(alert_id)
+
+        record = AlertRecord(alert_id, user_id, symbol, Decimal(str(price_level)))
+        self._records[alert_id] = record
+        # placed against the next price, the last one may be from before the alert
+        self._symbols.setdefault(symbol, SymbolAlerts()).pending.append(record)
+        return record
+
+    def remove(self, alert_id: int):
+        """Drop an alert from the index. Returns its record, or None."""
+        record = self._records.pop(alert_id, None)
+        if record is None:
+            return None
+        alerts = self._symbols[record.symbol]
+        if record.side is None:
+            alerts.pending.remove(record)
+        else:
+            getattr(alerts, record.side).remove(record.key, alert_id)
+        return record
+
+    def restore(self, records) -> None:
+        """
+        Put triggered records back on the side they triggered from (after a failed delivery).
+
+        Placing them again against the last price would put them on the other
+        side of their level, so they keep their side and key and trigger again
+        on the next price at or past their level. A record indexed again in the
+        meantime is replaced.
+        """
+        for record in records:
+            if record.alert_id in self._records:
+                self.remove(record.alert_id)
+            self._records[record.alert_id] = record
+            alerts = self._symbols.setdefault(record.symbol, SymbolAlerts())
+            getattr(alerts, record.side).insert(record.key, record.alert_id)
+
+    def _place(self, alerts: SymbolAlerts, records, price: int) -> None:
+        """Put records on the side of ``price`` their level is on."""
+        above, below = [], []
+        for record in records:
+            level = record.scaled_level
+            if level > price:
+                # triggers once price >= ceil(level * (1 - tolerance)), the key is its negation
+                record.side = "above"
+                record.key = (level * (self._tolerance_ppm - PPM)) // PPM
+                above.append((record.key, record.alert_id))
+            else:
+                # triggers once price <= floor(level * (1 + tolerance))
+                record.side = "below"
+                record.key = (level * (PPM + self._tolerance_ppm)) // PPM
+                below.append((record.key, record.alert_id))
+        alerts.above.insert_many(above)
+        alerts.below.insert_many(below)
+
+    def on_price(self, symbol: str, price) -> list:
+        """
+        Feed a price of a symbol.
+
+        :param symbol: The symbol the alerts were set on
+        :param price: The price (float, str or Decimal)
+        :return: The triggered alert records, removed from the index
+        """
+        return self.on_scaled_price(symbol, to_scaled(price))
+
+    def on_range(self, symbol: str, high, low, last, recent=None) -> list:
+        """
+        Feed the high, low and last price a symbol traded at since its previous price.
+
+        Every level crossed within the range triggers, even when the price is
+        back on the other side by now. The first price of a symbol has nothing
+        to cross from and is fed as ``last`` only. Alerts indexed since the
+        previous price are only placed against ``last``: the range may be from
+        before they were set.
+
+        :param recent: ``(high, low)`` of the part of the range that is surely after
+                       the previous price, by default the whole range. Alerts placed
+                       on the previous price only see this part
+        :return: The triggered alert records, removed from the index
+        """
+        last = to_scaled(last)
+        alerts = self._symbols.get(symbol)
+        if alerts is None or alerts.last_price is None:
+            return self.on_scaled_price(symbol, last)
+
+        pending, alerts.pending = alerts.pending, []
+        placed = []
+        if recent is not None:
+            placed = [record for record in alerts.placed if self._records.get(record.alert_id) is record]
+        for record in placed:
+            getattr(alerts, record.side).remove(record.key, record.alert_id)
+        triggered = self.on_scaled_price(symbol, max(to_scaled(high), last))
+        triggered.extend(self.on_scaled_price(symbol, min(to_scaled(low), last)))
+        for record in placed:
+            getattr(alerts, record.side).insert(record.key, record.alert_id)
+        if placed:
+            recent_high, recent_low = recent
+            triggered.extend(self.on_scaled_price(symbol, max(to_scaled(recent_high), last)))
+            triggered.extend(self.on_scaled_price(symbol, min(to_scaled(recent_low), last)))
+        alerts.pending = pending
+        triggered.extend(self.on_scaled_price(symbol, last))
+        return triggered
+
+    def on_scaled_price(self, symbol: str, scaled: int) -> list:
+        """Same as ``on_price`` with a price already scaled by ``to_scaled``."""
+        alerts = self._symbols.get(symbol)
+        if alerts is None:
+            return []
+
+        alerts.last_price = scaled
+        if alerts.pending:
+            alerts.placed, alerts.pending = alerts.pending, []
+            self._place(alerts, alerts.placed, scaled)
+        else:
+            alerts.placed = ()
+
+        ids = list(alerts.above.pop_from(-scaled))
+        ids.extend(alerts.below.pop_from(scaled))
+        return [self._records.pop(alert_id) for alert_id in ids]
@@ -0,0 +1,108 @@
+# Partitioning of the price alerts over alert worker processes.
+#
+# Symbols are hashed into a fixed number of shards (jump hash, like the
+# update queues in bot/broker/sharding.py). Every alert worker (see
+# alert_worker.py) evaluates the alerts of the shards it owns, with its own
+# price fetching and notification sending. Ownership is a Postgres advisory
+# lock per shard (see bot/leader.py):
+# - every worker also holds one member slot lock, so the live workers can be
+#   counted from pg_locks
+# - on every rebalance a worker aims for ceil(shards / workers) shards: it
+#   releases the extra ones when workers joined and takes free ones when
+#   workers died (their locks are released with their sessions)
+# A shard that changes hands is picked up within one rebalance interval.
+# Triggered alerts are deleted with DELETE ... RETURNING before they are
+# sent, so a shard briefly evaluated by two workers never notifies twice.
+
+import hashlib
+import logging
+import math
+
+from bot.broker.sharding import jump_hash
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(symbol: str, shards: int) -> int:
+    """Return the shard of a symbol."""
+    digest = hashlib.blake2b(symbol.encode("utf-8"), digest_size=8).digest()
+    return jump_hash(int.from_bytes(digest, "big"), shards)
+
+
+class ShardCoordinator:
+    """
+    Shard ownership of one alert worker.
+
+    :param leader: The AdvisoryLeader holding the locks
+    :param shards: Number of shards
+    :param max_workers: Number of member slots (the most workers that can share the shards)
+    :param prefix: Prefix of the lock names
+    """
+
+    def __init__(self, leader, shards: int = 16, max_workers: int = 64, prefix: str = "price-alerts"):
+        self.leader = leader
+        self.shards = shards
+        self.prefix = prefix
+        self.members = [f"{prefix}.member.{slot}" for slot in range(max_workers)]
+        self.shard_names = [f"{prefix}.shard.{shard}" for shard in range(shards)]
+        self.member = None
+        self._owned = frozenset()
+
+    def owned(self) -> frozenset:
+        return self._owned
+
+    def owns(self, symbol: str) -> bool:
+        return shard_of(symbol, self.shards) in self._owned
+
+    def _join(self) -> bool:
+        if self.member in self.leader.held():
+            return True
+        self.member = None
+        for name in self.members:
+            if self.leader.is_leader(name):
+                self.member = name
+                logger.info(f"Joined the alert workers as {name}")
+                return True
+        logger.warning("No free alert worker slot")
+        return False
+
+    def rebalance(self) -> bool:
+        """
+        Release or take shards towards this worker's fair share.
+
+        :return: True when the owned shards changed
+        """
+        held = self.leader.held()
+        owned = {shard for shard, name in enumerate(self.shard_names) if name in held}
+
+        if self._join():
+            workers = max(1, len(self.leader.holders(self.members)))
+            target = math.ceil(self.shards / workers)
+
+            # give up the last ones first, so the share of a worker stays stable
+            for shard in sorted(owned, reverse=True)[:max(0, len(owned) - target)]:
+                self.leader.release(self.shard_names[shard])
+                owned.discard(shard)
+
+            if len(owned) < target:
+                # start at a slot dependent shard, so joining workers try different locks
+                start = self.members.index(self.member) * target
+                for i in range(self.shards):
+                    shard = (start + i) % self.shards
+                    if len(owned) >= target:
+                        break
+                    if shard not in owned and self.leader.is_leader(self.shard_names[shard]):
+                        owned.add(shard)
+        else:
+            for shard in owned:
+                self.leader.release(self.shard_names[shard])
+            owned = set()
+
+        # the connection may have dropped in between, taking every lock with it
+        held = self.leader.held()
+        owned = frozenset(shard for shard in owned if self.shard_names[shard] in held)
+        changed = owned != self._owned
+        if changed:
+            logger.info(f"Alert worker {self.member} owns shards {sorted(owned)} of {self.shards}")
+        self._owned = owned
+        return changed
@@ -0,0 +1,250 @@
+# Streaming price alerts.
+#
+# Instead of polling tickers every PRICE_ALERT_INTERVAL seconds, AlertStreamer
+# feeds every price update of a feed into the AlertEngine's index, so a level
+# is caught as soon as a trade reaches it (also wicks that are gone by the
+# next poll).
+# - ExchangeTradeFeed watches the trade stream of every symbol with alerts
+#   over the exchange WebSocket (ccxt.pro). Between two reads of the consumer
+#   the trades of a symbol are coalesced to their high and low, so a slow
+#   consumer never loses an extreme and memory stays bounded.
+# - ReplayFeed replays recorded prices from a file, for tests and backtests.
+# The alert table is synced every sync_interval seconds and the feed is
+# resubscribed when the set of symbols with alerts changes. Database work
+# runs on an executor thread; the index is only touched on the event loop.
+
+import asyncio
+import csv
+import json
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ExchangeTradeFeed:
+    """
+    Trade prices from an exchange WebSocket.
+
+    One watch_trades subscription per symbol (bybit has no multi-symbol watch
+    in ccxt.pro).
+
+    :param exchange: A ccxt.pro exchange client
+    :param max_backoff: Longest wait in seconds before resubscribing a failed stream
+    """
+
+    def __init__(self, exchange, max_backoff: float = 60):
+        self.exchange = exchange
+        self.max_backoff = max_backoff
+        self._tasks = {}
+        # symbol -> [high, low] of the trades not read yet
+        self._pending = {}
+        self._ready = asyncio.Event()
+        self._markets_loaded = False
+
+    def symbols(self) -> set:
+        return set(self._tasks)
+
+    async def subscribe(self, symbols) -> None:
+        """Watch exactly ``symbols`` (stored alert symbols, market ids or unified)."""
+        if not self._markets_loaded:
+            await self.exchange.load_markets()
+            self._markets_loaded = True
+
+        symbols = set(symbols)
+        for symbol in set(self._tasks) - symbols:
+            self._tasks.pop(symbol).cancel()
+            self._pending.pop(symbol, None)
+        for symbol in symbols - set(self._tasks):
+            try:
+                unified = self.exchange.market(symbol)["symbol"]
+            except Exception as e:
+                logger.warning(f"Not streaming {symbol}: {e!r}")
+                continue
+            self._tasks[symbol] = asyncio.ensure_future(self._watch(symbol, unified))
+        logger.info(f"Streaming trades of {len(self._tasks)} symbols")
+
+    async def _watch(self, symbol: str, unified: str) -> None:
+        failures = 0
+        while True:
+            try:
+                trades = await self.exchange.watch_trades(unified)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                delay = min(self.max_backoff, 2 ** failures) * random.uniform(0.5, 1)
+                logger.warning(f"Trade stream of {symbol} failed ({e!r}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            failures = 0
+            prices = [trade["price"] for trade in trades if trade.get("price") is not None]
+            if not prices:
+                continue
+            high, low = max(prices), min(prices)
+            pending = self._pending.get(symbol)
+            if pending is None:
+                self._pending[symbol] = [high, low]
+            else:
+                pending[0] = max(pending[0], high)
+                pending[1] = min(pending[1], low)
+            self._ready.set()
+
+    async def updates(self):
+        """Yield ``(symbol, price)`` for the high and the low of the new trades of every symbol."""
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            pending, self._pending = self._pending, {}
+            for symbol, (high, low) in pending.items():
+                yield symbol, high
+                if low != high:
+                    yield symbol, low
+
+    async def close(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        await self.exchange.close()
+
+
+class ReplayFeed:
+    """
+    Prices replayed from a file, one update per line:
+
+        CSV:         timestamp,symbol,price        (timestamp in ms, optional header)
+        JSON lines:  {"timestamp": ..., "symbol": ..., "price": ...}
+
+    Only the subscribed symbols are yielded; the feed ends with the file.
+
+    :param path: The file to replay
+    :param speed: Replay speed relative to the recorded timestamps (2 = twice as
+                  fast), or None to replay without waiting
+    """
+
+    def __init__(self, path: str, speed: float = None):
+        self.path = path
+        self.speed = speed
+        self._symbols = set()
+
+    def symbols(self) -> set:
+        return set(self._symbols)
+
+    async def subscribe(self, symbols) -> None:
+        self._symbols = set(symbols)
+
+    @staticmethod
+    def parse_line(line: str):
+        """Return ``(timestamp, symbol, price)`` of a line, or None for blank lines and headers."""
+        line = line.strip()
+        if not line:
+            return None
+        if line.startswith("{"):
+            data = json.loads(line)
+            return data.get("timestamp"), data["symbol"], str(data["price"])
+        timestamp, symbol, price = next(csv.reader([line]))
+        if timestamp == "timestamp":
+            return None
+        return int(timestamp) if timestamp else None, symbol, price
+
+    async def updates(self):
+        first_ts = start = None
+        with open(self.path) as f:
+            for line in f:
+                parsed = self.parse_line(line)
+                if parsed is None:
+                    continue
+                timestamp, symbol, price = parsed
+
+                if self.speed and timestamp is not None:
+                    if first_ts is None:
+                        first_ts, start = timestamp, time.monotonic()
+                    delay = (timestamp - first_ts) / 1000 / self.speed - (time.monotonic() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                else:
+                    # let the sync task run between updates
+                    await asyncio.sleep(0)
+
+                if symbol in self._symbols:
+                    yield symbol, price
+
+    async def close(self) -> None:
+        pass
+
+
+class AlertStreamer:
+    """
+    Checks the price alerts of an AlertEngine on every update of a feed.
+
+    :param engine: The AlertEngine holding the alert index
+    :param feed: An ExchangeTradeFeed or ReplayFeed
+    :param bot: Sends the notifications
+    :param sync_interval: Seconds between reads of new alerts from the database
+    """
+
+    def __init__(self, engine, feed, bot, sync_interval: float = 5):
+        self.engine = engine
+        self.feed = feed
+        self.bot = bot
+        self.sync_interval = sync_interval
+        self.sent = 0
+
+    def _load(self):
+        session = self.engine.session_factory()
+        try:
+            return self.engine.load(session)
+        finally:
+            session.close()
+
+    def _deliver(self, triggered: list) -> int:
+        session = self.engine.session_factory()
+        try:
+            return self.engine.deliver(session, self.bot, triggered)
+        finally:
+            session.close()
+
+    async def sync(self) -> None:
+        """Load new alerts and resubscribe the feed if the alert symbols changed."""
+        loop = asyncio.get_running_loop()
+        changes = await loop.run_in_executor(None, self._load)
+        self.engine.apply(changes)
+
+        symbols = set(self.engine.index.symbols())
+        if symbols != self.feed.symbols():
+            await self.feed.subscribe(symbols)
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Could not sync price alerts: {e!r}")
+
+    async def run(self) -> int:
+        """Stream until the feed ends (or the task is cancelled). Returns the number of alerts sent."""
+        loop = asyncio.get_running_loop()
+        await self.sync()
+        sync_task = asyncio.ensure_future(self._sync_loop())
+        try:
+            async for symbol, price in self.feed.updates():
+                triggered = self.engine.index.on_price(symbol, price)
+                if not triggered:
+                    continue
+                try:
+                    sent = await loop.run_in_executor(None, self._deliver, triggered)
+                except Exception as e:
+                    # put them back, the next update of the symbol triggers them again
+                    logger.error(f"Could not deliver {len(triggered)} price alerts: {e!r}")
+                    self.engine.index.restore(triggered)
+                    continue
+                self.sent += sent
+                if sent:
+                    logger.info(f"Triggered {sent} price alerts on {symbol} at {price}")
+        finally:
+            sync_task.cancel()
+            await self.feed.close()
+        return self.sent
@@ -1,11 +1,19 @@
-import ccxt
-from decimal import Decimal
-
 from telegram.ext import CallbackContext
 from telegram.error import BadRequest
 
 # setup database
-from bot.database import PriceAlertRequest, Session, PatternData, User
+from bot.database import Session, PatternData, User
+from bot.scripts.alert_cadence import AlertCadence
+from bot.scripts.alert_changes import INDICATOR_CHANNEL, AlertListener
+from bot.scripts.alert_engine import AlertEngine
+from bot.scripts.indicator_alerts import IndicatorAlertEngine
+from config.settings import (
+    ALERT_CADENCE,
+    ALERT_MAX_INTERVAL,
+    ALERT_MIN_INTERVAL,
+    ALERT_NOTIFY,
+    ALERT_RESYNC_INTERVAL,
+)
 
 # setup logging
 import logging
@@ -14,33 +22,36 @@ logger = logging.getLogger(__name__)
 
 
 class PriceAlerts:
+    # Long-lived alert engine (index, exchange client) shared by every check
+    engine = None
+
     @staticmethod
-    def check_price_alerts(bot):
-        session = Session()
-        price_alert_requests = session.query(PriceAlertRequest).all()
+    def get_engine() -> AlertEngine:
+        if PriceAlerts.engine is None:
+            PriceAlerts.engine = AlertEngine(
+                resync_interval=ALERT_RESYNC_INTERVAL,
+                listener=AlertListener() if ALERT_NOTIFY else None,
+                cadence=AlertCadence(ALERT_MIN_INTERVAL, ALERT_MAX_INTERVAL) if ALERT_CADENCE else None,
+            )
+        return PriceAlerts.engine
 
-        to_delete = []
-        for price_alert_request in price_alert_requests:
-            exchange = ccxt.bybit()
-            ticker = exchange.fetch_ticker(price_alert_request.symbol)
-            current_price = ticker["last"]
+    @staticmethod
+    def check_price_alerts(bot):
+        PriceAlerts.get_engine().check(bot)
 
-            # If the current price is within 0.5% of the price alert request, send a message to the user
-            if current_price >= price_alert_request.price_level * Decimal(
-                "0.995"
-            ) and current_price <= price_alert_request.price_level * Decimal("1.005"):
-                bot.send_message(
-                    chat_id=price_alert_request.user_id,
-                    text=f"🔔 Price Alert! 🔔\n\nThe price of {price_alert_request.symbol} has reached your set level of {price_alert_request.price_level}. The current price is now: {current_price}.",
-                )
 
-                # Add the price alert request to the list of requests to be deleted
-                to_delete.append(price_alert_request)
+class IndicatorAlerts:
+    # Long-lived engine (alerts, candle and indicator cache) shared by every check
+    engine = None
 
-        # Delete all the price alert requests in the list
-        for alert in to_delete:
-            session.delete(alert)
-        session.commit()
+    @staticmethod
+    def check_indicator_alerts(bot):
+        if IndicatorAlerts.engine is None:
+            IndicatorAlerts.engine = IndicatorAlertEngine(
+                listener=AlertListener(channel=INDICATOR_CHANNEL) if ALERT_NOTIFY else None,
+                resync_interval=ALERT_RESYNC_INTERVAL,
+            )
+        IndicatorAlerts.engine.check(bot)
 
 
 
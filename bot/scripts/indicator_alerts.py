@@ -0,0 +1,423 @@
+# Indicator alerts: alerts on a computed value instead of a price level.
+#
+#   move  the close moved by at least `threshold` percent (either way) over
+#         the last `period` candles, e.g. 24 x 1h = the 24h move
+#   rsi   RSI(`period`) crosses `threshold` (either way), e.g. RSI(14) 30 on 1h
+#   sma   the close crosses SMA(`period`) (either way), e.g. SMA50 on 4h
+#
+# Alerts are evaluated on closed candles. Every (symbol, timeframe) is
+# read once per candle close, however many alerts use it, every
+# (symbol, timeframe, kind, period) indicator is computed once from those
+# candles, and all alerts are then compared against their indicator value
+# in one vectorized pass, so 10,000 alerts cost about one indicator
+# computation per symbol.
+# The candles come from the series shared by the processes of the host and the
+# candle store, so a series /stats or a chart already has is not fetched again.
+# The alerts are kept in memory: loaded once, then kept up to date through the
+# indicator_alerts change feed, with a checksum query every resync_interval
+# seconds (see alert_changes.py). Without the feed only new rows are read every
+# cycle and the table is reloaded every resync_interval seconds.
+
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+
+import ccxt
+import numpy as np
+from sqlalchemy import delete, func
+
+from bot.candles import get_candle_store, to_array
+from bot.database import IndicatorAlertRequest, Session
+from bot.exchanges import get_exchange
+from bot.scripts.alert_changes import ADD, REMOVE, notify_indicator_removed
+from bot.shared_candles import get_shared_candles
+from bot.send_scheduler import UNDELIVERABLE, send_all
+from config.settings import CANDLE_DEFAULT_LIMIT
+
+logger = logging.getLogger(__name__)
+
+MOVE = "move"
+RSI = "rsi"
+SMA = "sma"
+KINDS = (MOVE, RSI, SMA)
+
+# kinds that trigger when the value crosses the threshold between two closes
+CROSSING_KINDS = (RSI, SMA)
+
+# RSI smoothing needs more candles than its period to settle
+RSI_WARMUP = 10
+
+# what /set_indicator_alert accepts
+TIMEFRAMES = ("5m", "15m", "1h", "4h", "1d")
+RSI_PERIOD = 14
+RSI_TIMEFRAME = "1h"
+SMA_TIMEFRAME = "4h"
+# the move alert covers 24h: 24 x 1h candles
+MOVE_TIMEFRAME, MOVE_PERIOD = "1h", 24
+
+
+def rsi(closes: np.ndarray, period: int = 14) -> np.ndarray:
+    """Wilder's RSI of closes (NaN until ``period`` changes are known)."""
+    values = np.full(len(closes), np.nan)
+    if len(closes) <= period:
+        return values
+    changes = np.diff(closes)
+    gains = np.clip(changes, 0, None)
+    losses = np.clip(-changes, 0, None)
+
+    avg_gain = gains[:period].mean()
+    avg_loss = losses[:period].mean()
+    for i in range(period, len(changes) + 1):
+        if i > period:
+            avg_gain = (avg_gain * (period - 1) + gains[i - 1]) / period
+            avg_loss = (avg_loss * (period - 1) + losses[i - 1]) / period
+        values[i] = 100.0 if avg_loss == 0 else 100 - 100 / (1 + avg_gain / avg_loss)
+    return values
+
+
+def sma(closes: np.ndarray, period: int) -> np.ndarray:
+    """Simple moving average of closes (NaN until ``period`` closes are known)."""
+    values = np.full(len(closes), np.nan)
+    if len(closes) >= period:
+        sums = np.cumsum(np.insert(closes, 0, 0.0))
+        values[period - 1:] = (sums[period:] - sums[:-period]) / period
+    return values
+
+
+def history(kind: str, period: int) -> int:
+    """Closed candles an indicator needs for its last two values."""
+    if kind == RSI:
+        return period * RSI_WARMUP + 2
+    return period + 2
+
+
+def indicator(kind: str, period: int, closes: np.ndarray) -> tuple:
+    """
+    Return the ``(previous, last)`` value of an indicator over closes.
+
+    ``move`` has no previous value (NaN): it triggers on its level, not on a crossing.
+    """
+    if kind == MOVE:
+        if len(closes) <= period:
+            return np.nan, np.nan
+        return np.nan, abs(closes[-1] / closes[-1 - period] - 1) * 100
+    if kind == RSI:
+        values = rsi(closes, period)
+    else:
+        values = closes - sma(closes, period)
+    if len(values) < 2:
+        return np.nan, np.nan
+    return values[-2], values[-1]
+
+
+def triggered(previous: np.ndarray, last: np.ndarray, thresholds: np.ndarray, crossing: np.ndarray,
+              eligible: np.ndarray) -> np.ndarray:
+    """
+    Return the mask of triggered alerts, one element per alert.
+
+    :param previous: Indicator value at the previous close
+    :param last: Indicator value at the last close
+    :param thresholds: Level of every alert
+    :param crossing: True where the alert triggers on a crossing, False on a level
+    :param eligible: False where a crossing happened before the alert was created
+    """
+    with np.errstate(invalid="ignore"):
+        crossed = ((previous < thresholds) & (last >= thresholds)) | ((previous > thresholds) & (last <= thresholds))
+        reached = last >= thresholds
+    return np.where(crossing, crossed & eligible, reached)
+
+
+def parse_alert(args) -> tuple:
+    """
+    Parse the arguments of /set_indicator_alert.
+
+        <symbol> move <percent>             24h move of at least percent
+        <symbol> rsi <level> [timeframe]    RSI(14) crosses level (default 1h)
+        <symbol> sma <period> [timeframe]   close crosses SMA(period) (default 4h)
+
+    :return: ``(symbol, kind, timeframe, period, threshold)``
+    :raises ValueError: With a message for the user
+    """
+    if len(args) < 3:
+        raise ValueError("Please enter a symbol, an alert type (move, rsi or sma) and a value.")
+    symbol, kind, value = args[0].upper(), args[1].lower(), args[2]
+    if kind not in KINDS:
+        raise ValueError("Invalid alert type. Choose move, rsi or sma.")
+    try:
+        value = Decimal(value)
+    except InvalidOperation:
+        value = None
+    if value is None or not value.is_finite():
+        raise ValueError(f"Invalid value {args[2]}.")
+    timeframe = args[3] if len(args) > 3 else (RSI_TIMEFRAME if kind == RSI else SMA_TIMEFRAME)
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"Invalid timeframe. Available timeframes: {', '.join(TIMEFRAMES)}")
+
+    if kind == MOVE:
+        if value <= 0:
+            raise ValueError("The move must be a positive percentage.")
+        return symbol, kind, MOVE_TIMEFRAME, MOVE_PERIOD, value
+    if kind == RSI:
+        if not 0 < value < 100:
+            raise ValueError("The RSI level must be between 0 and 100.")
+        return symbol, kind, timeframe, RSI_PERIOD, value
+    if value != value.to_integral_value() or not 2 <= value <= 200:
+        raise ValueError("The SMA period must be a whole number between 2 and 200.")
+    return symbol, kind, timeframe, int(value), Decimal(0)
+
+
+def describe(alert) -> str:
+    """Describe an alert in words ("RSI(14) of BTCUSDT crossed 30 on 1h")."""
+    if alert.kind == MOVE:
+        return f"{alert.symbol} moved {alert.threshold.normalize()}% over {alert.period} x {alert.timeframe}"
+    if alert.kind == RSI:
+        return f"RSI({alert.period}) of {alert.symbol} crossed {alert.threshold.normalize()} on {alert.timeframe}"
+    return f"{alert.symbol} crossed its SMA{alert.period} on {alert.timeframe}"
+
+
+class IndicatorAlertRow(namedtuple("IndicatorAlertRow", "id user_id symbol kind timeframe period threshold timestamp")):
+    """An indicator alert, as loaded from the table or received as a change notification."""
+
+    @classmethod
+    def from_change(cls, change: dict) -> "IndicatorAlertRow":
+        return cls(change["id"], change["user_id"], change["symbol"], change["kind"], change["timeframe"],
+                   change["period"], Decimal(change["threshold"]), datetime.fromisoformat(change["timestamp"]))
+
+
+class IndicatorAlertEngine:
+    """
+    Checks the indicator alerts.
+
+    :param exchange: The ccxt exchange client (clock and timeframes)
+    :param session_factory: Creates database sessions
+    :param listener: Optional AlertListener on INDICATOR_CHANNEL (see alert_changes.py).
+                     The table is then loaded once and kept up to date from notifications
+    :param resync_interval: Seconds between reconciliations with the table (a checksum
+                            with a listener, a full reload without)
+    :param store: The CandleStore candles are read from
+    :param shared: The SharedCandles the series are shared through
+    :param exchange_name: The exchange the candles are read from
+    """
+
+    def __init__(self, exchange=None, session_factory=Session, listener=None, resync_interval: float = 600,
+                 store=None, shared=None, exchange_name: str = "bybit"):
+        self.exchange = exchange or get_exchange(exchange_name)
+        self.session_factory = session_factory
+        self.listener = listener
+        self.resync_interval = resync_interval
+        self.store = store or get_candle_store()
+        self.shared = shared or get_shared_candles()
+        self.exchange_name = exchange_name
+        # id -> IndicatorAlertRow of every pending alert
+        self.alerts = {}
+        self._max_id = 0
+        self._last_resync = None
+        # set when the alerts no longer match the table checksum
+        self._reload = False
+        # (symbol, timeframe) -> (closed candle open times, closes)
+        self._candles = {}
+        # (symbol, timeframe, kind, period) -> (previous, last, close time in ms)
+        self._values = {}
+
+    def checksum(self) -> tuple:
+        """Return ``(count, sum of ids)`` of the loaded alerts."""
+        return len(self.alerts), sum(self.alerts)
+
+    @staticmethod
+    def table_checksum(session) -> tuple:
+        count, id_sum = session.query(func.count(IndicatorAlertRequest.id), func.sum(IndicatorAlertRequest.id)).one()
+        return int(count), int(id_sum or 0)
+
+    def _add(self, row: IndicatorAlertRow) -> None:
+        self.alerts[row.id] = row
+        self._max_id = max(self._max_id, row.id)
+
+    def apply(self, received: list) -> None:
+        """Apply received change notifications."""
+        for change in received:
+            if change.get("op") == ADD:
+                self._add(IndicatorAlertRow.from_change(change))
+            elif change.get("op") == REMOVE:
+                for alert_id in change["ids"]:
+                    self.alerts.pop(alert_id, None)
+
+    def sync(self, session) -> None:
+        """Bring the alerts up to date with the table."""
+        now = time.monotonic()
+        due = self._last_resync is None or now - self._last_resync >= self.resync_interval or self._reload
+
+        if self.listener is not None:
+            if self._last_resync is not None and not self._reload:
+                # the checksum is taken first: changes committed after it are in the notifications
+                checksum = self.table_checksum(session) if due else None
+                received = self.listener.poll()
+                if received is not None:
+                    self.apply(received)
+                    if due:
+                        self._last_resync = now
+                    if checksum is not None and checksum != self.checksum():
+                        logger.warning(f"Indicator alerts {self.checksum()} do not match the table {checksum}, reloading")
+                        self._reload = True
+                    return
+                logger.warning("Indicator alert changes may have been missed, reloading the alerts")
+            # listen before the load, so no change falls in between
+            self.listener.listen()
+            due = True
+
+        query = session.query(*(getattr(IndicatorAlertRequest, field) for field in IndicatorAlertRow._fields))
+        if due:
+            self._last_resync = now
+            self._reload = False
+            self.alerts = {}
+        else:
+            query = query.filter(IndicatorAlertRequest.id > self._max_id)
+        for row in query:
+            self._add(IndicatorAlertRow(*row))
+
+    def timeframe_ms(self, timeframe: str) -> int:
+        return self.exchange.parse_timeframe(timeframe) * 1000
+
+    def read_candles(self, symbol: str, timeframe: str, needed: int) -> np.ndarray:
+        """
+        Return at least ``needed`` closed candles of a series and the one still open, where the exchange has them.
+
+        The series shared by the processes of the host is used when it is long enough
+        (see bot/shared_candles.py), the candle store otherwise (see bot/candles.py).
+        """
+        limit = max(needed + 1, CANDLE_DEFAULT_LIMIT)
+
+        def load():
+            return to_array(self.store.candles(self.exchange_name, symbol, timeframe, limit=limit))
+
+        candles = self.shared.get_or_refresh(self.exchange_name, symbol, timeframe, load)
+        if len(candles) < needed + 1:
+            # published shorter for another use: the store has (or fetches) the rest
+            candles = load()
+        return candles
+
+    def refresh(self, groups: dict, now: int) -> None:
+        """
+        Read the candles of every (symbol, timeframe) with a new close and compute its indicators.
+
+        :param groups: (symbol, timeframe) -> {(kind, period)} used by the alerts
+        :param now: Current time in ms
+        """
+        for (symbol, timeframe), indicators in groups.items():
+            step = self.timeframe_ms(timeframe)
+            needed = max(history(kind, period) for kind, period in indicators)
+            cached = self._candles.get((symbol, timeframe))
+            fresh = cached is not None and len(cached[1]) >= needed and now < cached[0][-1] + 2 * step
+
+            if not fresh:
+                try:
+                    candles = self.read_candles(symbol, timeframe, needed)
+                except ccxt.BaseError as e:
+                    logger.warning(f"Could not read the {timeframe} candles of {symbol}: {e!r}")
+                    continue
+                times = np.asarray(candles["time"], dtype=np.int64)
+                closed = times + step <= now
+                if not closed.any():
+                    continue
+                cached = (times[closed], np.asarray(candles["close"], dtype=float)[closed])
+                self._candles[(symbol, timeframe)] = cached
+
+            times, closes = cached
+            closed_at = int(times[-1]) + step
+            for kind, period in indicators:
+                key = (symbol, timeframe, kind, period)
+                if not fresh or key not in self._values:
+                    self._values[key] = (*indicator(kind, period, closes), closed_at)
+
+        # forget what no alert uses anymore
+        for key in set(self._candles) - set(groups):
+            del self._candles[key]
+        used = {(symbol, timeframe, kind, period)
+                for (symbol, timeframe), indicators in groups.items() for kind, period in indicators}
+        for key in set(self._values) - used:
+            del self._values[key]
+
+    def evaluate(self, alerts: list) -> list:
+        """Return the alerts triggered by the computed indicator values."""
+        if not alerts:
+            return []
+        missing = (np.nan, np.nan, 0)
+        values = [self._values.get((a.symbol, a.timeframe, a.kind, a.period), missing) for a in alerts]
+        previous = np.array([value[0] for value in values], dtype=float)
+        last = np.array([value[1] for value in values], dtype=float)
+        closed_at = np.array([value[2] for value in values], dtype=np.int64)
+        thresholds = np.array([float(a.threshold) for a in alerts], dtype=float)
+        crossing = np.array([a.kind in CROSSING_KINDS for a in alerts])
+        # timestamps are stored as naive UTC
+        created = np.array([int(a.timestamp.replace(tzinfo=timezone.utc).timestamp() * 1000) if a.timestamp else 0
+                            for a in alerts], dtype=np.int64)
+
+        mask = triggered(previous, last, thresholds, crossing, closed_at > created)
+        return [alerts[i] for i in np.flatnonzero(mask)]
+
+    def deliver(self, session, bot, alerts: list) -> int:
+        """
+        Delete the triggered rows and notify the ones that still existed.
+
+        The notifications go out side by side; the rows of the ones that failed
+        (other than for chats that are gone) are put back. Returns the number of
+        alerts sent.
+        """
+        if not alerts:
+            return 0
+        deleted = set(
+            session.execute(
+                delete(IndicatorAlertRequest)
+                .where(IndicatorAlertRequest.id.in_([alert.id for alert in alerts]))
+                .returning(IndicatorAlertRequest.id)
+            ).scalars()
+        )
+        # claim the rows: a previous leader of the job deleting them too gets none back
+        session.commit()
+        claimed = [alert for alert in alerts if alert.id in deleted]
+        for alert in alerts:
+            if alert.id not in deleted:
+                # removed since the last sync
+                self.alerts.pop(alert.id, None)
+        if not claimed:
+            return 0
+
+        errors = send_all(bot, [(alert.user_id, f"🔔 Indicator Alert! 🔔\n\n{describe(alert)}.") for alert in claimed])
+        failed = []
+        for alert, error in zip(claimed, errors):
+            if error is None:
+                continue
+            logger.warning(f"Could not send indicator alert {alert.id} to {alert.user_id}: {error!r}")
+            if not isinstance(error, UNDELIVERABLE):
+                failed.append(alert)
+        if failed:
+            # their removal was never announced
+            session.add_all([IndicatorAlertRequest(**alert._asdict()) for alert in failed])
+        removed = deleted - {alert.id for alert in failed}
+        for alert_id in removed:
+            self.alerts.pop(alert_id, None)
+        if removed:
+            notify_indicator_removed(session, sorted(removed))
+        session.commit()
+        return errors.count(None)
+
+    def check(self, bot) -> int:
+        """Run one indicator alert cycle. Returns the number of alerts sent."""
+        session = self.session_factory()
+        try:
+            self.sync(session)
+            alerts = list(self.alerts.values())
+            groups = {}
+            for alert in alerts:
+                groups.setdefault((alert.symbol, alert.timeframe), set()).add((alert.kind, alert.period))
+
+            start = time.monotonic()
+            self.refresh(groups, self.exchange.milliseconds())
+            sent = self.deliver(session, bot, self.evaluate(alerts))
+            logger.debug(f"Checked {len(alerts)} indicator alerts on {len(groups)} candle series in {time.monotonic() - start:.2f}s")
+            if sent:
+                logger.info(f"Triggered {sent} indicator alerts")
+            return sent
+        finally:
+            session.close()
@@ -0,0 +1,321 @@
+# Outbound Telegram send scheduler.
+# Telegram limits bots to about 30 messages per second overall, about 1 message
+# per second per private chat and 20 messages per minute per group. Every
+# outgoing call goes through one OutboundScheduler that keeps a global token
+# bucket plus one bucket per chat, sends in per-chat FIFO order on a small
+# pool of sender threads and backs a chat off when Telegram answers 429.
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import telegram
+from telegram.error import BadRequest, ChatMigrated, RetryAfter, Unauthorized
+
+logger = logging.getLogger(__name__)
+
+# the chat is gone, moved or blocked the bot: sending again fails again
+UNDELIVERABLE = (BadRequest, ChatMigrated, Unauthorized)
+
+
+class TokenBucket:
+    """
+    Classic token bucket.
+
+    :param rate: Tokens added per second
+    :param capacity: Maximum number of tokens (burst size)
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+
+def _file_positions(args, kwargs) -> list:
+    """Return ``(file, position)`` of the file-like arguments of a call (e.g. a chart in a BytesIO)."""
+    positions = []
+    for value in list(args) + list(kwargs.values()):
+        if hasattr(value, "read") and hasattr(value, "seek"):
+            try:
+                positions.append((value, value.tell()))
+            except (OSError, ValueError):
+                # not seekable or closed, cannot be resent anyway
+                pass
+    return positions
+
+
+class _ChatQueue:
+    __slots__ = ("chat_id", "bucket", "jobs", "scheduled", "busy", "not_before", "idle_since")
+
+    def __init__(self, chat_id, bucket):
+        self.chat_id = chat_id
+        self.bucket = bucket
+        self.jobs = deque()
+        self.scheduled = False
+        self.busy = False
+        self.not_before = 0.0
+        self.idle_since = time.monotonic()
+
+
+class OutboundScheduler:
+    """
+    Central scheduler for outgoing Bot API calls.
+
+    :param global_rate: Messages per second across all chats
+    :param private_rate: Messages per second per private chat
+    :param group_rate: Messages per second per group or channel
+    :param private_burst: Burst size of a private chat bucket
+    :param senders: Number of threads performing the HTTP calls
+    """
+
+    # chats without traffic for this long are forgotten
+    IDLE_EXPIRY = 60
+
+    def __init__(self, global_rate=30, private_rate=1.0, group_rate=20 / 60, private_burst=3, senders=8):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.private_burst = private_burst
+
+        self._cond = threading.Condition()
+        self._chats = {}
+        self._ready = []  # heap of (ready_at, seq, chat_id)
+        self._seq = itertools.count()
+        self._running = True
+        self._last_sweep = time.monotonic()
+
+        self._senders = ThreadPoolExecutor(max_workers=senders, thread_name_prefix="tg-sender")
+        self._thread = threading.Thread(target=self._run, name="tg-send-scheduler", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def is_group(chat_id) -> bool:
+        # group, supergroup and channel ids are negative, "@channel" names are strings
+        return not isinstance(chat_id, int) or chat_id < 0
+
+    def _new_chat(self, chat_id) -> _ChatQueue:
+        if self.is_group(chat_id):
+            bucket = TokenBucket(self.group_rate, 1)
+        else:
+            bucket = TokenBucket(self.private_rate, self.private_burst)
+        return _ChatQueue(chat_id, bucket)
+
+    def submit(self, chat_id, fn, *args, **kwargs) -> Future:
+        """
+        Queue ``fn(*args, **kwargs)`` to be called once ``chat_id`` and the
+        global limit allow it. Returns a Future with the call's result.
+        """
+        future = Future()
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("Outbound scheduler is shut down")
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = self._new_chat(chat_id)
+            chat.jobs.append((fn, args, kwargs, future, _file_positions(args, kwargs)))
+            self._arm(chat)
+        return future
+
+    def call(self, chat_id, fn, *args, **kwargs):
+        """Queue a call and wait for its result."""
+        return self.submit(chat_id, fn, *args, **kwargs).result()
+
+    def _arm(self, chat: _ChatQueue) -> None:
+        # Must hold self._cond. Puts the chat on the ready heap if it has work
+        # and no send in flight (one in-flight call per chat keeps the order).
+        if chat.scheduled or chat.busy or not chat.jobs:
+            return
+        now = time.monotonic()
+        ready_at = max(now + chat.bucket.wait_time(now), chat.not_before)
+        heapq.heappush(self._ready, (ready_at, next(self._seq), chat.chat_id))
+        chat.scheduled = True
+        self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._ready:
+                    self._cond.wait(timeout=self.IDLE_EXPIRY)
+                    self._sweep()
+                if not self._ready:
+                    return
+
+                ready_at, _, chat_id = self._ready[0]
+                chat = self._chats[chat_id]
+                now = time.monotonic()
+                delay = max(ready_at - now, self.global_bucket.wait_time(now))
+                if delay > 0:
+                    self._cond.wait(timeout=delay)
+                    continue
+
+                chat_delay = max(chat.bucket.wait_time(now), chat.not_before - now)
+                if chat_delay > 0:
+                    heapq.heapreplace(self._ready, (now + chat_delay, next(self._seq), chat_id))
+                    continue
+
+                heapq.heappop(self._ready)
+                chat.scheduled = False
+                chat.busy = True
+                chat.bucket.consume(now)
+                self.global_bucket.consume(now)
+                job = chat.jobs.popleft()
+
+            self._senders.submit(self._send, chat, job)
+
+    def _send(self, chat: _ChatQueue, job) -> None:
+        fn, args, kwargs, future, positions = job
+        try:
+            result = fn(*args, **kwargs)
+        except RetryAfter as e:
+            logger.warning(f"Flood limit hit for chat {chat.chat_id}, retrying in {e.retry_after}s")
+            # the failed call read the files to their end
+            for file, position in positions:
+                file.seek(position)
+            with self._cond:
+                chat.not_before = time.monotonic() + e.retry_after
+                chat.jobs.appendleft(job)
+                chat.busy = False
+                self._arm(chat)
+            return
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+        with self._cond:
+            chat.busy = False
+            chat.idle_since = time.monotonic()
+            self._arm(chat)
+
+    def _sweep(self) -> None:
+        # Must hold self._cond
+        now = time.monotonic()
+        if now - self._last_sweep < self.IDLE_EXPIRY:
+            return
+        self._last_sweep = now
+        for chat_id, chat in list(self._chats.items()):
+            if not chat.jobs and not chat.busy and now - chat.idle_since > self.IDLE_EXPIRY:
+                del self._chats[chat_id]
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting sends; queued sends are still delivered."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if wait:
+            self._thread.join()
+            self._senders.shutdown(wait=True)
+
+
+class ScheduledBot(telegram.Bot):
+    """
+    telegram.Bot whose outgoing messages go through an OutboundScheduler.
+
+    ``Message.reply_text``, ``Message.edit_text`` and ``Message.delete`` call
+    these methods, so handlers are covered without changes. Calls whose result
+    handlers use (the sent Message) wait for their own slot only. Messages whose
+    result nobody uses go through ``queue_message`` (see ``bot.utils.queue_reply``)
+    and deletes are fire-and-forget, so a burst to one chat does not hold the
+    calling thread for the chat's send interval.
+    """
+
+    def __init__(self, token: str, scheduler: OutboundScheduler, **kwargs):
+        super().__init__(token, **kwargs)
+        self.scheduler = scheduler
+
+    def send_message(self, chat_id, *args, **kwargs):
+        return self.scheduler.call(chat_id, super().send_message, chat_id, *args, **kwargs)
+
+    def send_photo(self, chat_id, *args, **kwargs):
+        return self.scheduler.call(chat_id, super().send_photo, chat_id, *args, **kwargs)
+
+    def send_invoice(self, chat_id, *args, **kwargs):
+        return self.scheduler.call(chat_id, super().send_invoice, chat_id, *args, **kwargs)
+
+    def edit_message_text(self, *args, **kwargs):
+        chat_id = kwargs.get("chat_id", args[1] if len(args) > 1 else None)
+        return self.scheduler.call(chat_id, super().edit_message_text, *args, **kwargs)
+
+    def queue_message(self, chat_id, *args, **kwargs) -> Future:
+        """
+        Queue a message without waiting for it to be sent. Failures are logged.
+
+        :return: The future of the sent Message
+        """
+        future = self.scheduler.submit(chat_id, super().send_message, chat_id, *args, **kwargs)
+        future.add_done_callback(self._log_failed_send)
+        return future
+
+    def delete_message(self, chat_id, message_id, *args, **kwargs):
+        future = self.scheduler.submit(chat_id, super().delete_message, chat_id, message_id, *args, **kwargs)
+        future.add_done_callback(self._log_failed_delete)
+        return True
+
+    @staticmethod
+    def _log_failed_send(future: Future) -> None:
+        if future.exception() is not None:
+            logger.warning(f"Could not send message: {future.exception()}")
+
+    @staticmethod
+    def _log_failed_delete(future: Future) -> None:
+        if future.exception() is not None:
+            logger.warning(f"Could not delete message: {future.exception()}")
+
+
+def send_all(bot, messages: list) -> list:
+    """
+    Send messages side by side and wait for all of them.
+
+    Every message is queued before any is waited for (see ScheduledBot.queue_message),
+    so a fan-out to many chats goes out on all the scheduler's senders at once. Other
+    bots send them one after the other.
+
+    :param messages: ``(chat_id, text)`` pairs
+    :return: The exception of every message, None where it was sent
+    """
+    queue_message = getattr(bot, "queue_message", None)
+    futures = []
+    for chat_id, text in messages:
+        future = Future()
+        try:
+            if queue_message is not None:
+                future = queue_message(chat_id=chat_id, text=text)
+            else:
+                future.set_result(bot.send_message(chat_id=chat_id, text=text))
+        except Exception as e:
+            future.set_exception(e)
+        futures.append(future)
+
+    errors = []
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            errors.append(e)
+        else:
+            errors.append(None)
+    return errors
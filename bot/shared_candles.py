@@ -0,0 +1,289 @@
+# Candle series shared by the consumer processes of a host.
+#
+# Every consumer process used to keep its own cache of candle DataFrames, so
+# the same BTC/ETH series sat in memory once per process. Hot series are
+# instead published as files in shared memory (SHARED_CANDLES_PATH, /dev/shm
+# by default), one compact column after the other:
+#
+#   [fetched_at, count] header (HEADER_DTYPE)
+#   time    int64[count]    open times in ms
+#   open, high, low, close, volume    float32[count] each
+#
+# 28 bytes per candle. Readers map a file and get zero-copy numpy views of
+# its columns, without any deserializing; the pages are shared by all
+# processes of the host.
+# A series expires at the next candle close of its timeframe (see
+# bot/candle_expiry.py). One writer refreshes an expired series: the first
+# process to take the series' flock fetches and publishes it, the others wait
+# for the lock (or keep reading the stale series for a few seconds) and then
+# read what it published. A series is published to a temporary file and
+# renamed over the old one, so a reader always maps a complete series (and
+# keeps its mapping of the previous one until it drops the views).
+# A tmpfs lives in RAM, so the series are kept within SHARED_CANDLES_MAX_BYTES:
+# every read touches the file's mtime, and publishing a series evicts the
+# least recently read ones until it fits. Series nobody read in
+# SHARED_CANDLES_MAX_IDLE seconds are removed as well. Their lock files are
+# empty and are kept, so every process always locks the same file.
+
+import fcntl
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from bot.candle_expiry import expires_at
+from config.settings import SHARED_CANDLES_MAX_BYTES, SHARED_CANDLES_MAX_IDLE, SHARED_CANDLES_PATH
+
+logger = logging.getLogger(__name__)
+
+HEADER_DTYPE = np.dtype([
+    ("fetched_at", "<f8"),  # time.time() of the fetch
+    ("count", "<i8"),
+])
+
+PRICE_COLUMNS = ("open", "high", "low", "close", "volume")
+CANDLE_BYTES = 8 + 4 * len(PRICE_COLUMNS)
+
+SUFFIX = ".candles"
+
+# seconds between two sweeps of idle series
+SWEEP_INTERVAL = 600
+
+
+def default_path() -> str:
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(root, "cryptosentinel-candles")
+
+
+class CandleColumns:
+    """Column views of a published series: ``candles["close"]`` or ``candles.close``."""
+
+    __slots__ = ("time",) + PRICE_COLUMNS + ("fetched_at",)
+
+    def __init__(self, buffer, fetched_at: float, count: int):
+        offset = HEADER_DTYPE.itemsize
+        self.time = np.frombuffer(buffer, dtype="<i8", count=count, offset=offset)
+        offset += 8 * count
+        for column in PRICE_COLUMNS:
+            setattr(self, column, np.frombuffer(buffer, dtype="<f4", count=count, offset=offset))
+            offset += 4 * count
+        self.fetched_at = fetched_at
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return getattr(self, column)
+
+    def __len__(self):
+        return len(self.time)
+
+
+class SharedCandles:
+    """
+    Candle series in shared memory, with one writer per expired series.
+
+    :param root: Directory of the shared files (a tmpfs, ideally)
+    :param max_bytes: Size budget of all series of the host, 0 for none
+    :param max_idle: Seconds after their last read series are removed
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = SHARED_CANDLES_MAX_BYTES,
+                 max_idle: float = SHARED_CANDLES_MAX_IDLE):
+        self.root = root or SHARED_CANDLES_PATH or default_path()
+        self.max_bytes = max_bytes
+        self.max_idle = max_idle
+        self._swept_at = 0.0
+        # counts of this process
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, exchange: str, symbol: str, timeframe: str) -> str:
+        name = re.sub(r"[^A-Za-z0-9]+", "_", f"{exchange} {symbol} {timeframe}").strip("_")
+        return os.path.join(self.root, name + SUFFIX)
+
+    @contextmanager
+    def _locked(self, path: str):
+        # flock locks belong to the open file, so threads of one process exclude each other too
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _map(path: str):
+        try:
+            with open(path, "rb") as f:
+                # the mapping stays valid after the file is closed or replaced
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # ValueError: an empty file cannot be mapped
+            return None
+        header = np.frombuffer(buffer, dtype=HEADER_DTYPE, count=1)[0]
+        return CandleColumns(buffer, float(header["fetched_at"]), int(header["count"]))
+
+    def get(self, exchange: str, symbol: str, timeframe: str):
+        """Return the published series as read-only views of the shared memory, or None."""
+        return self._map(self.path(exchange, symbol, timeframe))
+
+    def _touch(self, path: str) -> None:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def publish(self, exchange: str, symbol: str, timeframe: str, candles: np.ndarray, fetched_at: float = None) -> None:
+        """
+        Publish a series (replacing the previous one).
+
+        :param candles: A CANDLE_DTYPE array (see bot/candles.py)
+        """
+        path = self.path(exchange, symbol, timeframe)
+        self._make_room(HEADER_DTYPE.itemsize + CANDLE_BYTES * len(candles), keep=path)
+        header = np.array([(time.time() if fetched_at is None else fetched_at, len(candles))], dtype=HEADER_DTYPE)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(header.tobytes())
+            f.write(np.ascontiguousarray(candles["time"], dtype="<i8").tobytes())
+            for column in PRICE_COLUMNS:
+                f.write(np.ascontiguousarray(candles[column], dtype="<f4").tobytes())
+        os.replace(temporary, path)
+        self._sweep()
+
+    def _files(self) -> list:
+        """Return ``(mtime, size, path)`` of every published series, least recently read first."""
+        files = []
+        for name in os.listdir(self.root):
+            if name.endswith(SUFFIX):
+                path = os.path.join(self.root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return sorted(files)
+
+    def _remove(self, path: str) -> None:
+        # the (empty) lock file stays: a process waiting on its flock would otherwise
+        # hold a lock on an unlinked file while the next one locks a new one
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _make_room(self, size: int, keep: str) -> None:
+        if not self.max_bytes:
+            return
+        files = self._files()
+        total = size + sum(file_size for _, file_size, path in files if path != keep)
+        for _, file_size, path in files:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= file_size
+            self.evictions += 1
+            logger.debug(f"Evicted the shared candles {os.path.basename(path)}")
+
+    def stats(self) -> dict:
+        """Return the hits, misses and evictions of this process, and the series and bytes of the host."""
+        files = self._files()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "series": len(files),
+            "bytes": sum(size for _, size, _ in files),
+            "max_bytes": self.max_bytes,
+        }
+
+    def _expires(self, timeframe: str, fetched_at: float, max_age) -> float:
+        return fetched_at + max_age if max_age is not None else expires_at(timeframe, fetched_at)
+
+    def _refresh(self, path: str, exchange: str, symbol: str, timeframe: str, loader, max_age):
+        with self._locked(path):
+            # another process may have refreshed it while this one waited
+            found = self._map(path)
+            if found is not None and time.time() < self._expires(timeframe, found.fetched_at, max_age):
+                self._touch(path)
+                return found
+            self.misses += 1
+            candles = loader()
+            self.publish(exchange, symbol, timeframe, candles)
+        return self._map(path)
+
+    def _refresh_in_background(self, path: str, *args) -> None:
+        with self._refreshing_lock:
+            if path in self._refreshing:
+                return
+            self._refreshing.add(path)
+
+        def refresh():
+            try:
+                self._refresh(path, *args)
+            except Exception:
+                logger.exception(f"Could not refresh the shared candles {os.path.basename(path)}")
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(path)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get_or_refresh(self, exchange: str, symbol: str, timeframe: str, loader, max_age: float = None,
+                       stale: float = 0.0):
+        """
+        Return a series, refreshing it when it expired.
+
+        :param loader: Returns the fresh series as a CANDLE_DTYPE array. Only one
+                       process of the host calls it for an expired series
+        :param max_age: Seconds a series is fresh, by default until the next candle
+                        close of its timeframe (see bot/candle_expiry.py)
+        :param stale: Seconds an expired series is still returned while it is
+                      refreshed in the background
+        :return: CandleColumns views of the series
+        """
+        path = self.path(exchange, symbol, timeframe)
+        found = self._map(path)
+        if found is not None:
+            expires = self._expires(timeframe, found.fetched_at, max_age)
+            now = time.time()
+            if now < expires + stale:
+                self.hits += 1
+                self._touch(path)
+                if now >= expires:
+                    self._refresh_in_background(path, exchange, symbol, timeframe, loader, max_age)
+                return found
+        return self._refresh(path, exchange, symbol, timeframe, loader, max_age)
+
+    def _sweep(self) -> None:
+        now = time.time()
+        if now - self._swept_at < SWEEP_INTERVAL:
+            return
+        self._swept_at = now
+        for mtime, _, path in self._files():
+            if now - mtime >= self.max_idle:
+                self._remove(path)
+        logger.info(f"Shared candles: {self.stats()}")
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_candles() -> SharedCandles:
+    """Return the process-wide SharedCandles."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = SharedCandles()
+        return _shared
@@ -0,0 +1,277 @@
+# Symbol resolution from cached market catalogs.
+#
+# Commands get symbols in many shapes ("btcusdt", "BTC/USDT", "btc-usdt",
+# "BTC"). Instead of passing them to the exchanges and waiting for an error,
+# they are resolved against a catalog built from the markets of
+# SYMBOL_EXCHANGES (see bot/exchanges.py) and the LunarCrush coin list:
+# - every symbol is normalized to its pair key (BTCUSDT), a bare base asset
+#   gets the default quote (BTC -> BTCUSDT)
+# - a dict answers "is it listed, and on which exchanges" without a request
+# - a trie over the pair keys gives prefix and fuzzy (edit distance)
+#   suggestions for unknown input
+# The catalog is rebuilt in the background every SYMBOL_CATALOG_TTL seconds
+# and replaced in one assignment, so readers never see a half built one.
+
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+
+import requests
+
+from bot.exchanges import get_exchange
+from config.settings import LUNARCRUSH_API_KEY, SYMBOL_CATALOG_TTL, SYMBOL_EXCHANGES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUOTE = "USDT"
+LUNARCRUSH_COINS_URL = "https://lunarcrush.com/api3/coins"
+
+# base, quote and exchange -> ccxt unified symbol (spot preferred over derivatives)
+Listing = namedtuple("Listing", ["base", "quote", "markets"])
+
+
+def normalize(text: str) -> str:
+    """Return the pair key of a symbol: "btc/usdt", "BTC-USDT" and "BTC/USDT:USDT" give "BTCUSDT"."""
+    return re.sub(r"[^A-Z0-9]", "", text.strip().upper().split(":")[0])
+
+
+class UnknownSymbol(ValueError):
+    def __init__(self, symbol: str, suggestions=()):
+        self.symbol = symbol
+        self.suggestions = list(suggestions)
+        message = f"Unknown symbol {symbol}."
+        if self.suggestions:
+            message += f" Did you mean {', '.join(self.suggestions)}?"
+        super().__init__(message)
+
+
+class _Node:
+    __slots__ = ("children", "key")
+
+    def __init__(self):
+        self.children = {}
+        self.key = None
+
+
+class SymbolTrie:
+    """Prefix tree of pair keys with prefix and edit distance lookups."""
+
+    def __init__(self, keys=()):
+        self.root = _Node()
+        for key in keys:
+            self.insert(key)
+
+    def insert(self, key: str) -> None:
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, _Node())
+        node.key = key
+
+    def with_prefix(self, prefix: str, limit: int = 5) -> list:
+        """Return up to ``limit`` keys starting with prefix, shortest first."""
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        # breadth first: BTCUSDT comes before BTCUSDTPERP
+        keys, level = [], [node]
+        while level and len(keys) < limit:
+            keys.extend(sorted(n.key for n in level if n.key is not None))
+            level = [child for n in level for _, child in sorted(n.children.items())]
+        return keys[:limit]
+
+    def fuzzy(self, word: str, max_distance: int = 2, limit: int = 5) -> list:
+        """
+        Return up to ``limit`` keys within ``max_distance`` edits of word, closest first.
+
+        Walks the trie with one Levenshtein row per node and skips subtrees whose
+        row minimum already exceeds max_distance.
+        """
+        matches = []
+
+        def search(node, char, previous):
+            row = [previous[0] + 1]
+            for i in range(1, len(word) + 1):
+                row.append(min(row[i - 1] + 1, previous[i] + 1, previous[i - 1] + (word[i - 1] != char)))
+            if node.key is not None and row[-1] <= max_distance:
+                matches.append((row[-1], node.key))
+            if min(row) <= max_distance:
+                for next_char, child in node.children.items():
+                    search(child, next_char, row)
+
+        first = list(range(len(word) + 1))
+        for char, child in self.root.children.items():
+            search(child, char, first)
+        return [key for _, key in sorted(matches)[:limit]]
+
+
+class SymbolCatalog:
+    """
+    Snapshot of the listed pairs and known coins.
+
+    :param markets: exchange name -> ccxt markets dict
+    :param coins: LunarCrush coins (dicts with at least ``id`` and ``symbol``)
+    """
+
+    def __init__(self, markets: dict, coins=()):
+        self._pairs = {}
+        for exchange, exchange_markets in markets.items():
+            for market in (exchange_markets or {}).values():
+                if market.get("active") is False or not market.get("base") or not market.get("quote"):
+                    continue
+                key = normalize(market["base"] + market["quote"])
+                listing = self._pairs.setdefault(key, Listing(market["base"], market["quote"], {}))
+                if market.get("spot") or exchange not in listing.markets:
+                    listing.markets[exchange] = market["symbol"]
+        self._bases = {listing.base for listing in self._pairs.values()}
+        self._coins = {coin["symbol"].upper(): coin for coin in coins if coin.get("symbol")}
+        self._trie = SymbolTrie(self._pairs)
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def listing(self, symbol: str):
+        """Return the Listing of a pair key, or None when no exchange lists it."""
+        return self._pairs.get(normalize(symbol))
+
+    def resolve(self, text: str, quote: str = DEFAULT_QUOTE):
+        """Return the pair key of user input, or None when it is not listed."""
+        key = normalize(text)
+        if key in self._pairs:
+            return key
+        if key in self._bases and key + quote in self._pairs:
+            return key + quote
+        return None
+
+    def coin(self, symbol: str):
+        """Return the LunarCrush coin of a base asset or of the base of a pair."""
+        listing = self.listing(symbol)
+        return self._coins.get(listing.base if listing else normalize(symbol))
+
+    def suggest(self, text: str, limit: int = 3, exchange: str = None) -> list:
+        """Return listed pairs close to user input: prefix matches first, then typos."""
+        key = normalize(text)
+        candidates = self._trie.with_prefix(key, limit * 4)
+        if key:
+            candidates += self._trie.fuzzy(key, max_distance=2, limit=limit * 4)
+        suggestions = []
+        for candidate in candidates:
+            if candidate in suggestions or (exchange and exchange not in self._pairs[candidate].markets):
+                continue
+            suggestions.append(candidate)
+        return suggestions[:limit]
+
+
+def fetch_coins() -> list:
+    """Fetch the LunarCrush coin list. Returns an empty list on errors."""
+    try:
+        response = requests.get(LUNARCRUSH_COINS_URL, headers={"Authorization": f"Bearer {LUNARCRUSH_API_KEY}"},
+                                timeout=30)
+        response.raise_for_status()
+        return response.json().get("data") or []
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.warning(f"Could not fetch the LunarCrush coin list: {e!r}")
+        return []
+
+
+class SymbolResolver:
+    """
+    Keeps a SymbolCatalog fresh and resolves user input against it.
+
+    :param exchanges: Names of the exchanges whose markets are listed
+    :param ttl: Seconds a catalog is used before it is rebuilt in the background
+    :param exchange_factory: Returns the ccxt client of an exchange name
+    :param coins_loader: Returns the LunarCrush coin list
+    """
+
+    def __init__(self, exchanges=None, ttl: float = SYMBOL_CATALOG_TTL, exchange_factory=get_exchange,
+                 coins_loader=fetch_coins):
+        self.exchanges = list(exchanges or SYMBOL_EXCHANGES)
+        self.ttl = ttl
+        self.exchange_factory = exchange_factory
+        self.coins_loader = coins_loader
+        self._catalog = None
+        self._coins = []
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def build(self) -> SymbolCatalog:
+        start = time.monotonic()
+        markets = {}
+        for name in self.exchanges:
+            # get_exchange loads the markets and logs when it cannot
+            markets[name] = self.exchange_factory(name).markets
+        # keep the previous coins when LunarCrush is unavailable
+        self._coins = self.coins_loader() or self._coins
+        catalog = SymbolCatalog(markets, self._coins)
+        logger.info(f"Built the symbol catalog: {len(catalog)} pairs, {len(self._coins)} coins "
+                    f"in {time.monotonic() - start:.1f}s")
+        return catalog
+
+    def _rebuild(self) -> None:
+        try:
+            catalog = self.build()
+            if len(catalog) or self._catalog is None:
+                self._catalog = catalog
+            self._built_at = time.monotonic()
+        except Exception:
+            logger.exception("Could not build the symbol catalog")
+            if self._catalog is None:
+                self._catalog = SymbolCatalog({})
+        finally:
+            self._refreshing = False
+
+    def catalog(self) -> SymbolCatalog:
+        """Return the current catalog, building it on first use."""
+        if self._catalog is None:
+            with self._lock:
+                if self._catalog is None:
+                    self._refreshing = True
+                    self._rebuild()
+        elif self._built_at is None or time.monotonic() - self._built_at >= self.ttl:
+            with self._lock:
+                if self._refreshing:
+                    return self._catalog
+                self._refreshing = True
+            threading.Thread(target=self._rebuild, name="symbol-catalog", daemon=True).start()
+        return self._catalog
+
+    def resolve(self, text: str, exchange: str = None, quote: str = DEFAULT_QUOTE) -> str:
+        """
+        Resolve user input to a listed pair key.
+
+        :param text: The symbol as typed
+        :param exchange: Only accept pairs listed on this exchange
+        :param quote: Quote asset of a bare base asset
+        :raises UnknownSymbol: With suggestions, when the pair is not listed
+        """
+        catalog = self.catalog()
+        if not len(catalog):
+            # no catalog could be loaded: let the exchange decide
+            return normalize(text)
+        key = catalog.resolve(text, quote)
+        if key is None or (exchange and exchange not in catalog.listing(key).markets):
+            raise UnknownSymbol(text.strip().upper(), catalog.suggest(text, exchange=exchange))
+        return key
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver() -> SymbolResolver:
+    """Return the process-wide SymbolResolver."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = SymbolResolver()
+        return _resolver
+
+
+def resolve_symbol(text: str, exchange: str = None) -> str:
+    """Resolve user input to a listed pair key with the process-wide resolver (see SymbolResolver.resolve)."""
+    return get_resolver().resolve(text, exchange=exchange)
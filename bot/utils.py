@@ -15,6 +15,8 @@ from config.settings import LUNARCRUSH_API_KEY
 
 import functools
 from bot.database import Session, CommandUsage
+from bot.candles import get_candle_store
+from bot.symbols import UnknownSymbol, get_resolver
 
 
 def restricted(func):
@@ -24,7 +26,8 @@ def restricted(func):
         if user_id == 1:  # bypass restriction for test user
             return func(update, context, *args, **kwargs)
         if not check_user_access(user_id):
-            update.message.reply_text(
+            queue_reply(
+                update.message,
                 "You don't have access to this feature. Please subscribe first by using /start."
             )
             return
@@ -33,6 +36,50 @@ def restricted(func):
     return wrapped
 
 
+def queue_message(bot, chat_id, text: str, **kwargs) -> None:
+    """
+    Send a message without waiting for it to be sent.
+
+    For messages whose Message the caller does not use: with a ScheduledBot the
+    message is queued on the outbound scheduler (see bot/send_scheduler.py), with
+    any other bot it is sent right away.
+    """
+    queue = getattr(bot, "queue_message", None)
+    if queue is None:
+        bot.send_message(chat_id, text, **kwargs)
+    else:
+        queue(chat_id, text, **kwargs)
+
+
+def queue_reply(message, text: str, **kwargs) -> None:
+    """Reply to a message without waiting for the reply to be sent (see queue_message)."""
+    # quotes like Message.reply_text does (by default only in groups)
+    kwargs["reply_to_message_id"] = message._quote(kwargs.pop("quote", None), kwargs.get("reply_to_message_id"))
+    queue_message(message.bot, message.chat_id, text, **kwargs)
+
+
+def record_command_usage(user_id, command_name):
+    # Log command usage to the database
+    session = Session()
+    command_usage = (
+        session.query(CommandUsage)
+        .filter_by(user_id=user_id, command_name=command_name)
+        .first()
+    )
+
+    if command_usage:
+        command_usage.usage_count += (
+            1  # Increment the counter if the command usage record exists
+        )
+    else:
+        command_usage = CommandUsage(
+            user_id=user_id, command_name=command_name, usage_count=1
+        )
+        session.add(command_usage)
+
+    session.commit()
+
+
 def log_command_usage(command_name):
     def decorator(func):
         @functools.wraps(func)
@@ -42,25 +89,7 @@ def log_command_usage(command_name):
             context = args[-1]
             user_id = update.effective_user.id
 
-            # Log command usage to the database
-            session = Session()
-            command_usage = (
-                session.query(CommandUsage)
-                .filter_by(user_id=user_id, command_name=command_name)
-                .first()
-            )
-
-            if command_usage:
-                command_usage.usage_count += (
-                    1  # Increment the counter if the command usage record exists
-                )
-            else:
-                command_usage = CommandUsage(
-                    user_id=user_id, command_name=command_name, usage_count=1
-                )
-                session.add(command_usage)
-
-            session.commit()
+            record_command_usage(user_id, command_name)
 
             # Call the original command handler function
             return func(*args, **kwargs)
@@ -74,7 +103,7 @@ def command_usage_example(example_text: str):
     def decorator(function):
         def wrapper(update: Update, context: CallbackContext, *args, **kwargs):
             if len(context.args) == 0:
-                update.message.reply_text(f"Usage example: {example_text}")
+                queue_reply(update.message, f"Usage example: {example_text}")
                 return
             return function(update, context, *args, **kwargs)
 
@@ -83,25 +112,27 @@ def command_usage_example(example_text: str):
     return decorator
 
 
+def resolve_symbol_arg(update: Update, text: str, exchange: str = None):
+    """
+    Resolve a symbol argument with the symbol catalog, without any exchange request.
+
+    Replies with suggestions and returns None when the symbol is not listed.
+    """
+    try:
+        return get_resolver().resolve(text, exchange=exchange)
+    except UnknownSymbol as e:
+        queue_reply(update.message, str(e))
+        return None
+
+
 class PlotChart:
     @staticmethod
     def plot_ohlcv_chart(symbol, time_frame):
-        # Define the list of exchanges
-        exchanges = [
-            ccxt.binance(),
-            ccxt.bybit(),
-            ccxt.kucoin(),
-        ]
-
-        # Fetch OHLCV data from the first exchange that supports the market
-        for exchange in exchanges:
-            try:
-                ohlcv = exchange.fetch_ohlcv(symbol.upper(), time_frame)
-                break
-            except ccxt.BaseError:
-                continue
-        else:
-            return None  # Return None if no exchange supports the market
+        # Only ask the exchanges listing the market, in this order of preference
+        listing = get_resolver().catalog().listing(symbol)
+        names = ["binance", "bybit", "kucoin"]
+        if listing:
+            names = [name for name in names if name in listing.markets]
 
         # Define the time horizon for each time frame
         time_horizon = {
@@ -115,8 +146,22 @@ class PlotChart:
             "1M": timedelta(weeks=324),
         }
 
-        # Filter data based on the selected time frame
+        # Only the candles of the time horizon are read (from the candle store)
         start_time = datetime.now() - time_horizon.get(time_frame, timedelta(weeks=4))
+        since = int(start_time.timestamp() * 1000)
+
+        # Fetch OHLCV data from the first exchange that supports the market
+        for name in names:
+            market_symbol = listing.markets[name] if listing else symbol.upper()
+            try:
+                ohlcv = get_candle_store().candles(name, market_symbol, time_frame, since=since)
+                break
+            except ccxt.BaseError:
+                continue
+        else:
+            return None  # Return None if no exchange supports the market
+
+        # Filter data based on the selected time frame
         ohlcv = [
             entry
             for entry in ohlcv
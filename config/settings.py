@@ -11,8 +11,8 @@ load_dotenv()
 MY_POSTGRESQL_URL = os.getenv("MY_POSTGRESQL_URL")
 
 
-def get_connection():
-    return psycopg2.connect(MY_POSTGRESQL_URL, sslmode="require")
+def get_connection(**kwargs):
+    return psycopg2.connect(MY_POSTGRESQL_URL, sslmode="require", **kwargs)
 
 
 # Load payment gateway connection
@@ -31,3 +31,114 @@ TELEGRAM_IDS = os.getenv("TELEGRAM_IDS")
 
 # Load cloudamqp connection
 CLOUDAMQP_URL = os.getenv("CLOUDAMQP_URL")
+
+# Consumer tuning
+# number of handler threads (0 processes updates inline on the connection thread)
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", "8"))
+# maximum number of unacked deliveries held by one consumer
+CONSUMER_PREFETCH = int(os.getenv("CONSUMER_PREFETCH", "16"))
+
+# Consumer capacity per lane (see bot/broker/topology.py): lane -> (workers, prefetch)
+# the interactive lane uses CONSUMER_WORKERS / CONSUMER_PREFETCH
+LANE_CAPACITY = {
+    "interactive": (CONSUMER_WORKERS, CONSUMER_PREFETCH),
+    "heavy": (int(os.getenv("HEAVY_WORKERS", "4")), int(os.getenv("HEAVY_PREFETCH", "4"))),
+    "payments": (int(os.getenv("PAYMENTS_WORKERS", "2")), int(os.getenv("PAYMENTS_PREFETCH", "4"))),
+}
+# delays (seconds) of the retries of a failed update, their number bounds the retries
+RETRY_DELAYS = [float(delay) for delay in os.getenv("RETRY_DELAYS", "2,8,32").split(",")]
+# seconds a processed update id is remembered to skip redeliveries
+PROCESSED_UPDATES_TTL = int(os.getenv("PROCESSED_UPDATES_TTL", "3600"))
+# maximum number of in-flight updates held by the asyncio consumer
+ASYNC_CONSUMER_PREFETCH = int(os.getenv("ASYNC_CONSUMER_PREFETCH", "200"))
+
+# Queue sharding (see bot/broker/sharding.py)
+# number of chat-affine shard queues (changing it remaps chats, drain the queues first)
+QUEUE_SHARDS = int(os.getenv("QUEUE_SHARDS", "8"))
+# number of consumers sharing the shards and the 0-based index of this one
+# (unset: taken from the Heroku dyno name)
+CONSUMER_COUNT = int(os.getenv("CONSUMER_COUNT", "1"))
+CONSUMER_INDEX = os.getenv("CONSUMER_INDEX")
+
+# Recurring jobs of the consumer (seconds between runs)
+SUBSCRIPTION_CHECK_INTERVAL = float(os.getenv("SUBSCRIPTION_CHECK_INTERVAL", "300"))
+# price alerts also trigger on levels crossed between two checks (1m candle high/low)
+# (the interval of every symbol without ALERT_CADENCE)
+PRICE_ALERT_INTERVAL = float(os.getenv("PRICE_ALERT_INTERVAL", "60"))
+# indicator alerts only change when a candle closes, the check fetches only the closed ones
+INDICATOR_ALERT_INTERVAL = float(os.getenv("INDICATOR_ALERT_INTERVAL", "60"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# per-symbol alert check intervals between these bounds, from the distance to the
+# nearest alert and the volatility (the alert job then runs every ALERT_MIN_INTERVAL)
+ALERT_CADENCE = os.getenv("ALERT_CADENCE", "true").lower() == "true"
+ALERT_MIN_INTERVAL = float(os.getenv("ALERT_MIN_INTERVAL", "5"))
+ALERT_MAX_INTERVAL = float(os.getenv("ALERT_MAX_INTERVAL", "300"))
+# seconds between reconciliations of the price and indicator alerts with their tables
+# (a checksum query with ALERT_NOTIFY, a full reload without)
+ALERT_RESYNC_INTERVAL = float(os.getenv("ALERT_RESYNC_INTERVAL", "600"))
+# follow the alert tables through Postgres LISTEN/NOTIFY instead of querying them every check
+ALERT_NOTIFY = os.getenv("ALERT_NOTIFY", "true").lower() == "true"
+# "poll": the consumer checks the alerts every PRICE_ALERT_INTERVAL seconds
+# "worker": alert_worker.py processes check them, sharded by symbol
+# "stream": like "worker", on every trade of the exchange WebSocket
+ALERT_MODE = os.getenv("ALERT_MODE", "poll").lower()
+# symbol shards spread over the alert workers (changing it moves alerts between workers)
+ALERT_SHARDS = int(os.getenv("ALERT_SHARDS", "16"))
+# messages per second of every alert worker (their sum must stay below OUTBOUND_GLOBAL_RATE
+# together with the consumers)
+ALERT_OUTBOUND_RATE = float(os.getenv("ALERT_OUTBOUND_RATE", "10"))
+# seconds between reads of new alerts by the streaming worker
+ALERT_STREAM_SYNC_INTERVAL = float(os.getenv("ALERT_STREAM_SYNC_INTERVAL", "5"))
+# only one consumer runs each job (Postgres advisory locks), another takes over
+# within LEADER_ELECTION_INTERVAL seconds when it dies
+JOB_LEADER_ELECTION = os.getenv("JOB_LEADER_ELECTION", "true").lower() == "true"
+LEADER_ELECTION_INTERVAL = float(os.getenv("LEADER_ELECTION_INTERVAL", "5"))
+
+# Shared exchange clients (see bot/exchanges.py)
+EXCHANGE_MARKETS_TTL = float(os.getenv("EXCHANGE_MARKETS_TTL", "3600"))  # seconds between market reloads
+EXCHANGE_POOL_SIZE = int(os.getenv("EXCHANGE_POOL_SIZE", "16"))  # kept-alive connections per exchange
+
+# Symbol resolution (see bot/symbols.py)
+SYMBOL_EXCHANGES = [name.strip() for name in os.getenv("SYMBOL_EXCHANGES", "bybit,binance,kucoin").split(",") if name.strip()]
+SYMBOL_CATALOG_TTL = float(os.getenv("SYMBOL_CATALOG_TTL", "3600"))  # seconds between catalog rebuilds
+
+# Candle store (see bot/candles.py)
+CANDLE_STORE_PATH = os.getenv("CANDLE_STORE_PATH", "data/candles")
+CANDLE_PAGE_SIZE = int(os.getenv("CANDLE_PAGE_SIZE", "1000"))  # candles per fetch_ohlcv call
+CANDLE_DEFAULT_LIMIT = int(os.getenv("CANDLE_DEFAULT_LIMIT", "200"))  # candles returned without a start time
+
+# Market data caches expire at the next candle close (see bot/candle_expiry.py)
+CANDLE_CLOSE_DELAY = float(os.getenv("CANDLE_CLOSE_DELAY", "5"))  # seconds the exchanges take to publish a closed candle
+CACHE_STALE_WINDOW = float(os.getenv("CACHE_STALE_WINDOW", "30"))  # seconds expired data is served while it is refreshed
+CACHE_DEFAULT_MAX_AGE = float(os.getenv("CACHE_DEFAULT_MAX_AGE", "60"))  # seconds data without a candle timeframe is fresh
+
+# Candle series shared by the processes of a host (see bot/shared_candles.py)
+SHARED_CANDLES_PATH = os.getenv("SHARED_CANDLES_PATH")  # default: /dev/shm/cryptosentinel-candles
+SHARED_CANDLES_MAX_IDLE = float(os.getenv("SHARED_CANDLES_MAX_IDLE", "86400"))  # seconds before an unused series is removed
+SHARED_CANDLES_MAX_BYTES = int(os.getenv("SHARED_CANDLES_MAX_BYTES", str(64 * 1024 * 1024)))  # of all series of the host, 0 for no limit
+# Technical study API responses cached by /stats, in bytes of JSON
+STATS_CACHE_MAX_BYTES = int(os.getenv("STATS_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Outbound Telegram limits
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))  # messages per second
+OUTBOUND_PRIVATE_RATE = float(os.getenv("OUTBOUND_PRIVATE_RATE", "1"))  # messages per second per chat
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", "20")) / 60  # 20 messages per minute per group
+# number of sender threads (the HTTP connection pool is sized to match)
+OUTBOUND_SENDERS = int(os.getenv("OUTBOUND_SENDERS", "8"))
+
+# Producer publish buffer
+PUBLISHER_BUFFER_SIZE = int(os.getenv("PUBLISHER_BUFFER_SIZE", "10000"))
+PUBLISHER_BATCH_SIZE = int(os.getenv("PUBLISHER_BATCH_SIZE", "100"))
+# file used once the in-memory buffer is full (unset: drop instead)
+PUBLISHER_SPILL_PATH = os.getenv("PUBLISHER_SPILL_PATH")
+# Producer webhook mode (python telegram_producer.py --webhook)
+# public base URL of the producer, Telegram posts updates to WEBHOOK_URL + WEBHOOK_PATH
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8443"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# queued updates at least this large (bytes) are compressed
+ENVELOPE_COMPRESS_THRESHOLD = int(os.getenv("ENVELOPE_COMPRESS_THRESHOLD", "1024"))
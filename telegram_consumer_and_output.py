@@ -2,8 +2,8 @@
 # Initialize the The Telegram Bot to process the messages as they come in.
 # (messages are commands from users that will be processed by the bot)
 # Rate Limiting:
-# Telegram has a rate limit of 30 messages per second.
-# use the TokenBucket algorithm to limit the rate of messages sent to Telegram.
+# Telegram has a rate limit of 30 messages per second (about 1 per second per chat).
+# Outgoing messages go through the token bucket scheduler in bot/send_scheduler.py.
 # Message Processing:
 # Define a function to process messages from the queue.
 # This function should consume messages from the queue and process them via the dispatcher command handlers of the bot.
@@ -15,12 +15,10 @@
 
 
 
+import functools
 import pika
-import json
 import logging
 import telegram
-import time
-import threading
 from telegram.ext import (
     CallbackContext,
     CommandHandler,
@@ -32,39 +30,41 @@ from telegram.ext import (
     Dispatcher,
 )
 from telegram.error import (TelegramError, Unauthorized, BadRequest, TimedOut, ChatMigrated, NetworkError)
+from telegram.utils.request import Request
+
+from config.settings import (
+    TELEGRAM_API_TOKEN,
+    CLOUDAMQP_URL,
+    LANE_CAPACITY,
+    RETRY_DELAYS,
+    PROCESSED_UPDATES_TTL,
+    JOB_WORKERS,
+    SUBSCRIPTION_CHECK_INTERVAL,
+    PRICE_ALERT_INTERVAL,
+    ALERT_MODE,
+    ALERT_CADENCE,
+    ALERT_MIN_INTERVAL,
+    INDICATOR_ALERT_INTERVAL,
+    JOB_LEADER_ELECTION,
+    LEADER_ELECTION_INTERVAL,
+    QUEUE_SHARDS,
+    CONSUMER_COUNT,
+    CONSUMER_INDEX,
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_PRIVATE_RATE,
+    OUTBOUND_GROUP_RATE,
+    OUTBOUND_SENDERS,
+)
+from bot.broker import envelope, sharding, topology
+from bot.broker.retry import HandlerErrors, ProcessedUpdates, RetryPolicy
+from bot.broker.worker_pool import ConsumerWorkerPool
+from bot.leader import AdvisoryLeader
+from bot.scheduler import JobScheduler
+from bot.send_scheduler import OutboundScheduler, ScheduledBot
+
+from bot.dispatcher import register_handlers
 
-from config.settings import TELEGRAM_API_TOKEN, CLOUDAMQP_URL
-
-# Import all the command handlers
-# Start and help handlers
-from bot.handlers.start import StartHandler
-from bot.handlers.subscribe import SubscribeHandler
-from bot.handlers.help import HelpHandler
-from bot.handlers.free.use_token import UseTokenHandler
-from bot.handlers.free.join_waitlist import JoinWaitlistHandler
-from bot.handlers.free.contact import ContactHandler
-
-from bot.scripts.alerts import PriceAlerts  # PatternAlerts
-
-# from CryptoSentinel.bot.scripts.fetcher import fetch_pattern_data
-
-# Free handlers
-from bot.handlers.free.cotd import CotdHandler
-from bot.handlers.free.global_top import GlobalTopHandler
-from bot.handlers.free.whatsup import WhatsupHandler
-from bot.handlers.free.gainers import GainersHandler
-from bot.handlers.free.losers import LosersHandler
-from bot.handlers.free.news import NewsHandler
-from bot.handlers.free.request_alert import PriceAlertHandler
-from bot.handlers.referral import UseReferralHandler
-
-# Premium handlers
-from bot.handlers.premium.wdom import WdomHandler
-from bot.handlers.premium.sentiment import SentimentHandler
-from bot.handlers.premium.positions import PositionsHandler
-from bot.handlers.premium.plot_chart import ChartHandler
-from bot.handlers.premium.stats import StatsHandler
-from bot.handlers.premium.signal import SignalHandler
+from bot.scripts.alerts import IndicatorAlerts, PriceAlerts  # PatternAlerts
 
 from users.management import check_expired_subscriptions
 
@@ -76,99 +76,33 @@ logger = logging.getLogger(__name__)
 
 # setup connection to RabbitMQ
 params = pika.URLParameters(CLOUDAMQP_URL)
+# handlers run on worker threads, so the connection thread is free to answer heartbeats
+params.heartbeat = 30
 connection = pika.BlockingConnection(params)
-channel = connection.channel()
-channel.queue_declare(queue='telegram')
 
 # Initialize the Telegram Bot
-bot = telegram.Bot(token=TELEGRAM_API_TOKEN)
+# All outgoing calls are paced by the outbound scheduler (global and per-chat limits)
+scheduler = OutboundScheduler(
+    global_rate=OUTBOUND_GLOBAL_RATE,
+    private_rate=OUTBOUND_PRIVATE_RATE,
+    group_rate=OUTBOUND_GROUP_RATE,
+    senders=OUTBOUND_SENDERS,
+)
+request = Request(con_pool_size=OUTBOUND_SENDERS + 4, connect_timeout=30, read_timeout=60)
+bot = ScheduledBot(token=TELEGRAM_API_TOKEN, scheduler=scheduler, request=request)
 
 # Initialize the Dispatcher
 dp = Dispatcher(bot, None, workers=1)
 
-
 # Add all command handlers to the Dispatcher
-# Add all the free handlers to the dispatcher
-dp.add_handler(CommandHandler("start", StartHandler.start))
-# dp.add_handler(CommandHandler("use_referral", UseReferralHandler.use_referral))
-dp.add_handler(CommandHandler("help", HelpHandler.help))
-dp.add_handler(CommandHandler("cotd", CotdHandler.coin_of_the_day))
-dp.add_handler(
-        CommandHandler("global_top", GlobalTopHandler.global_top, pass_args=True)
-)
-dp.add_handler(CommandHandler("use_token", UseTokenHandler.use_token))
-dp.add_handler(CommandHandler("gainers", GainersHandler.gainers))
-dp.add_handler(CommandHandler("losers", LosersHandler.losers))
-dp.add_handler(CommandHandler("news", NewsHandler.news_handler))
-dp.add_handler(
-    CommandHandler(
-        "set_alert", PriceAlertHandler.request_price_alert, pass_args=True
-    )
-)
-dp.add_handler(CommandHandler("list_alerts", PriceAlertHandler.list_alerts))
-dp.add_handler(
-        CommandHandler("remove_alert", PriceAlertHandler.remove_alert, pass_args=True)
-)
+register_handlers(dp)
 
-# Add all the paid handlers to the dispatcher
-dp.add_handler(CommandHandler("whatsup", WhatsupHandler.whatsup))
-# dp.add_handler(CommandHandler("wdom", WdomHandler.wdom_handler))
-dp.add_handler(CommandHandler("sentiment", SentimentHandler.sentiment))
-dp.add_handler(CommandHandler("positions", PositionsHandler.trader_positions))
-dp.add_handler(CommandHandler("chart", ChartHandler.plot_chart, pass_args=True))
-dp.add_handler(StatsHandler.command_handler())
-dp.add_handler(SignalHandler.command_handler())
-
-# Subscribe Handlers
-subscribe_handler = SubscribeHandler.subscribe_handler
-payment_handler = SubscribeHandler.payment_handler
-
-monthly_handler = CallbackQueryHandler(
-        SubscribeHandler.send_invoice_monthly,
-    pattern="^subscribe_monthly_subscription$",
-)
-
-three_monthly_handler = CallbackQueryHandler(
-        SubscribeHandler.send_invoice_3_monthly,
-    pattern="^subscribe_3_monthly_subscription$",
-)
-
-yearly_handler = CallbackQueryHandler(
-    SubscribeHandler.send_invoice_yearly, pattern="^subscribe_yearly_subscription$"
-)
-
-# waitlist_handler = JoinWaitlistHandler.join_waitlist_handler
-dp.add_handler(CommandHandler("join_waitlist", JoinWaitlistHandler.join_waitlist))
-dp.add_handler(ContactHandler.conversation_handler())
-
-dp.add_handler(subscribe_handler)
-dp.add_handler(payment_handler)
-dp.add_handler(monthly_handler)
-dp.add_handler(three_monthly_handler)
-dp.add_handler(yearly_handler)
-
-
-
-
-# Rate Limiting
-# Telegram has a rate limit of 30 messages per second.
-def rate_limited(max_per_second):
-    """
-    Decorator that make functions not be called faster than
-    """
-    min_interval = 1.0 / float(max_per_second)
-    def decorate(func):
-        last_time_called = [0.0]
-        def rate_limited_function(*args,**kargs):
-            elapsed = time.perf_counter() - last_time_called[0]
-            left_to_wait = min_interval - elapsed
-            if left_to_wait>0:
-                time.sleep(left_to_wait)
-            ret = func(*args,**kargs)
-            last_time_called[0] = time.perf_counter()
-            return ret
-        return rate_limited_function
-    return decorate
+# Failed updates are retried through delay queues and then dead-lettered
+# (see bot/broker/retry.py); handler errors are surfaced through an error handler
+retry_policy = RetryPolicy('telegram', delays=RETRY_DELAYS)
+processed_updates = ProcessedUpdates(ttl=PROCESSED_UPDATES_TTL)
+handler_errors = HandlerErrors()
+dp.add_error_handler(handler_errors.record)
 
 
 def check_and_revoke_expired_subscriptions():
@@ -176,53 +110,144 @@ def check_and_revoke_expired_subscriptions():
     if revoked_users is None:
         revoked_users = []
 
+    # queued at once, the outbound scheduler's senders send them side by side
     for user_id in revoked_users:
-        bot.send_message(
+        bot.queue_message(
             user_id,
             "Your subscription has expired. Please subscribe again to regain access.",
         )
         logger.info(f"Revoked access for user {user_id}")
 
-    # Schedule the next run of this function
-    threading.Timer(300, check_and_revoke_expired_subscriptions).start()
-
 
 def check_price_alerts():
     PriceAlerts.check_price_alerts(bot)
 
-    # Schedule the next run of this functio
-    threading.Timer(30, check_price_alerts).start()
 
+def check_indicator_alerts():
+    IndicatorAlerts.check_indicator_alerts(bot)
+
+
+# Recurring jobs run on the job scheduler's own threads (see bot/scheduler.py)
+# Only the consumer leading a job runs it (see bot/leader.py)
+jobs = JobScheduler(
+    workers=JOB_WORKERS,
+    leader=AdvisoryLeader() if JOB_LEADER_ELECTION else None,
+    election_interval=LEADER_ELECTION_INTERVAL,
+)
+jobs.add_interval_job(check_and_revoke_expired_subscriptions, SUBSCRIPTION_CHECK_INTERVAL, jitter=15)
+# with ALERT_MODE=worker or stream the alerts are checked by alert_worker.py instead
+# with ALERT_CADENCE the job runs often but every symbol is only fetched when due
+if ALERT_MODE == 'poll' and ALERT_CADENCE:
+    jobs.add_interval_job(check_price_alerts, ALERT_MIN_INTERVAL, jitter=1)
+elif ALERT_MODE == 'poll':
+    jobs.add_interval_job(check_price_alerts, PRICE_ALERT_INTERVAL, jitter=3)
+jobs.add_interval_job(check_indicator_alerts, INDICATOR_ALERT_INTERVAL, jitter=5)
+
+
+
+# Update Processing
+# Raises when the update could not be processed
+def process_update(update_dict) -> None:
+    update_id = update_dict.get('update_id')
+    if processed_updates.seen(update_id):
+        logging.info('Skipping already processed update: %s', update_id)
+        return
+
+    logging.info('Processing update: %s', update_dict)
+    handler_errors.run(dp.process_update, telegram.Update.de_json(update_dict, bot))
+    processed_updates.add(update_id)
+
+
+# Failed deliveries are acked after being retried, dead-lettered or dropped
+def settle_failure(ch, method, properties, body, err) -> None:
+    action = retry_policy.settle(ch, method, properties, body, err)
+    logging.error('Could not process message from %s (%s): %r', method.routing_key, action, err)
+
+
+# Worker pools of the lanes (a lane without workers processes updates inline)
+worker_pools = []
 
 
 # Message Processing
-@rate_limited(30)
-def process_message(ch, method, properties, body):
+def process_message(worker_pool, ch, method, properties, body):
     # Deserialize update from queue
-    update_json = body.decode('utf-8')
-    update_dict = json.loads(update_json)
-    # Process update
     try:
-        logging.info('Processing update: %s', update_dict)
-        dp.process_update(telegram.Update.de_json(update_dict, bot))
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-    except (TelegramError, ValueError) as err:
-        logging.error('Could not process update: %s', err)
+        update_dict = envelope.decode(body)
+    except ValueError as err:
+        settle_failure(ch, method, properties, body, err)
+        return
 
+    if worker_pool is not None:
+        worker_pool.on_message(ch, method, properties, body, update_dict)
+        return
+
+    # Process update
+    try:
+        process_update(update_dict)
+    except Exception as err:
+        settle_failure(ch, method, properties, body, err)
+        return
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+
+
+# Every lane consumes on its own channel, so its prefetch (and worker pool)
+# bounds only its own updates. Updates are spread over chat-affine shard
+# queues per lane (see bot/broker/topology.py and bot/broker/sharding.py).
+def consume_lane(lane, index) -> None:
+    workers, prefetch = LANE_CAPACITY[lane]
+    channel = connection.channel()
+    queue_names = sharding.declare_shard_queues(channel, topology.lane_base(lane), QUEUE_SHARDS)
+    retry_policy.declare(channel)
+
+    worker_pool = None
+    if workers > 0:
+        logging.info('Starting %d %s workers (prefetch %d)', workers, lane, prefetch)
+        # the lane's prefetch is split over the shards this consumer owns
+        worker_pool = ConsumerWorkerPool(
+            connection, channel, process_update, workers=workers,
+            prefetch=sharding.consumer_prefetch(prefetch, QUEUE_SHARDS, CONSUMER_COUNT), on_failure=settle_failure
+        )
+        worker_pools.append(worker_pool)
+    else:
+        channel.basic_qos(prefetch_count=1)
+
+    # Listen on every shard, preferring the ones this consumer owns
+    for shard, queue_name in enumerate(queue_names):
+        channel.basic_consume(
+            queue=queue_name,
+            on_message_callback=functools.partial(process_message, worker_pool),
+            auto_ack=False,
+            arguments={'x-priority': sharding.consumer_priority(shard, index, CONSUMER_COUNT)},
+        )
 
 
 # Main Function
 def main() -> None:
-    # Listen for messages
-    logging.info('Listening for messages...')
-    channel.basic_consume(queue='telegram', on_message_callback=process_message, auto_ack=False)
-    channel.start_consuming()
+    index = sharding.consumer_index(CONSUMER_INDEX)
+    for lane in topology.LANES:
+        consume_lane(lane, index)
+
+    logging.info('Listening for messages (consumer %d of %d)...', index + 1, CONSUMER_COUNT)
+    try:
+        # dispatches the deliveries of all lane channels
+        while True:
+            connection.process_data_events(time_limit=None)
+    finally:
+        # let in-flight handlers finish and flush their acks before closing
+        for worker_pool in worker_pools:
+            worker_pool.shutdown()
+        if connection.is_open:
+            connection.process_data_events(time_limit=0)
+            connection.close()
+        # let running jobs finish their sends before the outbound scheduler stops
+        jobs.shutdown()
+        scheduler.shutdown()
 
 if __name__ == '__main__':
-    # add 2 recurring jobs
+    # start the recurring jobs
     # 1. check for expired subscriptions
-    # 2. check for price alerts
-    check_and_revoke_expired_subscriptions()
-    check_price_alerts()
+    # 2. check for price alerts (unless alert_worker.py processes check them)
+    # 3. check for indicator alerts
+    jobs.start()
 
     main()
@@ -0,0 +1,203 @@
+# Asyncio counterpart of telegram_consumer_and_output.py.
+# Consumes the same RabbitMQ queues, but keeps hundreds of updates in flight
+# on one event loop while they wait on I/O:
+# - AMQP through aio-pika
+# - LunarCrush / RapidAPI / CoinGecko through a shared httpx.AsyncClient
+# - exchange data (candles, the symbol catalog) through the shared sync
+#   clients (bot/exchanges.py) on the executor, so every consumer of the
+#   process reuses one candle store and one rate limiter per exchange
+# - Telegram through the AsyncBot client
+# Commands without a native async handler are processed by the legacy sync
+# Dispatcher on a thread pool executor.
+# Scheduled jobs (price alerts, subscription expiry) keep running in the sync
+# consumer only.
+
+import asyncio
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+import aio_pika
+import telegram
+from telegram.ext import Dispatcher
+from telegram.utils.request import Request
+
+from config.settings import (
+    TELEGRAM_API_TOKEN,
+    CLOUDAMQP_URL,
+    ASYNC_CONSUMER_PREFETCH,
+    LANE_CAPACITY,
+    RETRY_DELAYS,
+    PROCESSED_UPDATES_TTL,
+    QUEUE_SHARDS,
+    CONSUMER_COUNT,
+    CONSUMER_INDEX,
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_PRIVATE_RATE,
+    OUTBOUND_GROUP_RATE,
+    OUTBOUND_SENDERS,
+)
+from bot.aio import http
+from bot.aio.dispatcher import AsyncDispatcher, ChatLocks
+from bot.aio.handlers import register_async_handlers
+from bot.aio.telegram import AsyncBot
+from bot.broker import envelope, sharding, topology
+from bot.broker.retry import HandlerErrors, ProcessedUpdates, RetryPolicy
+from bot.broker.worker_pool import ConsumerWorkerPool
+from bot.dispatcher import register_handlers
+from bot.send_scheduler import OutboundScheduler, ScheduledBot
+
+# Set up logging
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+# Sync and async sends share one outbound scheduler (global and per-chat limits)
+scheduler = OutboundScheduler(
+    global_rate=OUTBOUND_GLOBAL_RATE,
+    private_rate=OUTBOUND_PRIVATE_RATE,
+    group_rate=OUTBOUND_GROUP_RATE,
+    senders=OUTBOUND_SENDERS,
+)
+
+# Legacy sync Dispatcher for the handlers that have no async version yet
+request = Request(con_pool_size=OUTBOUND_SENDERS + 4, connect_timeout=30, read_timeout=60)
+bot = ScheduledBot(token=TELEGRAM_API_TOKEN, scheduler=scheduler, request=request)
+dp = Dispatcher(bot, None, workers=1)
+register_handlers(dp)
+
+# Failed updates are retried through delay queues and then dead-lettered
+# (see bot/broker/retry.py); handler errors are surfaced through an error handler
+retry_policy = RetryPolicy('telegram', delays=RETRY_DELAYS)
+processed_updates = ProcessedUpdates(ttl=PROCESSED_UPDATES_TTL)
+handler_errors = HandlerErrors()
+dp.add_error_handler(handler_errors.record)
+
+
+# Raises when the update could not be processed
+def process_update(update_dict) -> None:
+    handler_errors.run(dp.process_update, telegram.Update.de_json(update_dict, bot))
+
+
+async def declare_retry_queues(channel) -> None:
+    for name, arguments in retry_policy.retry_queues():
+        exchange = await channel.declare_exchange(name, aio_pika.ExchangeType.FANOUT)
+        queue = await channel.declare_queue(name, arguments=arguments)
+        await queue.bind(exchange)
+    await channel.declare_queue(retry_policy.dead_letter_queue, durable=True)
+
+
+# Failed deliveries are acked after being retried, dead-lettered or dropped
+async def settle_failure(channel, message, err) -> None:
+    target = retry_policy.target(message.routing_key, message.headers, err)
+    if target is not None:
+        exchange_name, routing_key, headers = target
+        if exchange_name:
+            exchange = await channel.get_exchange(exchange_name, ensure=False)
+        else:
+            exchange = channel.default_exchange
+        await exchange.publish(aio_pika.Message(message.body, headers=headers), routing_key=routing_key)
+    await message.ack()
+    logging.error('Could not process message from %s (%s): %r', message.routing_key,
+                  target[1] if target else 'dropped', err)
+
+
+async def handle_message(adp, chat_locks, channel, message) -> None:
+    try:
+        update_dict = envelope.decode(message.body)
+    except ValueError as err:
+        await settle_failure(channel, message, err)
+        return
+
+    update_id = update_dict.get('update_id')
+    if processed_updates.seen(update_id):
+        logging.info('Skipping already processed update: %s', update_id)
+        await message.ack()
+        return
+    logging.info('Processing update: %s', update_id)
+
+    # Updates of one chat are processed one after the other
+    async with chat_locks.hold(ConsumerWorkerPool.chat_key(update_dict)):
+        try:
+            await adp.process_update(update_dict)
+        except Exception as err:
+            await settle_failure(channel, message, err)
+            return
+
+    processed_updates.add(update_id)
+    await message.ack()
+
+
+# Every lane consumes on its own channel and runs its sync fallback handlers on
+# its own executor, so heavy reports cannot take the capacity of cheap commands
+# (see bot/broker/topology.py). The interactive lane keeps the large async prefetch.
+async def consume_lane(connection, lane, index, async_bot, tasks):
+    workers, prefetch = LANE_CAPACITY[lane]
+    if lane == topology.INTERACTIVE:
+        prefetch = ASYNC_CONSUMER_PREFETCH
+    executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix=f"{lane}-handler")
+    adp = AsyncDispatcher(async_bot, process_update, executor)
+    register_async_handlers(adp)
+    # updates of one chat are processed in order within the lane
+    chat_locks = ChatLocks()
+
+    channel = await connection.channel()
+    # the prefetch budget of the lane is split over the shards this consumer owns
+    # (quorum queues only support a per-consumer prefetch)
+    await channel.set_qos(prefetch_count=sharding.consumer_prefetch(prefetch, QUEUE_SHARDS, CONSUMER_COUNT))
+    await declare_retry_queues(channel)
+
+    async def on_message(message) -> None:
+        task = asyncio.ensure_future(handle_message(adp, chat_locks, channel, message))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    # Listen on every shard, preferring the ones this consumer owns
+    consumers = []
+    for shard, queue_name in enumerate(sharding.shard_queues(topology.lane_base(lane), QUEUE_SHARDS)):
+        queue = await channel.declare_queue(queue_name, durable=True, arguments=sharding.SHARD_QUEUE_ARGUMENTS)
+        consumer_tag = await queue.consume(
+            on_message,
+            no_ack=False,
+            arguments={'x-priority': sharding.consumer_priority(shard, index, CONSUMER_COUNT)},
+        )
+        consumers.append((queue, consumer_tag))
+    return executor, consumers
+
+
+async def main() -> None:
+    async_bot = AsyncBot(TELEGRAM_API_TOKEN, scheduler=scheduler)
+    tasks = set()
+
+    connection = await aio_pika.connect_robust(CLOUDAMQP_URL, heartbeat=30)
+    index = sharding.consumer_index(CONSUMER_INDEX)
+    executors, consumers = [], []
+    for lane in topology.LANES:
+        executor, lane_consumers = await consume_lane(connection, lane, index, async_bot, tasks)
+        executors.append(executor)
+        consumers.extend(lane_consumers)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logging.info('Listening for messages (consumer %d of %d)...', index + 1, CONSUMER_COUNT)
+    await stop.wait()
+
+    # Graceful shutdown: stop receiving, finish in-flight updates, close clients
+    logging.info('Shutting down...')
+    for queue, consumer_tag in consumers:
+        await queue.cancel(consumer_tag)
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    await connection.close()
+    scheduler.shutdown()
+    await http.close()
+    for executor in executors:
+        executor.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,96 +1,139 @@
 # This script listens for updates from the Telegram API.
-# When it receives a message, it publishes the message to a RabbitMQ queue.
+# When it receives an update, it publishes it to the RabbitMQ queue of its lane
+# and chat shard (see bot/broker/topology.py).
+# By default updates are long polled. With --webhook, Telegram posts them to an
+# embedded HTTP server instead (see bot/broker/webhook.py).
+# Only one producer mode may run: Telegram refuses getUpdates while a webhook
+# is set. The Procfile runs the webhook producer as the web process.
 
-import pika
-from pika.exceptions import AMQPConnectionError, ConnectionClosedByBroker
-import json
 import logging
 import telegram
-import ssl
 from telegram import Update
 from telegram.ext import (
     CallbackContext,
-    MessageHandler,
+    TypeHandler,
     Updater,
-    Filters,
 )
 
 from telegram.utils.request import Request
 import signal
 import sys
+from aiohttp import web
 
-from config.settings import TELEGRAM_API_TOKEN, CLOUDAMQP_URL
+from config.settings import (
+    TELEGRAM_API_TOKEN,
+    CLOUDAMQP_URL,
+    PUBLISHER_BUFFER_SIZE,
+    PUBLISHER_BATCH_SIZE,
+    PUBLISHER_SPILL_PATH,
+    ENVELOPE_COMPRESS_THRESHOLD,
+    QUEUE_SHARDS,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_LISTEN,
+    PORT,
+    TELEGRAM_API_URL,
+)
+from bot.broker import envelope, topology, webhook
+from bot.broker.publisher import BufferedPublisher
 
 # Set up logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
                     level=logging.INFO)
 
-# setup connection to RabbitMQ
-params = pika.URLParameters(CLOUDAMQP_URL)
-# configure heartbeat to keep connection open (even when idle for a long time) to avoid timeouts
-# send heartbeat every 30 seconds
-params.heartbeat = 30
-
-# Create a connection and channel
-def create_connection_and_channel():
-    connection = pika.BlockingConnection(params)
-    channel = connection.channel()
-    channel.queue_declare(queue='telegram')
-    return connection, channel
-
-connection, channel = create_connection_and_channel()
-
-# Handle messages
-# When a message is received, publish it to RabbitMQ
-# The message should include the update_id, chat_id, and message text
-def handle_message(update: Update, context: CallbackContext) -> None:
-    global connection
-    global channel
-    logging.info('Received message: %s', update.message.text)
-    update_dict = update.to_dict()
-    update_json = json.dumps(update_dict, default=str)  # handle None values
-    while True:
-        try:
-            channel.basic_publish(exchange='',
-                                  routing_key='telegram',
-                                  body=update_json)
-            logging.info('Update published to RabbitMQ')
-            break
-        except (ConnectionClosedByBroker, AMQPConnectionError, ssl.SSLEOFError) as err:
-            logging.error('Could not publish update to RabbitMQ: %s', err)
-            # Close the old connection and create a new one
-            try:
-                connection.close()
-            except AMQPConnectionError:
-                pass  # Ignore errors when closing a broken connection
-            connection, channel = create_connection_and_channel()
+# Declared on every connect, updates left in the unsharded queue are moved to the shards
+async def declare_queues(channel) -> None:
+    await topology.declare_async(channel, QUEUE_SHARDS)
+    await topology.drain_legacy_queue(channel, QUEUE_SHARDS)
+
+# Publishing happens on a dedicated thread so broker outages never stall polling
+# The heartbeat keeps the connection open (even when idle for a long time) to avoid timeouts
+publisher = BufferedPublisher(
+    CLOUDAMQP_URL,
+    queue_name='telegram',
+    maxsize=PUBLISHER_BUFFER_SIZE,
+    spill_path=PUBLISHER_SPILL_PATH,
+    batch_size=PUBLISHER_BATCH_SIZE,
+    declare=declare_queues,
+    heartbeat=30,
+)
+
+# Publish updates
+# The update is wrapped in a compact envelope (see bot/broker/envelope.py)
+# and routed to its lane and chat shard (see bot/broker/topology.py)
+# Returns False if the update had to be dropped
+def publish_update(update_dict) -> bool:
+    routing_key = topology.route(update_dict, QUEUE_SHARDS)
+    if routing_key is None:
+        logging.debug('Skipping unhandled update: %s', update_dict.get('update_id'))
+        return True
+    logging.info('Received update %s for %s', update_dict.get('update_id'), routing_key)
+    body = envelope.encode(update_dict, ENVELOPE_COMPRESS_THRESHOLD)
+    return publisher.publish(body, routing_key=routing_key)
+
+# Handle updates
+# Every update type is forwarded (commands, callback queries, payments).
+def handle_update(update: Update, context: CallbackContext) -> None:
+    publish_update(update.to_dict())
 
 # Signal handling for graceful shutdown
 def signal_handler(sig, frame):
-    logging.info('Signal received, closing RabbitMQ connection...')
-    try:
-        connection.close()
-    except AMQPConnectionError:
-        pass  # Ignore errors when closing a broken connection
+    logging.info('Signal received, flushing RabbitMQ publisher...')
+    publisher.stop()
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
-# Main function
-def main() -> None:
+# Long polling
+def run_polling() -> None:
     request = Request(connect_timeout=60, read_timeout=60, con_pool_size=8)
     bot = telegram.Bot(token=TELEGRAM_API_TOKEN, request=request)
     updater = Updater(bot=bot, use_context=True)
 
-    # Listen for messages
-    updater.dispatcher.add_handler(MessageHandler(Filters.text, handle_message))
+    # Listen for all updates
+    updater.dispatcher.add_handler(TypeHandler(Update, handle_update))
 
     # Publish messages to RabbitMQ
     logging.info('Listening for messages...')
-    updater.start_polling()
+    updater.start_polling(allowed_updates=list(topology.UPDATE_TYPES))
     updater.idle()
 
+# Webhook
+# Telegram posts updates to WEBHOOK_URL + WEBHOOK_PATH, they are published
+# without building a telegram.Update
+def run_webhook() -> None:
+    if not WEBHOOK_URL or not WEBHOOK_SECRET_TOKEN:
+        sys.exit('WEBHOOK_URL and WEBHOOK_SECRET_TOKEN are required in webhook mode')
+
+    app = webhook.create_app(publish_update, WEBHOOK_SECRET_TOKEN, WEBHOOK_PATH)
+
+    async def register_webhook(app) -> None:
+        await webhook.set_webhook(
+            TELEGRAM_API_TOKEN,
+            WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            WEBHOOK_SECRET_TOKEN,
+            base_url=TELEGRAM_API_URL,
+            allowed_updates=topology.UPDATE_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+
+    app.on_startup.append(register_webhook)
+    logging.info('Listening for webhook updates on port %d...', PORT)
+    web.run_app(app, host=WEBHOOK_LISTEN, port=PORT)
+
+# Main function
+def main() -> None:
+    if '--webhook' in sys.argv[1:]:
+        run_webhook()
+    else:
+        run_polling()
+
+    # polling and the webhook server return once stopped on SIGINT/SIGTERM
+    logging.info('Flushing RabbitMQ publisher...')
+    publisher.stop()
+
 if __name__ == '__main__':
     main()
-
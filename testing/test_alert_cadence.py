@@ -0,0 +1,46 @@
+import unittest
+
+from bot.scripts.alert_cadence import AlertCadence, average_true_range
+
+
+def candles(closes, spread=0.0):
+    return [[i * 60000, close, close + spread, close - spread, close, 1] for i, close in enumerate(closes)]
+
+
+class TestAlertCadence(unittest.TestCase):
+    def test_average_true_range(self):
+        self.assertIsNone(average_true_range(candles([100] * 14)))
+        # every candle spans 2 and gaps 1 from the previous close
+        rows = candles([100 + (i % 2) for i in range(15)], spread=1)
+        self.assertAlmostEqual(average_true_range(rows), 2 / rows[-1][4])
+
+    def test_interval_follows_distance_and_volatility(self):
+        cadence = AlertCadence(min_interval=5, max_interval=300, safety=3)
+        # unknown volatility or distance: as often as allowed
+        self.assertEqual(cadence.interval("BTCUSDT", 0.01), 5)
+        cadence.set_volatility("BTCUSDT", 0.001, now=0)
+        self.assertEqual(cadence.interval("BTCUSDT", None), 5)
+
+        self.assertEqual(cadence.interval("BTCUSDT", 0.0003), 5)
+        # 3 ATRs away: about one minute
+        self.assertAlmostEqual(cadence.interval("BTCUSDT", 0.003), 60)
+        self.assertEqual(cadence.interval("BTCUSDT", 0.4), 300)
+
+    def test_due_reset_and_volatility_ttl(self):
+        cadence = AlertCadence(min_interval=5, max_interval=300, volatility_ttl=900)
+        cadence.set_volatility("BTCUSDT", 0.001, now=0)
+        cadence.schedule("BTCUSDT", 0, 0.4)
+        cadence.schedule("ETHUSDT", 0, 0.4)
+
+        self.assertEqual(cadence.due(["BTCUSDT", "ETHUSDT", "SOLUSDT"], 10), ["ETHUSDT", "SOLUSDT"])
+        self.assertEqual(cadence.due(["BTCUSDT"], 300), ["BTCUSDT"])
+        cadence.reset("BTCUSDT")
+        self.assertEqual(cadence.due(["BTCUSDT"], 10), ["BTCUSDT"])
+
+        self.assertFalse(cadence.needs_volatility("BTCUSDT", 899))
+        self.assertTrue(cadence.needs_volatility("BTCUSDT", 900))
+        self.assertTrue(cadence.needs_volatility("ETHUSDT", 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import random
+import time
+import unittest
+from decimal import Decimal
+
+from bot.scripts.alert_index import AlertIndex, to_scaled
+
+
+class TestAlertIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = AlertIndex(tolerance=Decimal("0.005"))
+
+    def ids(self, records):
+        return sorted(record.alert_id for record in records)
+
+    def test_first_price_triggers_alerts_within_the_band(self):
+        self.index.add(1, 10, "BTCUSDT", "100")
+        self.index.add(2, 10, "BTCUSDT", "100.6")
+        self.index.add(3, 10, "BTCUSDT", "99.4")
+
+        self.assertEqual(self.ids(self.index.on_price("BTCUSDT", "100.05")), [1])
+        self.assertEqual(len(self.index), 2)
+
+    def test_alerts_trigger_when_the_price_reaches_them(self):
+        self.index.on_price("BTCUSDT", 100)
+        self.index.add(1, 10, "BTCUSDT", "110")
+        self.index.add(2, 10, "BTCUSDT", "120")
+        self.index.add(3, 10, "BTCUSDT", "90")
+        self.index.add(4, 10, "BTCUSDT", "80")
+
+        self.assertEqual(self.index.on_price("BTCUSDT", 105), [])
+        # a jump past several levels triggers all of them
+        self.assertEqual(self.ids(self.index.on_price("BTCUSDT", 125)), [1, 2])
+        self.assertEqual(self.ids(self.index.on_price("BTCUSDT", "90.4")), [3])
+        self.assertEqual(self.index.on_price("BTCUSDT", 85), [])
+        self.assertEqual(self.index.on_price("ETHUSDT", 85), [])
+
+    def test_range_triggers_crossed_levels(self):
+        index = AlertIndex(tolerance=Decimal("0"))
+        index.add(1, 10, "BTCUSDT", "110")
+        index.add(2, 10, "BTCUSDT", "90")
+        index.add(3, 10, "BTCUSDT", "130")
+
+        # the first price has nothing to cross from, its range is ignored
+        self.assertEqual(index.on_range("BTCUSDT", 200, 50, 100), [])
+
+        # up to 112 and back, then down to 89 and back
+        self.assertEqual(self.ids(index.on_range("BTCUSDT", 112, 99, 101)), [1])
+        self.assertEqual(self.ids(index.on_range("BTCUSDT", 102, 89, 100)), [2])
+        self.assertEqual(index.last_price("BTCUSDT"), to_scaled(100))
+        self.assertEqual(len(index), 1)
+
+    def test_new_alerts_ignore_moves_before_they_were_set(self):
+        index = AlertIndex(tolerance=Decimal("0"))
+        index.on_price("BTCUSDT", 100)
+        index.add(1, 10, "BTCUSDT", "96")
+        # the dip to 95 may be from before the alert
+        self.assertEqual(index.on_range("BTCUSDT", 101, 95, 100), [])
+        # the next range still starts in the candle of that price
+        self.assertEqual(index.on_range("BTCUSDT", 101, 95, 100, recent=(100, 99)), [])
+        self.assertEqual(self.ids(index.on_range("BTCUSDT", 101, 95, 100, recent=(100, 95))), [1])
+
+        # the last price is stale: the alert is placed against the current one
+        index.add(2, 10, "BTCUSDT", "105")
+        self.assertEqual(index.on_range("BTCUSDT", 110, 100, 110), [])
+        self.assertEqual(self.ids(index.on_range("BTCUSDT", 110, 104, 108)), [2])
+
+    def test_remove(self):
+        self.index.add(1, 10, "BTCUSDT", "100")
+        self.index.on_price("BTCUSDT", 50)
+        self.index.add(2, 10, "BTCUSDT", "100")
+
+        self.assertEqual(self.index.remove(1).alert_id, 1)
+        self.assertIsNone(self.index.remove(1))
+        self.assertEqual(self.ids(self.index.on_price("BTCUSDT", 100)), [2])
+        self.assertEqual(self.index.symbols(), [])
+
+    def test_restored_records_keep_their_side(self):
+        self.index.add(1, 10, "BTCUSDT", "100")
+        self.index.on_price("BTCUSDT", 90)
+        triggered = self.index.on_price("BTCUSDT", 110)
+
+        self.index.restore(triggered)
+        self.assertEqual(self.ids(self.index.on_price("BTCUSDT", 105)), [1])
+
+    def test_scaled_prices_are_exact(self):
+        self.assertEqual(to_scaled("0.00000123"), 123)
+        self.assertEqual(to_scaled(30000.5), 3000050000000)
+
+    def test_large_index_ticks_fast(self):
+        random.seed(1)
+        for alert_id in range(200000):
+            self.index.add(alert_id, alert_id, "BTCUSDT", round(random.uniform(10000, 50000), 2))
+        # the first price sorts the loaded alerts onto their sides
+        self.index.on_price("BTCUSDT", 30000)
+
+        start = time.perf_counter()
+        for _ in range(1000):
+            self.index.on_price("BTCUSDT", 30000)
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
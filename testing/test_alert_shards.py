@@ -0,0 +1,94 @@
+import unittest
+from collections import Counter
+from decimal import Decimal
+
+from config import settings
+
+if not settings.MY_POSTGRESQL_URL:
+    settings.MY_POSTGRESQL_URL = "sqlite://"
+
+from bot.database import PriceAlertRequest, Session
+from bot.leader import AdvisoryLeader
+from bot.scripts.alert_engine import AlertEngine
+from bot.scripts.alert_shards import ShardCoordinator, shard_of
+from test_leader import FakePostgres
+
+
+class TestAlertShards(unittest.TestCase):
+    def setUp(self):
+        self.server = FakePostgres()
+
+    def worker(self, shards=16):
+        return ShardCoordinator(AdvisoryLeader(connect=self.server.connect), shards=shards, max_workers=8)
+
+    def test_shard_of_is_stable_and_spread(self):
+        symbols = [f"COIN{i}USDT" for i in range(1000)]
+        self.assertEqual([shard_of(symbol, 16) for symbol in symbols], [shard_of(symbol, 16) for symbol in symbols])
+        counts = Counter(shard_of(symbol, 16) for symbol in symbols)
+        self.assertEqual(set(counts), set(range(16)))
+        self.assertLess(max(counts.values()), 100)
+
+    def test_workers_rebalance_when_joining_and_dying(self):
+        a = self.worker()
+        self.assertTrue(a.rebalance())
+        self.assertEqual(len(a.owned()), 16)
+
+        # b joins: a gives up half on its next rebalance, b takes them
+        b = self.worker()
+        b.rebalance()
+        self.assertEqual(b.owned(), frozenset())
+        a.rebalance()
+        b.rebalance()
+        self.assertEqual(len(a.owned()), 8)
+        self.assertEqual(len(b.owned()), 8)
+        self.assertEqual(a.owned() | b.owned(), frozenset(range(16)))
+        self.assertFalse(a.rebalance())
+
+        # three workers: at most ceil(16 / 3) each, every shard owned
+        c = self.worker()
+        for _ in range(3):
+            for worker in (a, b, c):
+                worker.rebalance()
+        self.assertEqual(a.owned() | b.owned() | c.owned(), frozenset(range(16)))
+        self.assertTrue(all(len(worker.owned()) <= 6 for worker in (a, b, c)))
+        self.assertFalse(a.owned() & b.owned() or b.owned() & c.owned() or a.owned() & c.owned())
+
+        # a dies: its session closes and the others take over its shards
+        a.leader.release_all()
+        for _ in range(2):
+            for worker in (b, c):
+                worker.rebalance()
+        self.assertEqual(b.owned() | c.owned(), frozenset(range(16)))
+        self.assertEqual(len(b.owned()) + len(c.owned()), 16)
+
+    def test_engine_indexes_owned_symbols_only(self):
+        session = Session()
+        session.query(PriceAlertRequest).delete()
+        symbols = [f"COIN{i}USDT" for i in range(20)]
+        for user_id, symbol in enumerate(symbols):
+            session.add(PriceAlertRequest(user_id=user_id, symbol=symbol, price_level=Decimal("1")))
+        session.commit()
+
+        try:
+            a, b = self.worker(shards=4), self.worker(shards=4)
+            engine_a = AlertEngine(exchange=object(), shards=a)
+            engine_b = AlertEngine(exchange=object(), shards=b)
+            engine_a.sync(session)
+            engine_b.sync(session)
+            self.assertEqual(len(engine_a.index), 20)
+
+            # a hands half the shards to b: both reload their owned alerts
+            engine_a.sync(session)
+            engine_b.sync(session)
+            owned_a = {s for s in symbols if shard_of(s, 4) in a.owned()}
+            self.assertEqual(set(engine_a.index.symbols()), owned_a)
+            self.assertEqual(set(engine_b.index.symbols()), set(symbols) - owned_a)
+            self.assertEqual(engine_a.table_checksum(session), engine_a.index.checksum())
+        finally:
+            session.query(PriceAlertRequest).delete()
+            session.commit()
+            session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from config import settings
+
+if not settings.MY_POSTGRESQL_URL:
+    settings.MY_POSTGRESQL_URL = "sqlite://"
+
+from bot.database import Base, PriceAlertRequest
+from bot.scripts.alert_engine import AlertEngine
+from bot.scripts.alert_stream import AlertStreamer, ExchangeTradeFeed, ReplayFeed
+
+
+class FakeProExchange:
+    """ccxt.pro stand-in: watch_trades returns the queued batches of a symbol."""
+
+    markets = {"BTCUSDT": {"symbol": "BTC/USDT"}, "ETHUSDT": {"symbol": "ETH/USDT"}}
+
+    def __init__(self):
+        self.batches = {}
+        self.watched = []
+        self.closed = False
+
+    async def load_markets(self):
+        return self.markets
+
+    def market(self, symbol):
+        return self.markets[symbol]
+
+    async def watch_trades(self, symbol):
+        self.watched.append(symbol)
+        queue = self.batches.setdefault(symbol, asyncio.Queue())
+        return await queue.get()
+
+    async def close(self):
+        self.closed = True
+
+
+class TestAlertStream(unittest.TestCase):
+    def setUp(self):
+        # a file database, the streamer reads it from executor threads
+        self.dir = tempfile.TemporaryDirectory()
+        engine = create_engine(f"sqlite:///{os.path.join(self.dir.name, 'alerts.db')}")
+        Base.metadata.create_all(engine, tables=[PriceAlertRequest.__table__])
+        self.session_factory = sessionmaker(bind=engine)
+        self.bot = MagicMock()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def add_alert(self, user_id, symbol, level):
+        session = self.session_factory()
+        session.add(PriceAlertRequest(user_id=user_id, symbol=symbol, price_level=Decimal(level)))
+        session.commit()
+        session.close()
+
+    def remaining(self):
+        session = self.session_factory()
+        try:
+            return session.query(PriceAlertRequest).count()
+        finally:
+            session.close()
+
+    def replay(self, lines):
+        path = os.path.join(self.dir.name, "prices.csv")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        engine = AlertEngine(exchange=MagicMock(), tolerance=Decimal("0"), session_factory=self.session_factory)
+        streamer = AlertStreamer(engine, ReplayFeed(path), self.bot, sync_interval=3600)
+        return asyncio.run(streamer.run())
+
+    def test_wick_between_polls_triggers(self):
+        self.add_alert(1, "BTCUSDT", "31000")
+        self.add_alert(2, "BTCUSDT", "29000")
+
+        # a one-trade spike to 31000 that a 30s poll would miss
+        sent = self.replay([
+            "timestamp,symbol,price",
+            "1000,BTCUSDT,30000",
+            "1100,BTCUSDT,31000.5",
+            '{"timestamp": 1200, "symbol": "BTCUSDT", "price": 30100}',
+        ])
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(self.bot.queue_message.call_args.kwargs["chat_id"], 1)
+        self.assertIn("31000.5", self.bot.queue_message.call_args.kwargs["text"])
+        self.assertEqual(self.remaining(), 1)
+
+    def test_failed_delivery_triggers_again_on_the_next_price(self):
+        self.add_alert(1, "BTCUSDT", "31000")
+        path = os.path.join(self.dir.name, "prices.csv")
+        with open(path, "w") as f:
+            f.write("1000,BTCUSDT,30000\n1100,BTCUSDT,31200\n1200,BTCUSDT,31100\n")
+        engine = AlertEngine(exchange=MagicMock(), tolerance=Decimal("0"), session_factory=self.session_factory)
+        streamer = AlertStreamer(engine, ReplayFeed(path), self.bot, sync_interval=3600)
+        deliver, failures = streamer._deliver, [ConnectionError("database is down")]
+
+        def flaky_deliver(triggered):
+            if failures:
+                raise failures.pop()
+            return deliver(triggered)
+
+        streamer._deliver = flaky_deliver
+        # still above its level: the restored alert keeps its side and triggers
+        self.assertEqual(asyncio.run(streamer.run()), 1)
+        self.assertIn("31100", self.bot.queue_message.call_args.kwargs["text"])
+        self.assertEqual(self.remaining(), 0)
+
+    def test_unsubscribed_symbols_are_ignored(self):
+        self.add_alert(1, "BTCUSDT", "31000")
+
+        sent = self.replay(["1000,BTCUSDT,30000", "1100,ETHUSDT,40000"])
+
+        self.assertEqual(sent, 0)
+        self.bot.queue_message.assert_not_called()
+
+    def test_deleted_alert_is_not_sent(self):
+        self.add_alert(1, "BTCUSDT", "31000")
+        engine = AlertEngine(exchange=MagicMock(), tolerance=Decimal("0"), session_factory=self.session_factory)
+        streamer = AlertStreamer(engine, ReplayFeed(os.devnull), self.bot)
+
+        async def run():
+            await streamer.sync()
+            triggered = engine.index.on_price("BTCUSDT", "30000") + engine.index.on_price("BTCUSDT", "31000")
+            # the user removed the alert after it was indexed
+            session = self.session_factory()
+            session.query(PriceAlertRequest).delete()
+            session.commit()
+            session.close()
+            return streamer._deliver(triggered)
+
+        self.assertEqual(asyncio.run(run()), 0)
+        self.bot.queue_message.assert_not_called()
+
+    def test_trade_feed_resubscribes_and_coalesces(self):
+        exchange = FakeProExchange()
+        feed = ExchangeTradeFeed(exchange)
+
+        async def run():
+            await feed.subscribe(["BTCUSDT", "ETHUSDT", "NOPE"])
+            self.assertEqual(feed.symbols(), {"BTCUSDT", "ETHUSDT"})
+            await asyncio.sleep(0)
+
+            # two batches arrive before the consumer reads: only their high and low are kept
+            queue = exchange.batches["BTC/USDT"]
+            queue.put_nowait([{"price": 30000.0}, {"price": 30500.0}])
+            queue.put_nowait([{"price": 29800.0}])
+            for _ in range(5):
+                await asyncio.sleep(0)
+
+            updates = feed.updates()
+            received = [await updates.__anext__(), await updates.__anext__()]
+
+            await feed.subscribe(["ETHUSDT"])
+            symbols = feed.symbols()
+            await feed.close()
+            return received, symbols
+
+        received, symbols = asyncio.run(run())
+
+        self.assertEqual(received, [("BTCUSDT", 30500.0), ("BTCUSDT", 29800.0)])
+        self.assertEqual(symbols, {"ETHUSDT"})
+        self.assertTrue(exchange.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, MagicMock
+
+from bot.aio.dispatcher import AsyncDispatcher, ChatLocks
+
+
+def command_update(text):
+    return {
+        "update_id": 1,
+        "message": {
+            "message_id": 10,
+            "text": text,
+            "chat": {"id": 5, "type": "private"},
+            "from": {"id": 5, "is_bot": False, "first_name": "Test"},
+        },
+    }
+
+
+class TestAsyncDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.fallback = MagicMock(return_value=True)
+        self.dispatcher = AsyncDispatcher(MagicMock(), self.fallback, self.executor)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_parse_command(self):
+        self.assertEqual(
+            AsyncDispatcher.parse_command(command_update("/News@cryptosentinel_bot CoinDesk 3")),
+            ("news", ["CoinDesk", "3"]),
+        )
+        self.assertEqual(AsyncDispatcher.parse_command(command_update("hello")), (None, None))
+        self.assertEqual(AsyncDispatcher.parse_command({"callback_query": {}}), (None, None))
+
+    def test_native_handler(self):
+        handler = AsyncMock()
+        self.dispatcher.add_command("global_top", handler)
+
+        asyncio.run(self.dispatcher.process_update(command_update("/global_top alt_rank")))
+
+        context = handler.await_args[0][1]
+        self.assertEqual(context.args, ["alt_rank"])
+        self.assertEqual(context.chat_id, 5)
+        self.fallback.assert_not_called()
+
+    def test_unknown_command_uses_sync_fallback(self):
+        update = command_update("/positions")
+
+        asyncio.run(self.dispatcher.process_update(update))
+
+        self.fallback.assert_called_once_with(update)
+
+    def test_handler_errors_are_raised(self):
+        self.dispatcher.add_command("news", AsyncMock(side_effect=ConnectionError("down")))
+
+        with self.assertRaises(ConnectionError):
+            asyncio.run(self.dispatcher.process_update(command_update("/news")))
+
+
+class TestChatLocks(unittest.TestCase):
+    def test_same_chat_is_serialized_and_lock_released(self):
+        locks = ChatLocks()
+        order = []
+
+        async def work(key, name, delay):
+            async with locks.hold(key):
+                order.append(f"{name}-start")
+                await asyncio.sleep(delay)
+                order.append(f"{name}-end")
+
+        async def run():
+            await asyncio.gather(work(1, "a", 0.02), work(1, "b", 0), work(2, "c", 0))
+
+        asyncio.run(run())
+
+        self.assertLess(order.index("a-end"), order.index("b-start"))
+        self.assertLess(order.index("c-end"), order.index("a-end"))
+        self.assertEqual(locks._locks, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
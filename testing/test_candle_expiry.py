@@ -0,0 +1,125 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from bot import candle_expiry
+from bot.candle_expiry import AlignedCache, aligned_cached, expires_at, is_timeframe, next_close
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+class TestNextClose(unittest.TestCase):
+    def test_aligned_to_the_timeframe(self):
+        now = utc(2024, 3, 13, 10, 17, 30)  # a Wednesday
+        self.assertEqual(next_close("1m", now), utc(2024, 3, 13, 10, 18))
+        self.assertEqual(next_close("15m", now), utc(2024, 3, 13, 10, 30))
+        self.assertEqual(next_close("1h", now), utc(2024, 3, 13, 11))
+        self.assertEqual(next_close("4h", now), utc(2024, 3, 13, 12))
+        self.assertEqual(next_close("1d", now), utc(2024, 3, 14))
+        self.assertEqual(next_close("1w", now), utc(2024, 3, 18))  # Monday
+        self.assertEqual(next_close("1M", now), utc(2024, 4, 1))
+        self.assertEqual(next_close("1M", utc(2024, 12, 31)), utc(2025, 1, 1))
+        # exactly on a close: the next one
+        self.assertEqual(next_close("1h", utc(2024, 3, 13, 11)), utc(2024, 3, 13, 12))
+
+    def test_expiry_waits_for_the_closed_candle(self):
+        self.assertEqual(expires_at("1h", utc(2024, 3, 13, 10, 17), delay=5), utc(2024, 3, 13, 11, 0, 5))
+        # fetched before the closed candle was published: expires right after it is
+        self.assertEqual(expires_at("1h", utc(2024, 3, 13, 11, 0, 2), delay=5), utc(2024, 3, 13, 11, 0, 5))
+        self.assertEqual(expires_at("1h", utc(2024, 3, 13, 11, 0, 6), delay=5), utc(2024, 3, 13, 12, 0, 5))
+
+    def test_invalid_timeframes_get_the_default_max_age(self):
+        for timeframe in ("4", "h", "0h", "1x", "1.5h", "4H", "", None):
+            self.assertFalse(is_timeframe(timeframe))
+            self.assertEqual(expires_at(timeframe, 1000.0), 1000.0 + candle_expiry.CACHE_DEFAULT_MAX_AGE)
+            with self.assertRaises(ValueError):
+                next_close(timeframe, 1000.0)
+        self.assertTrue(is_timeframe("15m"))
+
+
+class TestAlignedCache(unittest.TestCase):
+    def setUp(self):
+        self.now = utc(2024, 3, 13, 10, 17)
+        patcher = patch.object(candle_expiry.time, "time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_expires_at_the_next_close(self):
+        cache = AlignedCache(delay=0)
+        loads = []
+
+        def loader():
+            loads.append(self.now)
+            return len(loads)
+
+        self.assertEqual(cache.get("BTC", "1h", loader), (1, False))
+        self.now = utc(2024, 3, 13, 10, 59, 59)
+        self.assertEqual(cache.get("BTC", "1h", loader), (1, True))
+        self.now = utc(2024, 3, 13, 11)
+        self.assertEqual(cache.get("BTC", "1h", loader), (2, False))
+        self.assertEqual(cache.stats()["misses"], 2)
+
+        # a daily series is not refetched before midnight
+        cache.get("ETH", "1d", loader)
+        self.now = utc(2024, 3, 13, 23, 59)
+        self.assertEqual(cache.get("ETH", "1d", loader), (3, True))
+
+    def test_stale_while_revalidate(self):
+        cache = AlignedCache(stale=30, delay=0)
+        refreshed = threading.Event()
+        cache.get("BTC", "1m", lambda: "old")
+
+        def loader():
+            refreshed.set()
+            return "new"
+
+        self.now = utc(2024, 3, 13, 10, 18, 10)
+        self.assertEqual(cache.get("BTC", "1m", loader), ("old", True))
+        self.assertTrue(refreshed.wait(5))
+        for _ in range(50):
+            if cache.get("BTC", "1m", loader)[0] == "new":
+                break
+            time.sleep(0.02)
+        self.assertEqual(cache.get("BTC", "1m", loader), ("new", True))
+
+        # past the stale window the caller waits for the new value
+        self.now = utc(2024, 3, 13, 10, 20, 0)
+        self.assertEqual(cache.get("BTC", "1m", lambda: "newer"), ("newer", False))
+
+    def test_size_bound(self):
+        cache = AlignedCache(maxsize=10, getsizeof=len)
+        cache.get("a", "1h", lambda: "x" * 6)
+        cache.get("b", "1h", lambda: "y" * 6)
+        self.assertEqual(cache.stats()["entries"], 1)
+        # larger than the cache: returned, not stored
+        self.assertEqual(cache.get("c", "1h", lambda: "z" * 20), ("z" * 20, False))
+        self.assertEqual(cache.stats()["size"], 6)
+
+    def test_invalid_timeframe_is_cached_for_the_default_max_age(self):
+        cache = AlignedCache(delay=0)
+        self.assertEqual(cache.get("BTC", "4x", lambda: 1), (1, False))
+        self.assertEqual(cache.get("BTC", "4x", lambda: 2), (1, True))
+        self.now += candle_expiry.CACHE_DEFAULT_MAX_AGE
+        self.assertEqual(cache.get("BTC", "4x", lambda: 3), (3, False))
+
+    def test_decorator(self):
+        cache = AlignedCache()
+        calls = []
+
+        @aligned_cached(cache, timeframe=lambda symbol, timeframe: timeframe)
+        def fetch(symbol, timeframe):
+            calls.append((symbol, timeframe))
+            return symbol + timeframe
+
+        self.assertEqual(fetch("BTC", "4h"), "BTC4h")
+        self.assertEqual(fetch("BTC", "4h"), "BTC4h")
+        self.assertEqual(fetch("BTC", "1h"), "BTC1h")
+        self.assertEqual(calls, [("BTC", "4h"), ("BTC", "1h")])
+
+
+if __name__ == "__main__":
+    unittest.main()
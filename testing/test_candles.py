@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+
+import ccxt
+import numpy as np
+
+from bot.candles import CANDLE_DTYPE, CandleStore
+
+HOUR = 3600 * 1000
+START = 1_700_000_000_000 - 1_700_000_000_000 % HOUR
+
+
+class FakeExchange:
+    def __init__(self, first=START, now=START + 500 * HOUR + 10 * 60000, page=100):
+        self.first = first
+        self.now = now
+        self.page = page
+        self.calls = []
+
+    @staticmethod
+    def parse_timeframe(timeframe):
+        return {"1h": 3600}[timeframe]
+
+    def milliseconds(self):
+        return self.now
+
+    @staticmethod
+    def market(symbol):
+        if symbol not in ("BTCUSDT", "BTC/USDT"):
+            raise ccxt.BadSymbol(symbol)
+        return {"symbol": "BTC/USDT"}
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append(since)
+        start = max(since, self.first)
+        start += -start % HOUR
+        rows = []
+        for time in range(start, self.now + 1, HOUR)[:min(limit, self.page)]:
+            price = (time - START) / HOUR
+            rows.append([time, price, price + 2, price - 2, price + 1, 10.0])
+        return rows
+
+
+class TestCandleStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.exchange = FakeExchange()
+        self.store = CandleStore(self.directory.name, exchange_factory=lambda name: self.exchange, page_size=100)
+
+    def test_incremental_fetch_after_the_last_stored_close(self):
+        rows = self.store.candles("bybit", "BTCUSDT", "1h", limit=50)
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(rows[-1][0], START + 500 * HOUR)  # the candle still open
+        stored = self.store.read("bybit", "BTC/USDT", "1h")
+        self.assertIsInstance(stored, np.memmap)
+        self.assertEqual(len(stored), 49)
+        self.assertEqual(stored["time"][-1], START + 499 * HOUR)
+
+        # two more candles close: only they and the open one are fetched
+        self.exchange.calls.clear()
+        self.exchange.now += 2 * HOUR
+        rows = self.store.candles("bybit", "BTC/USDT", "1h", limit=50)
+        self.assertEqual(self.exchange.calls, [START + 500 * HOUR])
+        self.assertEqual([row[0] for row in rows[-3:]], [START + 500 * HOUR, START + 501 * HOUR, START + 502 * HOUR])
+        self.assertEqual(len(self.store.read("bybit", "BTC/USDT", "1h")), 51)
+        self.assertEqual(rows[-2], [START + 501 * HOUR, 501.0, 503.0, 499.0, 502.0, 10.0])
+
+    def test_older_history_is_merged_in_once(self):
+        self.store.candles("bybit", "BTCUSDT", "1h", limit=10)
+        self.exchange.calls.clear()
+
+        since = START + 200 * HOUR
+        rows = self.store.candles("bybit", "BTCUSDT", "1h", since=since)
+        self.assertEqual(rows[0][0], since)
+        self.assertEqual(len(rows), 301)
+        times = self.store.read("bybit", "BTCUSDT", "1h")["time"]
+        self.assertTrue((np.diff(times) == HOUR).all())
+        # three pages of older history and one for the open candle
+        self.assertEqual(len(self.exchange.calls), 4)
+
+        # history the exchange does not have is only asked for once
+        self.exchange.first = START + 100 * HOUR
+        self.store.candles("bybit", "BTCUSDT", "1h", since=START)
+        self.exchange.calls.clear()
+        rows = self.store.candles("bybit", "BTCUSDT", "1h", since=START)
+        self.assertEqual(rows[0][0], START + 100 * HOUR)
+        self.assertEqual(len(self.exchange.calls), 1)
+
+    def test_pages_capped_by_the_exchange(self):
+        self.store.candles("bybit", "BTCUSDT", "1h", limit=5)
+        # 150 candles behind on an exchange returning at most 40 per page
+        self.exchange.page = 40
+        self.exchange.now += 150 * HOUR
+        rows = self.store.candles("bybit", "BTCUSDT", "1h", limit=200)
+
+        times = self.store.read("bybit", "BTC/USDT", "1h")["time"]
+        self.assertTrue((np.diff(times) == HOUR).all())
+        self.assertEqual(times[-1], START + 649 * HOUR)
+        self.assertEqual(rows[-1][0], START + 650 * HOUR)
+
+    def test_partial_record_is_dropped(self):
+        self.store.candles("bybit", "BTCUSDT", "1h", limit=5)
+        path = self.store.path("bybit", "BTC/USDT", "1h")
+        with open(path, "ab") as f:
+            f.write(b"\0" * 7)
+        self.assertEqual(len(self.store.read("bybit", "BTC/USDT", "1h")), 4)
+
+        self.exchange.now += HOUR
+        self.store.candles("bybit", "BTCUSDT", "1h", limit=5)
+        self.assertEqual(os.path.getsize(path), 5 * CANDLE_DTYPE.itemsize)
+
+    def test_unknown_symbol(self):
+        with self.assertRaises(ccxt.BadSymbol):
+            self.store.candles("bybit", "NOPE", "1h")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import unittest
+
+from telegram import Bot, Update
+
+from bot.broker import envelope
+
+
+def full_update(text="/chart BTCUSDT 4h"):
+    return {
+        "update_id": 1001,
+        "message": {
+            "message_id": 55,
+            "date": 1684000000,
+            "text": text,
+            "chat": {"id": 42, "type": "private", "first_name": "Test", "photo": {"small_file_id": "x"}},
+            "from": {"id": 42, "is_bot": False, "first_name": "Test", "username": "tester", "is_premium": True},
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            "reply_markup": {"inline_keyboard": []},
+            "forward_from": {"id": 7, "is_bot": False, "first_name": "Other"},
+        },
+    }
+
+
+class TestEnvelope(unittest.TestCase):
+    def test_round_trip_keeps_handler_fields_only(self):
+        body = envelope.encode(full_update())
+        decoded = envelope.decode(body)
+
+        self.assertEqual(body[:3], b"CS\x01")
+        self.assertEqual(decoded["message"]["text"], "/chart BTCUSDT 4h")
+        self.assertEqual(decoded["message"]["from"]["username"], "tester")
+        self.assertNotIn("reply_markup", decoded["message"])
+        self.assertNotIn("forward_from", decoded["message"])
+        self.assertLess(len(body), len(json.dumps(full_update())))
+
+    def test_decoded_envelope_rebuilds_an_update(self):
+        update = Update.de_json(envelope.decode(envelope.encode(full_update())), Bot("123:abc"))
+
+        self.assertEqual(update.effective_chat.id, 42)
+        self.assertEqual(update.effective_user.id, 42)
+        self.assertEqual(update.message.entities[0].type, "bot_command")
+
+    def test_large_payloads_are_compressed(self):
+        update = full_update(text="a" * 3000)
+
+        body = envelope.encode(update, compress_threshold=1024)
+
+        self.assertEqual(body[3], envelope.FLAG_ZLIB)
+        self.assertLess(len(body), 1000)
+        self.assertEqual(envelope.decode(body)["message"]["text"], "a" * 3000)
+
+    def test_payment_updates(self):
+        update = {
+            "update_id": 5,
+            "pre_checkout_query": {
+                "id": "q1",
+                "from": {"id": 9, "is_bot": False, "first_name": "Payer"},
+                "currency": "USD",
+                "total_amount": 1499,
+                "invoice_payload": "9-subscription-monthly subscription",
+            },
+        }
+
+        decoded = envelope.decode(envelope.encode(update))
+
+        self.assertEqual(decoded["pre_checkout_query"]["invoice_payload"], "9-subscription-monthly subscription")
+        self.assertEqual(decoded["pre_checkout_query"]["from"]["id"], 9)
+
+    def test_legacy_json_and_garbage(self):
+        self.assertEqual(envelope.decode(json.dumps(full_update()).encode())["update_id"], 1001)
+        with self.assertRaises(ValueError):
+            envelope.decode(b"\x00garbage")
+        with self.assertRaises(ValueError):
+            envelope.decode(b"CS\x09\x00{}")
+
+
+if __name__ == "__main__":
+    unittest.main()
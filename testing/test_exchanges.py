@@ -0,0 +1,112 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import ccxt
+
+from bot import exchanges
+
+
+class FakeExchange:
+    instances = 0
+
+    def __init__(self, config):
+        FakeExchange.instances += 1
+        self.config = config
+        self.session = ccxt.bybit().session
+        self.markets = {}
+        self.loads = []
+        self.loaded = threading.Event()
+
+    def load_markets(self, reload=False):
+        self.loads.append(reload)
+        self.markets = {"BTC/USDT": {}}
+        self.loaded.set()
+
+
+class SlowExchange(ccxt.Exchange):
+    """A real ccxt client whose requests only record when they were sent."""
+
+    rateLimit = 50
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.sent = []
+        self.sent_lock = threading.Lock()
+
+    def sign(self, path, api="public", method="GET", params={}, headers=None, body=None):
+        return {"url": path, "method": method, "headers": headers, "body": body}
+
+    def fetch(self, url, method="GET", headers=None, body=None):
+        with self.sent_lock:
+            self.sent.append(time.monotonic())
+        time.sleep(0.01)
+        return {}
+
+    def load_markets(self, reload=False, params={}):
+        self.markets = {}
+
+
+class TestSharedThrottle(unittest.TestCase):
+    def setUp(self):
+        exchanges.close_all()
+        patcher = patch.object(ccxt, "slowx", SlowExchange, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(exchanges.close_all)
+
+    def test_threads_share_the_rate_limit(self):
+        exchange = exchanges.get_exchange("slowx")
+        threads = [threading.Thread(target=exchange.fetch2, args=("time",)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        sent = sorted(exchange.sent)
+        self.assertEqual(len(sent), 6)
+        gaps = [later - earlier for earlier, later in zip(sent, sent[1:])]
+        # rateLimit is 50ms; a little slack for the sleep granularity
+        self.assertGreaterEqual(min(gaps), 0.045)
+
+    def test_cost_weighs_the_spacing(self):
+        exchange = exchanges.get_exchange("slowx")
+        start = time.monotonic()
+        exchange.throttle(4)
+        exchange.throttle()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+
+class TestExchangeRegistry(unittest.TestCase):
+    def setUp(self):
+        FakeExchange.instances = 0
+        exchanges.close_all()
+        patcher = patch.object(ccxt, "fakex", FakeExchange, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(exchanges.close_all)
+
+    def test_one_client_per_exchange_with_markets_loaded_once(self):
+        first = exchanges.get_exchange("fakex")
+        second = exchanges.get_exchange("fakex")
+
+        self.assertIs(first, second)
+        self.assertEqual(FakeExchange.instances, 1)
+        self.assertEqual(first.loads, [False])
+        self.assertTrue(first.config["enableRateLimit"])
+        self.assertEqual(first.session.get_adapter("https://api.bybit.com")._pool_maxsize, exchanges.EXCHANGE_POOL_SIZE)
+
+    def test_stale_markets_reload_in_the_background(self):
+        exchange = exchanges.get_exchange("fakex")
+        exchange.loaded.clear()
+
+        with patch.object(exchanges, "EXCHANGE_MARKETS_TTL", 0):
+            self.assertIs(exchanges.get_exchange("fakex"), exchange)
+            self.assertTrue(exchange.loaded.wait(5))
+
+        self.assertEqual(exchange.loads, [False, True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+from telegram.error import NetworkError
+from ta.momentum import RSIIndicator
+
+from config import settings
+
+if not settings.MY_POSTGRESQL_URL:
+    settings.MY_POSTGRESQL_URL = "sqlite://"
+
+from bot.candles import CandleStore, to_array
+from bot.database import IndicatorAlertRequest, Session
+from bot.scripts.indicator_alerts import IndicatorAlertEngine, parse_alert, rsi, sma
+from bot.shared_candles import SharedCandles
+
+HOUR = 3600 * 1000
+NOW = 1_700_000_000_000 - 1_700_000_000_000 % HOUR + 10 * 60000
+
+
+class FakeExchange:
+    def __init__(self, closes):
+        # symbol -> closes of the 1h candles up to the one still open
+        self.closes = closes
+        self.calls = []
+
+    @staticmethod
+    def parse_timeframe(timeframe):
+        return {"1h": 3600, "4h": 14400}[timeframe]
+
+    def milliseconds(self):
+        return NOW
+
+    @staticmethod
+    def market(symbol):
+        return {"symbol": symbol}
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append((symbol, timeframe))
+        closes = self.closes[symbol]
+        start = NOW - NOW % HOUR - (len(closes) - 1) * HOUR
+        rows = [[start + i * HOUR, close, close, close, close, 1] for i, close in enumerate(closes)]
+        return [row for row in rows if since is None or row[0] >= since][:limit]
+
+
+class FakeListener:
+    """AlertListener stand-in: poll returns the queued changes."""
+
+    def __init__(self):
+        self.changes = []
+        self.connected = False
+
+    def listen(self):
+        self.connected = True
+        return True
+
+    def poll(self, timeout=0):
+        if not self.connected:
+            self.listen()
+            return None
+        changes, self.changes = self.changes, []
+        return changes
+
+
+class TestIndicators(unittest.TestCase):
+    def test_rsi_matches_reference(self):
+        closes = 100 + np.cumsum(np.random.default_rng(1).normal(0, 1, 300))
+        expected = RSIIndicator(pd.Series(closes), window=14).rsi().to_numpy()
+        self.assertAlmostEqual(rsi(closes, 14)[-1], expected[-1], places=3)
+        self.assertTrue(np.isnan(rsi(closes[:10], 14)).all())
+
+    def test_sma(self):
+        np.testing.assert_allclose(sma(np.arange(1.0, 6.0), 3), [np.nan, np.nan, 2, 3, 4])
+
+    def test_parse_alert(self):
+        self.assertEqual(parse_alert(["btcusdt", "move", "5"]), ("BTCUSDT", "move", "1h", 24, Decimal("5")))
+        self.assertEqual(parse_alert(["BTCUSDT", "rsi", "30"]), ("BTCUSDT", "rsi", "1h", 14, Decimal("30")))
+        self.assertEqual(parse_alert(["BTCUSDT", "sma", "50", "4h"]), ("BTCUSDT", "sma", "4h", 50, Decimal("0")))
+        for args in (["BTCUSDT", "rsi"], ["BTCUSDT", "macd", "1"], ["BTCUSDT", "rsi", "130"],
+                     ["BTCUSDT", "sma", "50", "2h"], ["BTCUSDT", "sma", "5.5"], ["BTCUSDT", "move", "nan"]):
+            with self.assertRaises(ValueError):
+                parse_alert(args)
+
+
+class TestIndicatorAlertEngine(unittest.TestCase):
+    def setUp(self):
+        self.session = Session()
+        self.session.query(IndicatorAlertRequest).delete()
+        self.session.commit()
+        self.created = datetime.utcfromtimestamp(NOW / 1000) - timedelta(hours=3)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def engine(self, exchange, **kwargs):
+        store = CandleStore(f"{self.directory.name}/store", exchange_factory=lambda name: exchange)
+        shared = SharedCandles(f"{self.directory.name}/shared")
+        return IndicatorAlertEngine(exchange=exchange, store=store, shared=shared, **kwargs)
+
+    def tearDown(self):
+        self.session.query(IndicatorAlertRequest).delete()
+        self.session.commit()
+        self.session.close()
+
+    def add(self, user_id, symbol, kind, period, threshold, timeframe="1h", created=None):
+        self.session.add(IndicatorAlertRequest(
+            user_id=user_id, symbol=symbol, kind=kind, timeframe=timeframe, period=period,
+            threshold=Decimal(threshold), timestamp=created or self.created,
+        ))
+
+    def test_batch_evaluation_with_one_fetch_per_series(self):
+        # BTC rallies 10% on the last closed candle: RSI crosses 70, the close crosses its SMA20
+        btc = [100.5 - (i % 2) * 0.5 for i in range(200)] + [110.0, 110.0]
+        eth = [50.0] * 202
+        exchange = FakeExchange({"BTCUSDT": btc, "ETHUSDT": eth})
+
+        for user_id in range(5000):
+            self.add(user_id, "BTCUSDT", "rsi", 14, "70")
+        for user_id in range(5000, 10000):
+            self.add(user_id, "ETHUSDT", "move", 24, "5")
+        self.add(20000, "BTCUSDT", "sma", 20, "0")
+        self.add(20001, "BTCUSDT", "move", 24, "5")
+        self.add(20002, "BTCUSDT", "rsi", 14, "30")
+        # created after the crossing candle closed: waits for the next crossing
+        self.add(20003, "BTCUSDT", "sma", 20, "0", created=datetime.utcfromtimestamp(NOW / 1000))
+        self.session.commit()
+
+        engine = self.engine(exchange)
+        bot = MagicMock()
+        sent = engine.check(bot)
+
+        self.assertEqual(set(exchange.calls), {("BTCUSDT", "1h"), ("ETHUSDT", "1h")})
+        fetched = len(exchange.calls)
+        self.assertEqual(sent, 5002)
+        notified = {call.kwargs["chat_id"] for call in bot.queue_message.call_args_list}
+        self.assertEqual(notified, set(range(5000)) | {20000, 20001})
+        self.assertIn("crossed its SMA20", bot.queue_message.call_args_list[5000].kwargs["text"])
+        self.assertEqual(self.session.query(IndicatorAlertRequest).count(), 5002)
+
+        # no new candle closed: nothing is fetched again
+        engine.check(bot)
+        self.assertEqual(len(exchange.calls), fetched)
+
+    def test_failed_notifications_keep_their_rows(self):
+        exchange = FakeExchange({"ETHUSDT": [50.0] * 30 + [55.0, 55.0]})
+        self.add(1, "ETHUSDT", "move", 24, "5")
+        self.add(2, "ETHUSDT", "move", 24, "5")
+        self.session.commit()
+        bot = MagicMock()
+        bot.queue_message.side_effect = lambda chat_id, text: MagicMock(
+            result=MagicMock(side_effect=NetworkError("timed out") if chat_id == 2 else None))
+
+        self.assertEqual(self.engine(exchange).check(bot), 1)
+        self.assertEqual([alert.user_id for alert in self.session.query(IndicatorAlertRequest)], [2])
+
+    def test_listener_changes_replace_table_queries(self):
+        self.add(1, "BTCUSDT", "rsi", 14, "70")
+        self.session.commit()
+        listener = FakeListener()
+        engine = self.engine(FakeExchange({}), listener=listener)
+
+        engine.sync(self.session)
+        self.assertEqual(set(engine.alerts), {1})
+        first = self.session.query(IndicatorAlertRequest.id).scalar()
+
+        # rows written without a notification stay unseen until the reconciliation
+        self.add(2, "BTCUSDT", "move", 24, "5")
+        self.session.commit()
+        listener.changes = [
+            {"op": "add", "id": 99, "user_id": 7, "symbol": "ETHUSDT", "kind": "sma", "timeframe": "4h",
+             "period": 50, "threshold": "0.0000", "timestamp": "2024-03-13T10:17:00"},
+            {"op": "remove", "ids": [first]},
+        ]
+        engine.sync(self.session)
+        self.assertEqual(set(engine.alerts), {99})
+        self.assertEqual(engine.alerts[99].threshold, Decimal("0"))
+        self.assertEqual(engine.alerts[99].timestamp, datetime(2024, 3, 13, 10, 17))
+
+        # the checksum differs from the table: the next sync is a full reload
+        engine.resync_interval = 0
+        engine.sync(self.session)
+        engine.sync(self.session)
+        self.assertEqual({alert.user_id for alert in engine.alerts.values()}, {1, 2})
+
+    def test_shared_series_are_not_fetched_again(self):
+        exchange = FakeExchange({"ETHUSDT": [50.0] * 30 + [55.0, 55.0]})
+        engine = self.engine(exchange)
+        # a series another process (/stats) already published
+        SharedCandles(engine.shared.root).get_or_refresh(
+            "bybit", "ETHUSDT", "1h", lambda: to_array(engine.store.candles("bybit", "ETHUSDT", "1h", limit=200)))
+        exchange.calls.clear()
+
+        self.add(1, "ETHUSDT", "move", 24, "5")
+        self.session.commit()
+        self.assertEqual(engine.check(MagicMock()), 1)
+        self.assertEqual(exchange.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
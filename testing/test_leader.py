@@ -0,0 +1,122 @@
+import unittest
+
+import psycopg2
+
+from bot.leader import AdvisoryLeader
+from bot.scheduler import JobScheduler
+
+
+class FakePostgres:
+    """Session-level advisory locks, released when a session closes."""
+
+    def __init__(self):
+        self.locks = {}
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+        self.broken = False
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+        for key, owner in list(self.server.locks.items()):
+            if owner is self:
+                del self.server.locks[key]
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.connection.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        locks = self.connection.server.locks
+        if "pg_try_advisory_lock" in sql:
+            owner = locks.setdefault(params[0], self.connection)
+            self.result = (owner is self.connection,)
+        elif "pg_advisory_unlock" in sql:
+            held = locks.get(params[0]) is self.connection
+            if held:
+                del locks[params[0]]
+            self.result = (held,)
+        elif "pg_locks" in sql:
+            self.result = [(key,) for key in locks]
+        else:
+            self.result = (1,)
+
+    def fetchone(self):
+        return self.result
+
+    def fetchall(self):
+        return self.result
+
+
+class TestAdvisoryLeader(unittest.TestCase):
+    def setUp(self):
+        self.postgres = FakePostgres()
+        self.first = AdvisoryLeader(connect=self.postgres.connect)
+        self.second = AdvisoryLeader(connect=self.postgres.connect)
+        for leader in (self.first, self.second):
+            leader.register("check_price_alerts")
+
+    def test_only_one_instance_leads_a_job(self):
+        self.assertTrue(self.first.is_leader("check_price_alerts"))
+        self.assertFalse(self.second.is_leader("check_price_alerts"))
+        self.assertNotEqual(self.first.lock_key("a"), self.first.lock_key("b"))
+
+    def test_standby_takes_over_when_the_leader_goes_away(self):
+        self.first.is_leader("check_price_alerts")
+        self.first.release_all()
+
+        self.second.elect()
+
+        self.assertEqual(self.second.held(), {"check_price_alerts"})
+
+    def test_leader_with_broken_connection_steps_down(self):
+        self.first.is_leader("check_price_alerts")
+        connection = self.first._connection
+        connection.broken = True
+
+        self.first.elect()
+
+        self.assertEqual(self.first.held(), set())
+        # closing the broken session released the lock on the server
+        self.assertTrue(connection.closed)
+        self.second.elect()
+        self.assertEqual(self.second.held(), {"check_price_alerts"})
+
+
+class TestLeaderScheduler(unittest.TestCase):
+    def test_standby_instance_skips_jobs(self):
+        postgres = FakePostgres()
+        AdvisoryLeader(connect=postgres.connect).is_leader("tick")
+        jobs = JobScheduler(stats_interval=None, leader=AdvisoryLeader(connect=postgres.connect))
+        runs = []
+        jobs.add_interval_job(lambda: runs.append(1), 60, job_id="tick")
+
+        jobs._timed("tick", lambda: runs.append(1))
+
+        self.assertEqual(runs, [])
+        self.assertEqual(jobs.stats()["tick"]["standby"], 1)
+        jobs.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,334 @@
+import json
+import unittest
+from concurrent.futures import Future
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import ccxt
+from telegram.error import NetworkError, Unauthorized
+
+from config import settings
+
+# in-memory database for the alert rows
+if not settings.MY_POSTGRESQL_URL:
+    settings.MY_POSTGRESQL_URL = "sqlite://"
+
+from bot.database import PriceAlertRequest, Session
+from bot.scripts.alert_cadence import AlertCadence
+from bot.scripts.alert_changes import notify_added
+from bot.scripts.alert_engine import AlertEngine, fetch_prices
+
+
+class FakeExchange:
+    markets = {
+        "BTCUSDT": {"symbol": "BTC/USDT", "type": "spot"},
+        "ETHUSDT": {"symbol": "ETH/USDT", "type": "spot"},
+        "BTCPERP": {"symbol": "BTC/USD:USD", "type": "swap"},
+    }
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.calls = []
+        # symbol -> [timestamp, open, high, low, close, volume] rows
+        self.candles = {}
+        self.now = 1_700_000_000_000
+        self.ohlcv_calls = []
+
+    def load_markets(self):
+        return self.markets
+
+    def market(self, symbol):
+        if symbol not in self.markets:
+            raise ccxt.BadSymbol(symbol)
+        return self.markets[symbol]
+
+    def milliseconds(self):
+        return self.now
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.ohlcv_calls.append((symbol, since))
+        return [candle for candle in self.candles.get(symbol, []) if since is None or candle[0] >= since]
+
+    def fetch_tickers(self, symbols):
+        self.calls.append(sorted(symbols))
+        return {symbol: {"symbol": symbol, "last": self.prices[symbol]} for symbol in symbols}
+
+
+class FakeListener:
+    """AlertListener stand-in: poll returns the queued changes."""
+
+    def __init__(self):
+        self.changes = []
+        self.connected = False
+
+    def listen(self):
+        self.connected = True
+        return True
+
+    def poll(self, timeout=0):
+        if not self.connected:
+            self.listen()
+            return None
+        changes, self.changes = self.changes, []
+        return changes
+
+
+class QueueingBot:
+    """ScheduledBot stand-in: logs when messages are queued and waited for, fails the chats in ``errors``."""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.events = []
+
+    def queue_message(self, chat_id, text):
+        events = self.events
+        events.append(("queued", chat_id))
+        error = self.errors.get(chat_id)
+
+        class Sent(Future):
+            def result(self, timeout=None):
+                events.append(("waited", chat_id))
+                return super().result(timeout)
+
+        future = Sent()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(text)
+        return future
+
+    def sent(self):
+        return [chat_id for event, chat_id in self.events if event == "waited" and chat_id not in self.errors]
+
+
+class TestPriceAlerts(unittest.TestCase):
+    def setUp(self):
+        self.session = Session()
+        self.session.query(PriceAlertRequest).delete()
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def add_alert(self, user_id, symbol, level):
+        self.session.add(PriceAlertRequest(user_id=user_id, symbol=symbol, price_level=Decimal(level)))
+        self.session.commit()
+
+    def test_fetch_prices_batches_by_market_type(self):
+        exchange = FakeExchange({"BTC/USDT": 30000.5, "ETH/USDT": 1800, "BTC/USD:USD": 30010})
+
+        prices = fetch_prices(exchange, ["BTCUSDT", "ETHUSDT", "BTCPERP", "NOPE"])
+
+        self.assertEqual(prices, {"BTCUSDT": Decimal("30000.5"), "ETHUSDT": Decimal("1800"), "BTCPERP": Decimal("30010")})
+        self.assertEqual(sorted(exchange.calls), [["BTC/USD:USD"], ["BTC/USDT", "ETH/USDT"]])
+
+    def test_check_price_alerts(self):
+        for user_id in range(50):
+            self.add_alert(user_id, "BTCUSDT", "30000")
+        self.add_alert(100, "ETHUSDT", "2500")
+        exchange = FakeExchange({"BTC/USDT": 30050, "ETH/USDT": 1800})
+        engine = AlertEngine(exchange=exchange)
+        bot = MagicMock()
+
+        self.assertEqual(engine.check(bot), 50)
+
+        # one ticker call for all the alerts
+        self.assertEqual(exchange.calls, [["BTC/USDT", "ETH/USDT"]])
+        self.assertEqual(bot.queue_message.call_count, 50)
+        self.assertIn("The current price is now: 30050.", bot.queue_message.call_args[1]["text"])
+        remaining = self.session.query(PriceAlertRequest.symbol).all()
+        self.assertEqual([row.symbol for row in remaining], ["ETHUSDT"])
+
+        # the ETH alert waits above the price until it is reached
+        self.add_alert(101, "BTCUSDT", "31000")
+        exchange.prices["ETH/USDT"] = 2490
+        self.assertEqual(engine.check(bot), 1)
+        self.assertEqual(bot.queue_message.call_args[1]["chat_id"], 100)
+
+    def test_removed_alerts_are_not_sent(self):
+        self.add_alert(1, "BTCUSDT", "30000")
+        engine = AlertEngine(exchange=FakeExchange({"BTC/USDT": 25000}))
+        bot = MagicMock()
+        engine.check(bot)
+
+        # the user removes the alert, the index still has it until the next resync
+        self.session.query(PriceAlertRequest).delete()
+        self.session.commit()
+        engine.exchange.prices["BTC/USDT"] = 30000
+
+        self.assertEqual(engine.check(bot), 0)
+        bot.queue_message.assert_not_called()
+
+    def test_notifications_are_queued_at_once(self):
+        for user_id in range(5):
+            self.add_alert(user_id, "BTCUSDT", "30000")
+        engine = AlertEngine(exchange=FakeExchange({"BTC/USDT": 30050}))
+        bot = QueueingBot()
+
+        self.assertEqual(engine.check(bot), 5)
+        events = [event for event, _ in bot.events]
+        self.assertEqual(events, ["queued"] * 5 + ["waited"] * 5)
+
+    def test_failed_notifications_trigger_again(self):
+        self.add_alert(1, "BTCUSDT", "30000")
+        self.add_alert(2, "BTCUSDT", "30000")
+        self.add_alert(3, "BTCUSDT", "30000")
+        exchange = FakeExchange({"BTC/USDT": 30050})
+        engine = AlertEngine(exchange=exchange)
+        # chat 2 is down for a moment, chat 3 blocked the bot
+        bot = QueueingBot({2: NetworkError("timed out"), 3: Unauthorized("blocked")})
+
+        self.assertEqual(engine.check(bot), 1)
+        self.assertEqual(bot.sent(), [1])
+        remaining = self.session.query(PriceAlertRequest.user_id).all()
+        self.assertEqual([row.user_id for row in remaining], [2])
+
+        # still past its level on the next check
+        bot.errors = {}
+        exchange.prices["BTC/USDT"] = 30100
+        self.assertEqual(engine.check(bot), 1)
+        self.assertEqual(bot.sent()[-1], 2)
+        self.assertEqual(self.session.query(PriceAlertRequest).count(), 0)
+
+    def test_levels_crossed_between_checks_trigger(self):
+        self.add_alert(1, "BTCUSDT", "31000")
+        self.add_alert(2, "BTCUSDT", "29000")
+        self.add_alert(3, "BTCUSDT", "35000")
+        exchange = FakeExchange({"BTC/USDT": 30000})
+        engine = AlertEngine(exchange=exchange)
+        bot = MagicMock()
+
+        # the first check has no previous price to cross from, no candles needed
+        self.assertEqual(engine.check(bot), 0)
+        self.assertEqual(exchange.ohlcv_calls, [])
+
+        # a wick to 31200 in between, the price is back at 30100 by the next check
+        exchange.candles["BTC/USDT"] = [
+            [exchange.now, 30000, 30400, 29950, 30300, 1],
+            [exchange.now + 60000, 30300, 31200, 30200, 30100, 1],
+        ]
+        exchange.now += 120000
+        exchange.prices["BTC/USDT"] = 30100
+
+        self.assertEqual(engine.check(bot), 1)
+        self.assertEqual(bot.queue_message.call_args[1]["chat_id"], 1)
+        self.assertEqual(exchange.ohlcv_calls, [("BTC/USDT", 1_700_000_000_000 - 1_700_000_000_000 % 60000)])
+        self.assertEqual(sorted(row.user_id for row in self.session.query(PriceAlertRequest)), [2, 3])
+
+    def test_new_alerts_ignore_the_candle_open_at_their_first_check(self):
+        self.add_alert(1, "BTCUSDT", "35000")
+        exchange = FakeExchange({"BTC/USDT": 30000})
+        engine = AlertEngine(exchange=exchange)
+        bot = MagicMock()
+        engine.check(bot)
+
+        # a dip to 28900 before the check that places the new alert
+        start = exchange.now - exchange.now % 60000
+        exchange.candles["BTC/USDT"] = [[start, 30000, 30100, 28900, 30000, 1]]
+        exchange.now += 10000
+        self.add_alert(2, "BTCUSDT", "29000")
+        self.assertEqual(engine.check(bot), 0)
+
+        # the same minute is still open at the next check
+        exchange.now += 10000
+        self.assertEqual(engine.check(bot), 0)
+
+        # the next minute goes down to 29000
+        exchange.candles["BTC/USDT"].append([start + 60000, 30000, 30000, 29000, 29500, 1])
+        exchange.now = start + 90000
+        exchange.prices["BTC/USDT"] = 29500
+        self.assertEqual(engine.check(bot), 1)
+        self.assertEqual(bot.queue_message.call_args[1]["chat_id"], 2)
+
+    def test_cadence_checks_distant_symbols_less_often(self):
+        self.add_alert(1, "BTCUSDT", "30080")
+        self.add_alert(2, "ETHUSDT", "2500")
+        exchange = FakeExchange({"BTC/USDT": 30000, "ETH/USDT": 1800})
+        start = exchange.now - 20 * 60000
+        # calm 1m candles: 0.1% ATR for both
+        exchange.candles["BTC/USDT"] = [[start + i * 60000, 30000, 30015, 29985, 30000, 1] for i in range(21)]
+        exchange.candles["ETH/USDT"] = [[start + i * 60000, 1800, 1800.9, 1799.1, 1800, 1] for i in range(21)]
+        engine = AlertEngine(exchange=exchange, tolerance=Decimal("0"),
+                             cadence=AlertCadence(min_interval=5, max_interval=300))
+        bot = MagicMock()
+
+        engine.check(bot)
+        self.assertEqual(exchange.calls, [["BTC/USDT", "ETH/USDT"]])
+
+        # BTC is 0.27% from its alert (checked within a minute), ETH 39% (every 5 minutes)
+        exchange.now += 60000
+        engine.check(bot)
+        self.assertEqual(exchange.calls[-1], ["BTC/USDT"])
+        self.assertLess(engine.cadence.next_check("BTCUSDT") - exchange.now / 1000, 60)
+        self.assertEqual(engine.cadence.next_check("ETHUSDT"), (exchange.now - 60000) / 1000 + 300)
+
+        # a new ETH alert close to the price is checked on the next run
+        self.add_alert(3, "ETHUSDT", "1801")
+        exchange.prices["ETH/USDT"] = 1801
+        exchange.now += 5000
+        engine.check(bot)
+        self.assertEqual(exchange.calls[-1], ["ETH/USDT"])
+        self.assertEqual(bot.queue_message.call_args[1]["chat_id"], 3)
+
+    def test_listener_changes_replace_table_queries(self):
+        self.add_alert(1, "BTCUSDT", "31000")
+        listener = FakeListener()
+        engine = AlertEngine(exchange=FakeExchange({"BTC/USDT": 30000}), listener=listener)
+
+        engine.sync(self.session)
+        self.assertEqual(engine.index.alert_ids(), {1})
+
+        # rows written without a notification stay unseen until the reconciliation
+        self.add_alert(2, "BTCUSDT", "32000")
+        listener.changes = [
+            {"op": "add", "id": 3, "user_id": 7, "symbol": "ETHUSDT", "price_level": "2500"},
+            {"op": "remove", "ids": [1]},
+        ]
+        engine.sync(self.session)
+        self.assertEqual(engine.index.alert_ids(), {3})
+
+        # the checksum differs from the table: the next load is a full reload
+        engine.resync_interval = 0
+        engine.sync(self.session)
+        self.assertEqual(engine.index.alert_ids(), {3})
+        engine.sync(self.session)
+        self.assertEqual(engine.index.alert_ids(), {1, 2})
+
+    def test_announced_level_matches_the_column(self):
+        session = MagicMock()
+        session.get_bind.return_value.dialect.name = "postgresql"
+        notify_added(session, PriceAlertRequest(id=1, user_id=7, symbol="BTCUSDT", price_level=Decimal("31000.125")))
+        payload = json.loads(session.execute.call_args[0][1]["payload"])
+        self.assertEqual(payload["price_level"], "31000.13")
+
+    def test_full_reload_replaces_differing_levels(self):
+        self.add_alert(1, "BTCUSDT", "31000.12")
+        listener = FakeListener()
+        engine = AlertEngine(exchange=FakeExchange({"BTC/USDT": 30000}), listener=listener)
+        engine.sync(self.session)
+        # an unrounded level announced before the table rounded it
+        engine.apply(engine.changes([{"op": "add", "id": 1, "user_id": 1, "symbol": "BTCUSDT", "price_level": "31000.123"}]))
+        self.assertEqual(engine.index.get(1).price_level, Decimal("31000.123"))
+
+        engine.resync_interval = 0
+        engine.sync(self.session)
+        engine.sync(self.session)
+        self.assertEqual(engine.index.get(1).price_level, Decimal("31000.12"))
+        self.assertEqual(engine.index.checksum(), engine.table_checksum(self.session))
+
+    def test_lost_listener_reloads(self):
+        self.add_alert(1, "BTCUSDT", "31000")
+        listener = FakeListener()
+        engine = AlertEngine(exchange=FakeExchange({"BTC/USDT": 30000}), listener=listener)
+        engine.sync(self.session)
+
+        self.add_alert(2, "BTCUSDT", "32000")
+        listener.connected = False
+        engine.sync(self.session)
+
+        self.assertEqual(engine.index.alert_ids(), {1, 2})
+        self.assertTrue(listener.connected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from bot.broker.publisher import BufferedPublisher, DiskSpill
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestDiskSpill(unittest.TestCase):
+    def test_read_consume_and_truncate(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            spill = DiskSpill(os.path.join(tmp, "spill.bin"))
+            for body in (b"a", b"bb", b"ccc"):
+                spill.append(body)
+
+            bodies, end = spill.read_batch(2)
+            self.assertEqual(bodies, [b"a", b"bb"])
+            spill.consume(end)
+
+            bodies, end = spill.read_batch(10)
+            self.assertEqual(bodies, [b"ccc"])
+            spill.consume(end)
+
+            self.assertEqual(len(spill), 0)
+            self.assertEqual(os.path.getsize(spill.path), 0)
+
+
+class FakeBroker:
+    """Stands in for aio_pika.connect, confirming publishes after a short delay."""
+
+    def __init__(self, confirm_delay=0.01):
+        self.confirm_delay = confirm_delay
+        self.connections = 0
+        self.published = []
+        self.failures = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connect_error = None
+
+    async def connect(self, url, heartbeat=None):
+        if self.connect_error is not None:
+            raise self.connect_error
+        self.connections += 1
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_closed = False
+
+    async def channel(self, publisher_confirms=False):
+        assert publisher_confirms
+        return FakeChannel(self)
+
+    async def close(self):
+        self.is_closed = True
+
+
+class FakeChannel:
+    def __init__(self, connection):
+        self.default_exchange = FakeExchange(connection)
+
+    async def declare_queue(self, name, **kwargs):
+        pass
+
+
+class FakeExchange:
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def publish(self, message, routing_key, mandatory=True):
+        broker = self.connection.broker
+        if broker.failures:
+            # the connection is lost with every publish in flight
+            self.connection.is_closed = True
+            raise broker.failures.pop()
+        if self.connection.is_closed:
+            raise ConnectionResetError("connection closed")
+        broker.in_flight += 1
+        broker.max_in_flight = max(broker.max_in_flight, broker.in_flight)
+        try:
+            # waiting for the confirm
+            await asyncio.sleep(broker.confirm_delay)
+        finally:
+            broker.in_flight -= 1
+        broker.published.append(message.body)
+
+
+class TestBufferedPublisher(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        patcher = patch("bot.broker.publisher.aio_pika.connect", self.broker.connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_publishes_in_order_and_survives_broker_errors(self):
+        self.broker.failures.append(ConnectionResetError("connection reset"))
+
+        publisher = BufferedPublisher("amqp://", batch_size=2)
+        for i in range(5):
+            self.assertTrue(publisher.publish(str(i).encode()))
+
+        self.assertTrue(wait_for(lambda: len(self.broker.published) == 5))
+        publisher.stop()
+
+        self.assertEqual(self.broker.published, [b"0", b"1", b"2", b"3", b"4"])
+        # the failed publish forced a reconnect
+        self.assertEqual(self.broker.connections, 2)
+
+    def test_batch_confirms_are_awaited_together(self):
+        publisher = BufferedPublisher("amqp://", batch_size=50)
+        for i in range(20):
+            publisher.publish(str(i).encode())
+
+        self.assertTrue(wait_for(lambda: len(self.broker.published) == 20))
+        publisher.stop()
+        # the whole batch was waiting on its confirms at once
+        self.assertGreater(self.broker.max_in_flight, 1)
+        self.assertEqual(self.broker.published, [str(i).encode() for i in range(20)])
+
+    def test_full_buffer_spills_to_disk(self):
+        self.broker.connect_error = ConnectionRefusedError("broker down")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spill.bin")
+            publisher = BufferedPublisher("amqp://", maxsize=1, spill_path=path)
+
+            self.assertTrue(publisher.publish(b"first"))
+            self.assertTrue(publisher.publish(b"second"))
+            publisher.stop(timeout=0.1)
+
+            records, _ = DiskSpill(path).read_batch(10)
+            bodies = [BufferedPublisher._decode(record)[1] for record in records]
+            self.assertEqual(sorted(bodies), [b"first", b"second"])
+
+    def test_unconfirmed_batch_is_spilled_once_the_thread_stopped(self):
+        self.broker.confirm_delay = 60
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spill.bin")
+            publisher = BufferedPublisher("amqp://", spill_path=path)
+            publisher.publish(b"unconfirmed")
+            self.assertTrue(wait_for(lambda: self.broker.in_flight == 1))
+
+            publisher.stop(timeout=0.2)
+            self.assertFalse(publisher._thread.is_alive())
+            records, _ = DiskSpill(path).read_batch(10)
+            self.assertEqual([BufferedPublisher._decode(record)[1] for record in records], [b"unconfirmed"])
+
+    def test_full_buffer_without_spill_drops(self):
+        self.broker.connect_error = ConnectionRefusedError("broker down")
+
+        publisher = BufferedPublisher("amqp://", maxsize=1)
+        publisher.publish(b"first")
+        # the publisher thread may hold the first message already
+        results = [publisher.publish(b"next") for _ in range(3)]
+        publisher.stop(timeout=0.1)
+
+        self.assertIn(False, results)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from telegram.error import BadRequest, TimedOut, Unauthorized
+
+from bot.broker.retry import DEAD, DROP, RETRY, HandlerErrors, ProcessedUpdates, RetryPolicy
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy("telegram", delays=(2, 8))
+
+    def test_retry_queues_expire_back_to_the_default_exchange(self):
+        self.assertEqual(
+            self.policy.retry_queues(),
+            [
+                ("telegram.retry.2s", {"x-message-ttl": 2000, "x-dead-letter-exchange": ""}),
+                ("telegram.retry.8s", {"x-message-ttl": 8000, "x-dead-letter-exchange": ""}),
+            ],
+        )
+
+    def test_classify(self):
+        self.assertEqual(RetryPolicy.classify(TimedOut()), RETRY)
+        self.assertEqual(RetryPolicy.classify(ConnectionError()), RETRY)
+        self.assertEqual(RetryPolicy.classify(BadRequest("Message is not modified")), DEAD)
+        self.assertEqual(RetryPolicy.classify(KeyError("price")), DEAD)
+        self.assertEqual(RetryPolicy.classify(Unauthorized("bot was blocked by the user")), DROP)
+
+    def test_transient_errors_are_retried_then_dead_lettered(self):
+        queue = "telegram.heavy.3"
+
+        exchange, routing_key, headers = self.policy.target(queue, None, TimedOut())
+        self.assertEqual((exchange, routing_key, headers["x-retries"]), ("telegram.retry.2s", queue, 1))
+
+        exchange, routing_key, headers = self.policy.target(queue, headers, TimedOut())
+        self.assertEqual((exchange, routing_key, headers["x-retries"]), ("telegram.retry.8s", queue, 2))
+
+        exchange, routing_key, headers = self.policy.target(queue, headers, TimedOut())
+        self.assertEqual((exchange, routing_key), ("", "telegram.dead"))
+        self.assertEqual(headers["x-original-queue"], queue)
+        self.assertEqual(headers["x-error-type"], "TimedOut")
+
+    def test_settle_publishes_and_acks(self):
+        channel = MagicMock()
+        method = MagicMock(routing_key="telegram.interactive.0", delivery_tag=4)
+
+        action = self.policy.settle(channel, method, MagicMock(headers=None), b"body", ValueError("bad"))
+
+        self.assertEqual(action, DEAD)
+        publish = channel.basic_publish.call_args[1]
+        self.assertEqual(publish["routing_key"], "telegram.dead")
+        self.assertEqual(publish["properties"].headers["x-error"], "bad")
+        channel.basic_ack.assert_called_once_with(delivery_tag=4)
+
+    def test_dropped_failures_are_only_acked(self):
+        channel = MagicMock()
+
+        action = self.policy.settle(channel, MagicMock(delivery_tag=1), None, b"", Unauthorized("blocked"))
+
+        self.assertEqual(action, DROP)
+        channel.basic_publish.assert_not_called()
+        channel.basic_ack.assert_called_once_with(delivery_tag=1)
+
+
+class TestProcessedUpdates(unittest.TestCase):
+    def test_seen(self):
+        processed = ProcessedUpdates(maxsize=10, ttl=60)
+        processed.add(1)
+
+        self.assertTrue(processed.seen(1))
+        self.assertFalse(processed.seen(2))
+        self.assertFalse(processed.seen(None))
+
+
+class TestHandlerErrors(unittest.TestCase):
+    def test_recorded_error_is_raised_on_the_same_thread_only(self):
+        errors = HandlerErrors()
+
+        def failing_dispatch():
+            errors.record(None, MagicMock(error=TimedOut()))
+
+        with self.assertRaises(TimedOut):
+            errors.run(failing_dispatch)
+
+        # another thread does not see the error
+        results = []
+        thread = threading.Thread(target=lambda: results.append(errors.run(lambda: None)))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [None])
+
+
+if __name__ == "__main__":
+    unittest.main()
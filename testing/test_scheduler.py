@@ -0,0 +1,70 @@
+import threading
+import time
+import unittest
+
+from bot.scheduler import JobScheduler
+
+
+def wait_for(condition, timeout=3):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestJobScheduler(unittest.TestCase):
+    def setUp(self):
+        self.jobs = JobScheduler(workers=2, stats_interval=None)
+
+    def tearDown(self):
+        self.jobs.shutdown(wait=False)
+
+    def test_slow_job_does_not_overlap(self):
+        running = []
+        overlaps = []
+        release = threading.Event()
+
+        def slow():
+            if running:
+                overlaps.append(True)
+            running.append(True)
+            release.wait(2)
+            running.pop()
+
+        self.jobs.add_interval_job(slow, 0.05)
+        self.jobs.start()
+
+        self.assertTrue(wait_for(lambda: self.jobs.stats()["slow"]["skipped"] >= 2))
+        release.set()
+        self.assertTrue(wait_for(lambda: self.jobs.stats()["slow"]["runs"] >= 1))
+        self.assertEqual(overlaps, [])
+
+    def test_durations_and_errors_are_recorded(self):
+        def broken():
+            time.sleep(0.02)
+            raise ValueError("boom")
+
+        self.jobs.add_interval_job(broken, 60)
+        self.jobs.start()
+
+        self.assertTrue(wait_for(lambda: self.jobs.stats()["broken"]["errors"] == 1))
+        stats = self.jobs.stats()["broken"]
+        self.assertEqual(stats["runs"], 1)
+        self.assertGreaterEqual(stats["last_duration"], 0.02)
+
+    def test_shutdown_waits_for_running_job(self):
+        finished = []
+        self.jobs.add_interval_job(lambda: (time.sleep(0.1), finished.append(True)), 60, job_id="tick")
+        self.jobs.start()
+        self.assertTrue(wait_for(lambda: self.jobs._scheduler.get_job("tick") is not None))
+        time.sleep(0.02)
+
+        self.jobs.shutdown(wait=True)
+
+        self.assertEqual(finished, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
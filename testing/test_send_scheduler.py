@@ -0,0 +1,114 @@
+import io
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import telegram
+from telegram.error import RetryAfter
+
+from bot.send_scheduler import OutboundScheduler, ScheduledBot, TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        now = bucket.updated
+
+        bucket.consume(now)
+        bucket.consume(now)
+
+        self.assertAlmostEqual(bucket.wait_time(now), 0.5)
+        self.assertEqual(bucket.wait_time(now + 0.5), 0)
+
+
+class TestOutboundScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = OutboundScheduler(
+            global_rate=100, private_rate=20, group_rate=20, private_burst=1, senders=4
+        )
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def test_chat_order_and_rate(self):
+        sent = []
+        futures = [
+            self.scheduler.submit(1, lambda i=i: sent.append((i, time.monotonic())))
+            for i in range(5)
+        ]
+        for future in futures:
+            future.result(timeout=2)
+
+        self.assertEqual([i for i, _ in sent], [0, 1, 2, 3, 4])
+        # 20 msg/s per chat with no burst: 4 gaps of at least 50ms
+        self.assertGreaterEqual(sent[-1][1] - sent[0][1], 0.19)
+
+    def test_other_chats_are_not_held_back(self):
+        release = threading.Event()
+        slow = self.scheduler.submit(1, release.wait)
+
+        self.assertEqual(self.scheduler.call(2, lambda: "fast"), "fast")
+        release.set()
+        slow.result(timeout=2)
+
+    def test_retry_after_is_honoured(self):
+        attempts = []
+
+        def flaky():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise RetryAfter(0.2)
+            return "sent"
+
+        self.assertEqual(self.scheduler.call(3, flaky), "sent")
+        self.assertEqual(len(attempts), 2)
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.19)
+
+    def test_files_are_rewound_before_a_retry(self):
+        chart = io.BytesIO(b"png")
+        reads = []
+
+        def send_photo(chat_id, photo):
+            reads.append(photo.read())
+            if len(reads) == 1:
+                raise RetryAfter(0.05)
+            return "sent"
+
+        self.assertEqual(self.scheduler.call(5, send_photo, 5, photo=chart), "sent")
+        self.assertEqual(reads, [b"png", b"png"])
+
+    def test_errors_are_returned_to_the_caller(self):
+        def broken():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            self.scheduler.call(4, broken)
+
+
+class TestScheduledBot(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = OutboundScheduler(
+            global_rate=100, private_rate=5, group_rate=5, private_burst=1, senders=2
+        )
+        self.addCleanup(self.scheduler.shutdown)
+        self.bot = ScheduledBot("123:abc", scheduler=self.scheduler)
+        self.sent = []
+        patcher = patch.object(telegram.Bot, "send_message",
+                               lambda bot, chat_id, text, **kwargs: self.sent.append((chat_id, text)) or text)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_queued_messages_do_not_wait_for_their_slot(self):
+        start = time.monotonic()
+        futures = [self.bot.queue_message(1, f"message {i}") for i in range(3)]
+        # 5 msg/s with no burst: the last one goes out 0.4s later
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        self.assertEqual([future.result(timeout=2) for future in futures], ["message 0", "message 1", "message 2"])
+        self.assertGreaterEqual(time.monotonic() - start, 0.39)
+        self.assertEqual(self.sent, [(1, "message 0"), (1, "message 1"), (1, "message 2")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+from bot.broker import sharding
+
+
+class TestSharding(unittest.TestCase):
+    def test_chat_always_maps_to_the_same_shard(self):
+        update = {"message": {"chat": {"id": -100123}}}
+        callback = {"callback_query": {"from": {"id": -100123}}}
+
+        self.assertEqual(sharding.route(update, "telegram", 8), sharding.route(update, "telegram", 8))
+        self.assertEqual(sharding.route(update, "telegram", 8), sharding.route(callback, "telegram", 8))
+        self.assertEqual(sharding.route({"update_id": 1}, "telegram", 8), "telegram.0")
+
+    def test_shards_are_balanced_and_stable_when_growing(self):
+        chats = range(10000)
+        before = [sharding.shard_for(chat, 8) for chat in chats]
+        after = [sharding.shard_for(chat, 9) for chat in chats]
+
+        counts = [before.count(shard) for shard in range(8)]
+        self.assertLess(max(counts) - min(counts), 300)
+        # only about 1/9 of the chats move, and only onto the new shard
+        moved = [(a, b) for a, b in zip(before, after) if a != b]
+        self.assertLess(len(moved), 1400)
+        self.assertTrue(all(b == 8 for _, b in moved))
+
+    def test_every_shard_has_one_owner(self):
+        for shard in range(8):
+            owners = [
+                index for index in range(3)
+                if sharding.consumer_priority(shard, index, 3) == sharding.OWNER_PRIORITY
+            ]
+            self.assertEqual(len(owners), 1)
+
+    def test_consumer_index(self):
+        self.assertEqual(sharding.consumer_index("2"), 2)
+        with patch.dict(os.environ, {"DYNO": "bot.3"}):
+            self.assertEqual(sharding.consumer_index(None), 2)
+        with patch.dict(os.environ, {"DYNO": ""}):
+            self.assertEqual(sharding.consumer_index(None), 0)
+
+    def test_declare_shard_queues(self):
+        channel = MagicMock()
+
+        names = sharding.declare_shard_queues(channel, "telegram", 2)
+
+        self.assertEqual(names, ["telegram.0", "telegram.1"])
+        channel.queue_declare.assert_any_call(
+            queue="telegram.1",
+            durable=True,
+            arguments={"x-queue-type": "quorum", "x-single-active-consumer": True},
+        )
+
+    def test_consumer_prefetch_is_split_over_the_owned_shards(self):
+        self.assertEqual(sharding.consumer_prefetch(32, 8, 2), 8)
+        self.assertEqual(sharding.consumer_prefetch(10, 8, 3), 4)
+        self.assertEqual(sharding.consumer_prefetch(1, 8, 1), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from bot.candles import to_array
+from bot.shared_candles import SharedCandles
+
+
+def series(count, start=0):
+    return to_array([[start + i * 60000, 1.0 + i, 2.0 + i, 0.5 + i, 1.5 + i, 10.0] for i in range(count)])
+
+
+def refresh_in_child(root, marker):
+    def loader():
+        with open(marker, "a") as f:
+            f.write("x")
+        time.sleep(0.3)
+        return series(100)
+
+    candles = SharedCandles(root).get_or_refresh("bybit", "BTC/USDT", "1m", loader, max_age=60)
+    assert len(candles) == 100
+
+
+class TestSharedCandles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.shared = SharedCandles(self.directory.name)
+
+    def test_published_series_are_read_only_views(self):
+        self.assertIsNone(self.shared.get("bybit", "BTC/USDT", "1h"))
+        self.shared.publish("bybit", "BTC/USDT", "1h", series(3), fetched_at=123.0)
+
+        candles = self.shared.get("bybit", "BTC/USDT", "1h")
+        self.assertEqual(candles.fetched_at, 123.0)
+        np.testing.assert_array_equal(candles["close"], [1.5, 2.5, 3.5])
+        np.testing.assert_array_equal(candles.time, [0, 60000, 120000])
+        self.assertEqual(candles.close.dtype, np.float32)
+        self.assertFalse(candles.close.flags.writeable)
+        self.assertFalse(candles.close.flags.owndata)
+
+        # a reader keeps its mapping when the series is replaced
+        self.shared.publish("bybit", "BTC/USDT", "1h", series(5))
+        self.assertEqual(len(candles), 3)
+        self.assertEqual(len(self.shared.get("bybit", "BTC/USDT", "1h")), 5)
+
+    def test_refresh_only_when_expired(self):
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return series(10)
+
+        self.assertEqual(len(self.shared.get_or_refresh("bybit", "ETH/USDT", "1h", loader, max_age=60)), 10)
+        self.shared.get_or_refresh("bybit", "ETH/USDT", "1h", loader, max_age=60)
+        self.assertEqual(len(loads), 1)
+        self.shared.get_or_refresh("bybit", "ETH/USDT", "1h", loader, max_age=0)
+        self.assertEqual(len(loads), 2)
+        stats = self.shared.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["series"]), (1, 2, 1))
+        self.assertEqual(stats["bytes"], 16 + 10 * 28)
+
+    def test_expired_series_is_served_while_it_refreshes(self):
+        self.shared.publish("bybit", "SOL/USDT", "1m", series(3), fetched_at=time.time() - 120)
+        refreshed = threading.Event()
+
+        def loader():
+            refreshed.set()
+            return series(4)
+
+        # expired at the last 1m close, but within the stale window
+        candles = self.shared.get_or_refresh("bybit", "SOL/USDT", "1m", loader, stale=3600)
+        self.assertEqual(len(candles), 3)
+        self.assertTrue(refreshed.wait(5))
+        for _ in range(50):
+            if len(self.shared.get("bybit", "SOL/USDT", "1m")) == 4:
+                break
+            time.sleep(0.02)
+        self.assertEqual(len(self.shared.get("bybit", "SOL/USDT", "1m")), 4)
+
+        # without a stale window the caller waits for the refresh
+        self.shared.publish("bybit", "SOL/USDT", "1m", series(3), fetched_at=time.time() - 120)
+        self.assertEqual(len(self.shared.get_or_refresh("bybit", "SOL/USDT", "1m", loader)), 4)
+
+    def test_least_recently_read_series_are_evicted(self):
+        shared = SharedCandles(self.directory.name, max_bytes=3 * (16 + 100 * 28))
+        for symbol in ("A/USDT", "B/USDT", "C/USDT"):
+            shared.get_or_refresh("bybit", symbol, "1h", lambda: series(100), max_age=60)
+        # read A, so B is the least recently read
+        os.utime(shared.path("bybit", "B/USDT", "1h"), (1, 1))
+        os.utime(shared.path("bybit", "C/USDT", "1h"), (2, 2))
+        shared.get_or_refresh("bybit", "A/USDT", "1h", lambda: series(100), max_age=60)
+
+        shared.get_or_refresh("bybit", "D/USDT", "1h", lambda: series(100), max_age=60)
+        self.assertIsNone(shared.get("bybit", "B/USDT", "1h"))
+        self.assertIsNotNone(shared.get("bybit", "A/USDT", "1h"))
+        self.assertEqual(shared.evictions, 1)
+        self.assertLessEqual(shared.stats()["bytes"], shared.max_bytes)
+        # the lock of the evicted series is kept for the processes that may be waiting on it
+        self.assertTrue(os.path.exists(shared.path("bybit", "B/USDT", "1h") + ".lock"))
+
+    def test_one_writer_across_processes(self):
+        marker = os.path.join(self.directory.name, "loads")
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=refresh_in_child, args=(self.directory.name, marker)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(10)
+            self.assertEqual(process.exitcode, 0)
+
+        with open(marker) as f:
+            self.assertEqual(f.read(), "x")
+
+
+if __name__ == "__main__":
+    unittest.main()
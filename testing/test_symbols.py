@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from config import settings
+
+if not settings.MY_POSTGRESQL_URL:
+    settings.MY_POSTGRESQL_URL = "sqlite://"
+
+from bot.aio.dispatcher import AsyncDispatcher
+from bot.aio.handlers import AsyncPriceAlertHandler
+from bot.symbols import SymbolCatalog, SymbolResolver, SymbolTrie, UnknownSymbol, normalize
+
+
+def market(base, quote, spot=True, settle=None):
+    symbol = f"{base}/{quote}" + (f":{settle}" if settle else "")
+    return {"symbol": symbol, "base": base, "quote": quote, "spot": spot, "active": True}
+
+
+def markets(*items):
+    return {item["symbol"]: item for item in items}
+
+
+BYBIT = markets(market("BTC", "USDT"), market("BTC", "USDT", spot=False, settle="USDT"), market("ETH", "USDT"),
+                market("ETH", "BTC"), market("SOL", "USDT"))
+BINANCE = markets(market("BTC", "USDT"), market("PEPE", "USDT"), market("BTC", "USDC"))
+COINS = [{"id": 1, "symbol": "BTC", "name": "Bitcoin"}, {"id": 2, "symbol": "eth", "name": "Ethereum"}]
+
+
+class FakeExchange:
+    def __init__(self, markets):
+        self.markets = markets
+
+
+class TestSymbolTrie(unittest.TestCase):
+    def test_prefix_and_fuzzy(self):
+        trie = SymbolTrie(["BTCUSDT", "BTCUSDC", "BTCUSDTPERP", "ETHUSDT", "ETHBTC"])
+        self.assertEqual(trie.with_prefix("BTCUSD"), ["BTCUSDC", "BTCUSDT", "BTCUSDTPERP"])
+        self.assertEqual(trie.with_prefix("XRP"), [])
+        self.assertEqual(trie.fuzzy("BTCUSTD", max_distance=2)[:2], ["BTCUSDC", "BTCUSDT"])
+        self.assertEqual(trie.fuzzy("ETHUSDT", max_distance=0), ["ETHUSDT"])
+        self.assertEqual(trie.fuzzy("DOGEUSDT", max_distance=1), [])
+
+
+class TestSymbolCatalog(unittest.TestCase):
+    def setUp(self):
+        self.catalog = SymbolCatalog({"bybit": BYBIT, "binance": BINANCE}, COINS)
+
+    def test_normalize(self):
+        for text in ("btcusdt", "BTC/USDT", "btc-usdt", " BTC/USDT:USDT "):
+            self.assertEqual(normalize(text), "BTCUSDT")
+
+    def test_resolve_and_listing(self):
+        self.assertEqual(self.catalog.resolve("btc/usdt"), "BTCUSDT")
+        self.assertEqual(self.catalog.resolve("btc"), "BTCUSDT")
+        self.assertEqual(self.catalog.resolve("ethbtc"), "ETHBTC")
+        self.assertIsNone(self.catalog.resolve("BTCUSTD"))
+        # the spot market wins over the perpetual
+        self.assertEqual(self.catalog.listing("BTCUSDT").markets, {"bybit": "BTC/USDT", "binance": "BTC/USDT"})
+        self.assertEqual(set(self.catalog.listing("PEPEUSDT").markets), {"binance"})
+
+    def test_coin(self):
+        self.assertEqual(self.catalog.coin("BTCUSDT")["id"], 1)
+        self.assertEqual(self.catalog.coin("eth")["id"], 2)
+        self.assertIsNone(self.catalog.coin("SOLUSDT"))
+
+    def test_suggest(self):
+        self.assertEqual(self.catalog.suggest("BTCUSTD")[:2], ["BTCUSDC", "BTCUSDT"])
+        self.assertEqual(self.catalog.suggest("BTCUSTD", exchange="bybit"), ["BTCUSDT"])
+        self.assertEqual(self.catalog.suggest("SO"), ["SOLUSDT"])
+
+
+class TestSymbolResolver(unittest.TestCase):
+    def resolver(self, exchanges):
+        factory = MagicMock(side_effect=lambda name: FakeExchange(exchanges[name]))
+        return SymbolResolver(exchanges=list(exchanges), ttl=3600, exchange_factory=factory,
+                              coins_loader=lambda: COINS), factory
+
+    def test_rejects_without_exchange_requests(self):
+        resolver, factory = self.resolver({"bybit": BYBIT, "binance": BINANCE})
+        self.assertEqual(resolver.resolve("eth/usdt"), "ETHUSDT")
+        self.assertEqual(resolver.resolve("pepe"), "PEPEUSDT")
+        with self.assertRaises(UnknownSymbol) as raised:
+            resolver.resolve("pepe", exchange="bybit")
+        self.assertEqual(raised.exception.symbol, "PEPE")
+        with self.assertRaises(UnknownSymbol) as raised:
+            resolver.resolve("etusdt")
+        self.assertIn("ETHUSDT", raised.exception.suggestions)
+        self.assertIn("Did you mean ETHUSDT", str(raised.exception))
+        # the catalog is built once
+        self.assertEqual(factory.call_count, 2)
+
+    def test_passes_input_through_without_a_catalog(self):
+        resolver, _ = self.resolver({"bybit": None})
+        self.assertEqual(resolver.resolve("btc/usdt"), "BTCUSDT")
+
+
+class TestAsyncAlertSymbols(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.executor.shutdown)
+        self.dispatcher = AsyncDispatcher(MagicMock(), MagicMock(), self.executor)
+        resolver = SymbolResolver(exchanges=["bybit", "binance"], ttl=3600, coins_loader=lambda: COINS,
+                                  exchange_factory=lambda name: FakeExchange({"bybit": BYBIT, "binance": BINANCE}[name]))
+        patcher = patch("bot.aio.handlers.resolve_symbol", resolver.resolve)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, *args):
+        context = MagicMock(args=list(args), user_id=5, reply_text=AsyncMock())
+        with patch.object(AsyncPriceAlertHandler, "save_alert") as save_alert:
+            asyncio.run(AsyncPriceAlertHandler.request_price_alert(self.dispatcher, context))
+        return save_alert, context.reply_text.await_args[0][0]
+
+    def test_stores_the_canonical_symbol(self):
+        save_alert, reply = self.request("btc/usdt", "31000")
+        save_alert.assert_called_once_with(5, "BTCUSDT", 31000)
+        self.assertIn("BTCUSDT", reply)
+
+    def test_rejects_pairs_not_on_bybit(self):
+        save_alert, reply = self.request("pepe", "1")
+        save_alert.assert_not_called()
+        self.assertIn("PEPE", reply)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+
+from bot.broker import envelope, topology
+
+
+def message(text, chat_id=42):
+    return {"update_id": 1, "message": {"text": text, "chat": {"id": chat_id}}}
+
+
+class TestTopology(unittest.TestCase):
+    def test_command_name(self):
+        self.assertEqual(topology.command_name("/chart@CryptoSentinelBot BTC 4h"), "chart")
+        self.assertEqual(topology.command_name("/HELP"), "help")
+        self.assertIsNone(topology.command_name("hello"))
+        self.assertIsNone(topology.command_name(None))
+
+    def test_lanes(self):
+        self.assertEqual(topology.lane_for(message("/help")), topology.INTERACTIVE)
+        self.assertEqual(topology.lane_for(message("a message for /contact")), topology.INTERACTIVE)
+        self.assertEqual(topology.lane_for(message("/positions")), topology.HEAVY)
+        self.assertEqual(topology.lane_for(message("/gainers")), topology.HEAVY)
+        self.assertEqual(
+            topology.lane_for({"callback_query": {"data": "subscribe_monthly_subscription", "from": {"id": 1}}}),
+            topology.PAYMENTS,
+        )
+        self.assertEqual(
+            topology.lane_for({"callback_query": {"data": "other", "from": {"id": 1}}}),
+            topology.INTERACTIVE,
+        )
+        self.assertEqual(topology.lane_for({"pre_checkout_query": {"id": "q", "from": {"id": 1}}}), topology.PAYMENTS)
+        self.assertEqual(
+            topology.lane_for({"message": {"chat": {"id": 1}, "successful_payment": {"currency": "USD"}}}),
+            topology.PAYMENTS,
+        )
+        self.assertIsNone(topology.lane_for({"update_id": 3, "my_chat_member": {}}))
+
+    def test_route(self):
+        self.assertTrue(topology.route(message("/stats BTC"), 8).startswith("telegram.heavy."))
+        self.assertEqual(
+            topology.route(message("/help", chat_id=7), 8)[len("telegram.interactive."):],
+            topology.route(message("/chart", chat_id=7), 8)[len("telegram.heavy."):],
+        )
+        self.assertIsNone(topology.route({"update_id": 3}, 8))
+
+    def test_declare(self):
+        queues = topology.declare(MagicMock(), 2)
+
+        self.assertEqual(queues[topology.PAYMENTS], ["telegram.payments.0", "telegram.payments.1"])
+        self.assertEqual(set(queues), set(topology.LANES))
+
+
+class FakeMessage:
+    def __init__(self, body, queue):
+        self.body = body
+        self.queue = queue
+
+    async def ack(self):
+        self.queue.acked.append(self.body)
+
+
+class FakeQueue:
+    def __init__(self, bodies):
+        self.bodies = list(bodies)
+        self.acked = []
+        self.deleted = None
+
+    async def get(self, no_ack=False, fail=True):
+        return FakeMessage(self.bodies.pop(0), self) if self.bodies else None
+
+    async def delete(self, if_unused=True, if_empty=True):
+        self.deleted = (if_unused, if_empty)
+
+
+class FakeChannel:
+    def __init__(self, bodies):
+        self.legacy = FakeQueue(bodies)
+        self.published = []
+        self.default_exchange = self
+
+    async def declare_queue(self, name, **kwargs):
+        return self.legacy
+
+    async def publish(self, message, routing_key, mandatory=True):
+        self.published.append((routing_key, message.body))
+
+
+class TestLegacyQueue(unittest.TestCase):
+    def test_leftover_updates_move_to_the_lane_shards(self):
+        chart = envelope.encode(message("/chart BTC"))
+        help_ = b'{"update_id": 2, "message": {"text": "/help", "chat": {"id": 42}}}'
+        unhandled = b'{"update_id": 3, "my_chat_member": {}}'
+        channel = FakeChannel([chart, help_, unhandled])
+
+        moved = asyncio.run(topology.drain_legacy_queue(channel, 4))
+
+        self.assertEqual(moved, 3)
+        self.assertEqual(
+            [routing_key.rsplit(".", 1)[0] for routing_key, _ in channel.published],
+            ["telegram.heavy", "telegram.interactive"],
+        )
+        self.assertEqual(channel.legacy.acked, [chart, help_, unhandled])
+        self.assertEqual(channel.legacy.deleted, (False, True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+
+import orjson
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.broker import webhook
+
+TOKEN = "123:abc"
+SECRET = "s3cret"
+
+UPDATE = {
+    "update_id": 77,
+    "message": {"message_id": 1, "date": 0, "text": "/help", "chat": {"id": 5, "type": "private"}},
+}
+
+
+class FakeBotApi:
+    """Local stand-in for the Bot API that delivers updates like Telegram does."""
+
+    def __init__(self):
+        self.webhook = None
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/setWebhook", self.set_webhook)
+
+    async def set_webhook(self, request):
+        if request.match_info["token"] != TOKEN:
+            return web.json_response({"ok": False, "description": "Unauthorized"}, status=401)
+        self.webhook = await request.json()
+        return web.json_response({"ok": True, "result": True})
+
+    async def deliver(self, session, update):
+        return await session.post(
+            self.webhook["url"],
+            data=orjson.dumps(update),
+            headers={webhook.SECRET_HEADER: self.webhook["secret_token"]},
+        )
+
+
+class TestWebhook(unittest.TestCase):
+    def run_with_servers(self, test, enqueue_result=True):
+        queued = []
+
+        def enqueue(update_dict):
+            queued.append(update_dict)
+            return enqueue_result
+
+        async def run():
+            bot_api = FakeBotApi()
+            async with TestServer(bot_api.app) as api_server, \
+                    TestClient(TestServer(webhook.create_app(enqueue, SECRET))) as client:
+                await test(bot_api, str(api_server.make_url("")), client)
+
+        asyncio.run(run())
+        return queued
+
+    def test_registered_webhook_receives_updates(self):
+        async def test(bot_api, api_url, client):
+            url = str(client.make_url("/telegram"))
+            await webhook.set_webhook(TOKEN, url, SECRET, base_url=api_url, allowed_updates=("message",))
+            self.assertEqual(bot_api.webhook["allowed_updates"], ["message"])
+
+            response = await bot_api.deliver(client.session, UPDATE)
+            self.assertEqual(response.status, 200)
+
+        self.assertEqual(self.run_with_servers(test), [UPDATE])
+
+    def test_wrong_secret_and_bad_bodies_are_rejected(self):
+        async def test(bot_api, api_url, client):
+            response = await client.post("/telegram", data=orjson.dumps(UPDATE), headers={webhook.SECRET_HEADER: "x"})
+            self.assertEqual(response.status, 401)
+            response = await client.post("/telegram", data=b"{", headers={webhook.SECRET_HEADER: SECRET})
+            self.assertEqual(response.status, 400)
+            response = await client.post("/telegram", data=b"[]", headers={webhook.SECRET_HEADER: SECRET})
+            self.assertEqual(response.status, 400)
+
+        self.assertEqual(self.run_with_servers(test), [])
+
+    def test_full_buffer_asks_telegram_to_retry(self):
+        async def test(bot_api, api_url, client):
+            response = await client.post("/telegram", data=orjson.dumps(UPDATE), headers={webhook.SECRET_HEADER: SECRET})
+            self.assertEqual(response.status, 503)
+
+        self.run_with_servers(test, enqueue_result=False)
+
+    def test_refused_webhook_raises(self):
+        async def test(bot_api, api_url, client):
+            with self.assertRaises(RuntimeError):
+                await webhook.set_webhook("wrong", "https://example.com", SECRET, base_url=api_url)
+
+        self.run_with_servers(test)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from bot.broker.worker_pool import ChatOrderedExecutor, ConsumerWorkerPool
+
+
+class TestChatOrderedExecutor(unittest.TestCase):
+    def test_same_chat_runs_in_order(self):
+        executor = ChatOrderedExecutor(max_workers=4)
+        seen = []
+
+        def task(i):
+            time.sleep(0.01 if i == 0 else 0)
+            seen.append(i)
+
+        for i in range(5):
+            executor.submit(42, lambda i=i: task(i))
+        executor.shutdown()
+
+        self.assertEqual(seen, [0, 1, 2, 3, 4])
+
+    def test_slow_chat_does_not_block_other_chats(self):
+        executor = ChatOrderedExecutor(max_workers=2)
+        release = threading.Event()
+        done = threading.Event()
+
+        executor.submit(1, release.wait)
+        executor.submit(2, done.set)
+
+        self.assertTrue(done.wait(timeout=1))
+        release.set()
+        executor.shutdown()
+
+
+class TestConsumerWorkerPool(unittest.TestCase):
+    def test_chat_key(self):
+        self.assertEqual(
+            ConsumerWorkerPool.chat_key({"message": {"chat": {"id": 7}}}), 7
+        )
+        self.assertEqual(
+            ConsumerWorkerPool.chat_key({"callback_query": {"from": {"id": 9}}}), 9
+        )
+        self.assertIsNone(ConsumerWorkerPool.chat_key({"update_id": 1}))
+
+    def test_ack_is_marshalled_to_connection_thread(self):
+        connection = MagicMock()
+        channel = MagicMock()
+        pool = ConsumerWorkerPool(
+            connection, channel, lambda update: None, workers=2, prefetch=5
+        )
+        channel.basic_qos.assert_called_once_with(prefetch_count=5)
+
+        method = MagicMock(delivery_tag=3)
+        pool.on_message(channel, method, None, b"", {"message": {"chat": {"id": 1}}})
+        pool.shutdown()
+
+        channel.basic_ack.assert_not_called()
+        callback = connection.add_callback_threadsafe.call_args[0][0]
+        callback()
+        channel.basic_ack.assert_called_once_with(delivery_tag=3)
+
+    def test_failed_update_is_handed_to_on_failure(self):
+        connection = MagicMock()
+        channel = MagicMock()
+        on_failure = MagicMock()
+        error = ConnectionError("down")
+
+        def process(update):
+            raise error
+
+        pool = ConsumerWorkerPool(
+            connection, channel, process, workers=1, prefetch=1, on_failure=on_failure
+        )
+        method = MagicMock(delivery_tag=1)
+        pool.on_message(channel, method, None, b"body", {})
+        pool.shutdown()
+
+        channel.basic_ack.assert_not_called()
+        connection.add_callback_threadsafe.call_args[0][0]()
+        on_failure.assert_called_once_with(channel, method, None, b"body", error)
+
+if __name__ == "__main__":
+    unittest.main()